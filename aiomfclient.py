@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+
+"""
+This module is an asyncio (standard lib only) implementation of the core mediaflux client operations
+Intended for metadata heavy work (eg many thousands of asset.set or existence checks) where thread pools don't scale
+Author: Sean Fleming
+"""
+
+import os
+import ssl
+import time
+import asyncio
+import logging
+import posixpath
+import urllib.parse
+import xml.etree.ElementTree as ET
+import metrics
+
+#------------------------------------------------------------
+class aio_mf_client():
+    """
+    asyncio Mediaflux client that shares configuration, session and XML serialisation with an mf_client instance
+    All unexpected failures are handled by raising exceptions
+    """
+    def __init__(self, client, concurrency=256, politeness=64):
+        """
+        Args:
+                 client: an mf_client instance supplying the server details and session
+            concurrency: an INTEGER giving the maximum number of operations in flight for map()
+             politeness: an INTEGER giving the maximum number of simultaneous requests to the server
+        """
+        self.client = client
+        self.concurrency = concurrency
+        self.politeness = politeness
+# created on first use, in the running event loop
+        self.semaphore = None
+        self.session_lock = None
+# idle keep-alive connections, keyed by (host, port, encrypted)
+        self.idle = {}
+        self.logging = logging.getLogger('aiomfclient')
+
+#------------------------------------------------------------
+    def run(self, coro):
+        """
+        Bridge for synchronous callers (eg parser commands) - run a coroutine to completion on a new event loop
+        """
+        async def main():
+            try:
+                return await coro
+            finally:
+                await self.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+#------------------------------------------------------------
+    async def close(self):
+        """
+        Close all idle connections (NB: connections and locks belong to the event loop that created them)
+        """
+        for key, connections in self.idle.items():
+            for reader, writer in connections:
+                writer.close()
+        self.idle = {}
+        self.semaphore = None
+        self.session_lock = None
+
+#------------------------------------------------------------
+    async def map(self, fn, items):
+        """
+        Apply the coroutine function fn to every item with no more than concurrency calls in flight
+        Returns a LIST of results (or the Exception raised) in item order
+        """
+        iterator = enumerate(items)
+        results = {}
+
+        async def worker():
+# NB: workers share the iterator, so items are only pulled as capacity becomes available
+            for index, item in iterator:
+                try:
+                    results[index] = await fn(item)
+                except Exception as e:
+                    self.logging.debug(str(e))
+                    results[index] = e
+
+        await asyncio.gather(*[worker() for i in range(self.concurrency)])
+        return [results[index] for index in range(len(results))]
+
+#------------------------------------------------------------
+    async def _connection(self, host, port, encrypted, fresh=False):
+        """
+        Acquire an idle keep-alive connection (unless fresh is True) or open a new one, returns (reader, writer, reused)
+        """
+        connections = self.idle.get((host, port, encrypted), [])
+        while fresh is False and len(connections) > 0:
+            reader, writer = connections.pop()
+            if reader.at_eof() is False and writer.is_closing() is False:
+                return reader, writer, True
+            writer.close()
+        if encrypted is True:
+            reader, writer = await asyncio.open_connection(host, port, ssl=ssl.create_default_context(), server_hostname=host)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return reader, writer, False
+
+#------------------------------------------------------------
+    @staticmethod
+    async def _response_headers(reader):
+        """
+        Read the HTTP status line and headers, returns the status code and a DICT of (lowercase) headers
+        """
+        line = await reader.readline()
+        if not line:
+            raise ConnectionResetError("Server closed connection")
+        parts = line.decode('latin-1').split(None, 2)
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, value = line.decode('latin-1').split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+        return status, headers
+
+#------------------------------------------------------------
+    @staticmethod
+    async def _response_body(reader, headers, size=65536):
+        """
+        Async generator for the response body, handling chunked, sized and read-until-close replies
+        """
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                line = await reader.readline()
+                length = int(line.split(b';')[0].strip(), 16)
+                if length == 0:
+# trailers (if any) then the terminating blank line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                yield await reader.readexactly(length)
+                await reader.readline()
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining > 0:
+                data = await reader.read(min(size, remaining))
+                if not data:
+                    raise ConnectionResetError("Incomplete reply")
+                remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await reader.read(size)
+                if not data:
+                    return
+                yield data
+
+#------------------------------------------------------------
+    async def _request(self, url, method, path, headers, body=None, sink=None):
+        """
+        Primitive for a single HTTP exchange on a pooled connection
+        body may be bytes or an async iterator of bytes (Content-Length must then be supplied) and sink an optional coroutine function for each chunk of the reply
+        Returns the status code and the reply (empty if a sink was used)
+        """
+        host = url.hostname
+        encrypted = (url.scheme == 'https')
+        port = url.port
+        if port is None:
+            port = 443 if encrypted else 80
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.politeness)
+        async with self.semaphore:
+            fresh = False
+            while True:
+                reader, writer, reused = await self._connection(host, port, encrypted, fresh=fresh)
+                try:
+                    lines = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % url.netloc, "Connection: keep-alive"]
+                    if isinstance(body, bytes):
+                        headers['Content-Length'] = str(len(body))
+                    for key, value in headers.items():
+                        lines.append("%s: %s" % (key, value))
+                    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+                    if isinstance(body, bytes):
+                        writer.write(body)
+                    elif body is not None:
+                        async for chunk in body:
+                            writer.write(chunk)
+                            await writer.drain()
+                    await writer.drain()
+                    status, reply_headers = await self._response_headers(reader)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+# stale keep-alive socket - try once more with a new connection (only possible if the body can be resent)
+                    if reused is True and isinstance(body, (bytes, type(None))):
+                        self.logging.debug("Reconnecting stale connection: %s" % str(e))
+                        fresh = True
+                        continue
+                    raise
+                except Exception:
+                    writer.close()
+                    raise
+                break
+
+            try:
+                reply = []
+                async for data in self._response_body(reader, reply_headers):
+                    if sink is not None:
+                        await sink(data)
+                    else:
+                        reply.append(data)
+            except Exception:
+# never return a connection in an unknown state to the pool
+                writer.close()
+                raise
+
+# only keep the connection if the reply was delimited and the server didn't ask to close it
+            delimited = 'content-length' in reply_headers or 'transfer-encoding' in reply_headers
+            if delimited and reply_headers.get('connection', '').lower() != 'close':
+                self.idle.setdefault((host, port, encrypted), []).append((reader, writer))
+            else:
+                writer.close()
+
+        return status, b''.join(reply)
+
+#------------------------------------------------------------
+    async def _post(self, xml_bytes, service="request"):
+        """
+        Primitive for sending an XML message to the Mediaflux server, returns the reply element or raises the server error
+        """
+        url = urllib.parse.urlparse(self.client.post_url)
+        headers = {'Content-Type': 'text/xml', 'charset': 'utf-8'}
+        start_time = time.perf_counter()
+        try:
+            status, xml = await self._request(url, 'POST', url.path, headers, body=xml_bytes)
+        except Exception:
+            metrics.registry.record(service, time.perf_counter() - start_time, bytes_out=len(xml_bytes), error=True)
+            raise
+        reply = None
+        if status == 200:
+            tree = ET.fromstring(xml.decode())
+            reply = self.client._batch_replies(tree, 1)[0]
+        metrics.registry.record(service, time.perf_counter() - start_time, bytes_in=len(xml), bytes_out=len(xml_bytes), error=(reply is None or isinstance(reply, Exception)))
+        if status != 200:
+            raise Exception("HTTP Error %d" % status)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+#------------------------------------------------------------
+    async def _session_restore(self, session):
+        """
+        Primitive for regenerating an expired session using the delegate token (once, however many calls noticed the expiry)
+        """
+        if self.session_lock is None:
+            self.session_lock = asyncio.Lock()
+        async with self.session_lock:
+            if self.client.session != session:
+                return
+            self.logging.info("Attempting to restore session with token")
+            reply = await self.call("system.logon", token=self.client.token)
+            self.client.session = reply.find(".//session").text
+
+#------------------------------------------------------------
+    async def call(self, service_call, **args):
+        """
+        Structured service call (see mf_client.call) - returns the XML reply
+
+        Raises:
+            An error if the call failed
+        """
+        session = self.client.session
+        try:
+            return await self._post(self.client.call(service_call, post=False, **args), service=service_call)
+        except Exception as e:
+# only retry (once) if the session was invalid and we have a token
+            if "session is not valid" not in str(e) or len(self.client.token) == 0:
+                raise
+        metrics.registry.add(service_call, retries=1)
+        await self._session_restore(session)
+        return await self._post(self.client.call(service_call, post=False, **args), service=service_call)
+
+#------------------------------------------------------------
+    async def login(self, user=None, password=None, domain=None, token=None):
+        """
+        Authenticate to the server and record the session (in the shared mf_client) on success
+        """
+        if domain is None:
+            domain = self.client.domain
+        if user is not None:
+            reply = await self.call("system.logon", domain=domain, user=user, password=password)
+        elif token is not None and len(token) > 0:
+            reply = await self.call("system.logon", token=token)
+            self.client.token = token
+        else:
+            raise Exception("No credentials supplied")
+        elem = reply.find(".//session")
+        if elem is None:
+            raise Exception("Invalid login call")
+        self.client.session = elem.text
+        self.client.status = "authenticated"
+
+#------------------------------------------------------------
+    async def query_iter(self, size=1000, **args):
+        """
+        Async generator for asset.query results (eg action="get-path" or "get-values") fetched via a server side iterator
+        """
+        reply = await self.call("asset.query", as_="iterator", **args)
+        iterator = reply.find(".//iterator").text
+        complete = False
+        while complete is False:
+            reply = await self.call("asset.query.iterate", id=iterator, size=size)
+            result = reply.find("result")
+            if result is None:
+                return
+            for elem in result:
+                if elem.tag == "iterated":
+                    complete = 'true' in elem.attrib.get('complete', 'true')
+                else:
+                    yield elem
+
+#------------------------------------------------------------
+    async def get(self, remote_filepath, local_filepath=None):
+        """
+        Download a remote (online) file, returns the number of bytes written
+        """
+        if local_filepath is None:
+            local_filepath = os.path.join(os.getcwd(), posixpath.basename(remote_filepath))
+        reply = await self.call("asset.content.status", id="path=%s" % remote_filepath)
+        elem = reply.find(".//asset")
+        state = reply.find(".//asset/state")
+        if elem is None or state is None or 'online' not in state.text:
+            raise Exception("Content not online: %s" % remote_filepath)
+        asset_id = elem.attrib['id']
+
+        local_parent = os.path.dirname(local_filepath)
+        if os.path.exists(local_parent) is False:
+            os.makedirs(local_parent, exist_ok=True)
+
+        url = urllib.parse.urlparse(self.client.data_get)
+        path = "%s?_skey=%s&id=%s" % (url.path, self.client.session, asset_id)
+        loop = asyncio.get_running_loop()
+        with open(local_filepath, 'wb') as output:
+# NB: file IO happens in the default executor, so it doesn't stall the event loop
+            async def sink(data):
+                await loop.run_in_executor(None, output.write, data)
+            status, reply = await self._request(url, 'GET', path, {}, sink=sink)
+        if status != 200:
+            raise Exception("HTTP Error %d: %s" % (status, remote_filepath))
+        return os.path.getsize(local_filepath)
+
+#------------------------------------------------------------
+    async def put(self, namespace, filepath, overwrite=True):
+        """
+        Create (or update) an asset in namespace with the content of a local file
+        Returns the asset ID or -1 if the file was skipped
+        """
+        filename = os.path.basename(filepath)
+        remotepath = posixpath.join(namespace, filename)
+        xpath = [{'@ename':'id', '#text':'id'}, {'@ename':'size', '#text':'content/size'}]
+        reply = await self.call("asset.get", id={'@only-if-exists':True, '#text':"path=%s" % remotepath}, xpath=xpath)
+        elem = reply.find(".//id")
+        if elem is None:
+            xml_string = self.client.call("asset.create", namespace={'@create':True, '#text':namespace}, name=filename, post=False).decode()
+        else:
+            if overwrite is False:
+                return -1
+            size = reply.find(".//size")
+            if size is not None and size.text is not None and int(size.text) == os.path.getsize(filepath):
+                return -1
+            xml_string = self.client.call("asset.set", id=int(elem.text), post=False).decode()
+
+# same multipart layout as mf_client._post_multipart_buffered()
+        boundary = os.urandom(15).hex()
+        lines = []
+        lines.extend(('--%s' % boundary, 'Content-Disposition: form-data; name="request"', '', xml_string,))
+        lines.extend(('--%s' % boundary, 'Content-Disposition: form-data; name="nb-data-attachments"', '', "1",))
+        lines.extend(('--%s' % boundary, 'Content-Disposition: form-data; name="filename"; filename="%s"' % filename, 'Content-Type: application/octet-stream', '', ''))
+        head = '\r\n'.join(lines).encode()
+        tail = ("\r\n--%s--\r\n" % boundary).encode()
+        total_size = len(head) + os.path.getsize(filepath) + len(tail)
+        buffer_size = self.client.put_buffer
+        loop = asyncio.get_running_loop()
+
+        async def body():
+            yield head
+            with open(filepath, 'rb') as infile:
+                while True:
+# NB: file IO happens in the default executor, so it doesn't stall the event loop
+                    chunk = await loop.run_in_executor(None, infile.read, buffer_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield tail
+
+        scheme = 'https' if self.client.encrypted_data else 'http'
+        url = urllib.parse.urlparse("%s://%s/__mflux_svc__" % (scheme, self.client.data_put))
+        headers = {'Cache-Control': 'no-cache', 'Content-Length': str(total_size), 'Content-Type': 'multipart/form-data; boundary=%s' % boundary, 'Content-Transfer-Encoding': 'binary'}
+        status, reply = await self._request(url, 'POST', url.path, headers, body=body())
+        if status != 200:
+            raise Exception("HTTP Error %d: %s" % (status, filepath))
+        tree = ET.fromstring(reply)
+        message = "response did not contain an asset ID."
+        for elem in tree.iter():
+            if elem.tag == 'id':
+                return int(elem.text)
+            if elem.tag == 'message':
+                message = elem.text
+        raise Exception(message)
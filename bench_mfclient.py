@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+"""
+Serverless microbenchmark of the per call request serialisation cost
+aterm_run() (shlex lexing + ElementTree) versus call() (direct XML from cached templates)
+"""
+
+import timeit
+import logging
+import mfclient
+
+# representative internal calls as (aterm syntax, service, structured arguments)
+calls = [
+    ('asset.get :id -only-if-exists true "path=/projects/Data Team/file.dat" :xpath -ename id id :xpath -ename crc32 content/csum :xpath -ename size content/size',
+     'asset.get', {'id':{'@only-if-exists':True, '#text':'path=/projects/Data Team/file.dat'}, 'xpath':[{'@ename':'id', '#text':'id'}, {'@ename':'crc32', '#text':'content/csum'}, {'@ename':'size', '#text':'content/size'}]}),
+    ('asset.query :where "namespace=\'/projects/Data Team\'" :as iterator :action get-path',
+     'asset.query', {'where':"namespace='/projects/Data Team'", 'as_':'iterator', 'action':'get-path'}),
+    ('asset.query.iterate :id 1234 :size 100',
+     'asset.query.iterate', {'id':1234, 'size':100}),
+    ('asset.content.status :id 1 :id 2 :id 3 :id 4 :id 5 :id 6 :id 7 :id 8',
+     'asset.content.status', {'id':[1, 2, 3, 4, 5, 6, 7, 8]}),
+]
+
+#------------------------------------------------------------
+def main():
+# debug logging would add the cloaking cost to aterm_run() only
+    logging.basicConfig(level=logging.ERROR)
+    client = mfclient.mf_client("http", "80", None)
+    count = 20000
+
+    print("%-24s %14s %14s %8s" % ("service", "aterm_run (us)", "call (us)", "speedup"))
+    for line, service, args in calls:
+        before = timeit.timeit(lambda: client.aterm_run(line, post=False), number=count) / count * 1e6
+        after = timeit.timeit(lambda: client.call(service, post=False, **args), number=count) / count * 1e6
+        print("%-24s %14.2f %14.2f %7.1fx" % (service, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""
+This module is a local (SQLite) record of completed transfers, used by the pshell sync command to skip files that have not changed
+Author: Sean Fleming
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import posixpath
+import threading
+
+#------------------------------------------------------------
+class transfer_manifest():
+    """
+    Manifest of completed transfers between a local tree and a remote destination
+    Records (local path, remote path, size, mtime, crc32, asset id) - writes are buffered and committed in batches
+    The remote folder of each record is indexed, so one folder's records are found without a full table scan
+    """
+# pending writes before a commit
+    batch_size = 1000
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+# records not yet written (keyed by local, remote path) and writes not yet committed
+        self.pending = {}
+        self.changes = 0
+        folder = os.path.dirname(filepath)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+# NB: records are added from the transfer threads, all access is serialised by the lock
+        self.db = sqlite3.connect(filepath, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS transfers (local TEXT, remote TEXT, size INTEGER, mtime REAL, crc32 INTEGER, asset_id TEXT, time REAL, folder TEXT, PRIMARY KEY (local, remote))")
+# manifests written before the folder column was added
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(transfers)")]
+        if 'folder' not in columns:
+            self.db.execute("ALTER TABLE transfers ADD COLUMN folder TEXT")
+            rows = self.db.execute("SELECT local, remote FROM transfers").fetchall()
+            self.db.executemany("UPDATE transfers SET folder=? WHERE local=? AND remote=?", [(posixpath.dirname(remote), local, remote) for local, remote in rows])
+        self.db.execute("CREATE INDEX IF NOT EXISTS transfers_folder ON transfers (folder)")
+        self.db.commit()
+
+#------------------------------------------------------------
+    @classmethod
+    def open(cls, remote, destination, folder=None):
+        """
+        Open (or create) the manifest for a remote (endpoint description) and destination folder
+        """
+        if folder is None:
+            folder = os.path.join(os.path.expanduser("~"), ".pshell_sync")
+        key = "%s|%s|%s" % (remote.get('type'), remote.get('url', remote.get('server')), destination)
+        return cls(os.path.join(folder, hashlib.sha1(key.encode()).hexdigest() + ".db"))
+
+#------------------------------------------------------------
+    def lookup(self, local, remote):
+        """
+        Return the recorded (size, mtime, crc32, asset_id) of a transfer or None
+        """
+# NB: called for every scanned file, so no writes or commits (pending records are checked in memory)
+        with self.lock:
+            row = self.pending.get((local, remote))
+            if row is not None:
+                return row[2:6]
+            return self.db.execute("SELECT size, mtime, crc32, asset_id FROM transfers WHERE local=? AND remote=?", (local, remote)).fetchone()
+
+#------------------------------------------------------------
+    def unchanged(self, local, remote, size, mtime):
+        """
+        True if the local file has the same size and modification time as when it was last transferred
+        """
+        row = self.lookup(local, remote)
+        return row is not None and row[0] == size and row[1] == mtime
+
+#------------------------------------------------------------
+    def record(self, local, remote, size, mtime, crc32=None, asset_id=None):
+        """
+        Add or replace the record of a completed transfer
+        """
+        with self.lock:
+            self.pending[(local, remote)] = (local, remote, size, mtime, crc32, asset_id, time.time(), posixpath.dirname(remote))
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+
+#------------------------------------------------------------
+    def _write(self):
+        """
+        Write (but don't commit) the pending records, NB: caller must hold the lock
+        """
+        if len(self.pending) > 0:
+            self.db.executemany("INSERT OR REPLACE INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?, ?)", list(self.pending.values()))
+            self.changes += len(self.pending)
+            self.pending = {}
+
+#------------------------------------------------------------
+    def _flush(self):
+        """
+        Write and commit the pending records, NB: caller must hold the lock
+        """
+        self._write()
+        if self.changes > 0:
+            self.db.commit()
+            self.changes = 0
+
+#------------------------------------------------------------
+    def remotes(self, prefix):
+        """
+        Return a LIST of (local, remote, size) for the records of remote paths in a folder (not recursive)
+        """
+        with self.lock:
+            self._write()
+            return self.db.execute("SELECT local, remote, size FROM transfers WHERE folder=?", (prefix.rstrip('/') or '/',)).fetchall()
+
+#------------------------------------------------------------
+    def update(self, local, remote, crc32, asset_id):
+        """
+        Set the server's checksum and asset ID for a record
+        """
+        with self.lock:
+            self._write()
+            self.db.execute("UPDATE transfers SET crc32=?, asset_id=? WHERE local=? AND remote=?", (crc32, asset_id, local, remote))
+            self.changes += 1
+            if self.changes >= self.batch_size:
+                self._flush()
+
+#------------------------------------------------------------
+    def forget(self, local, remote):
+        """
+        Remove the record of a transfer (eg it is no longer on the server), so the next sync sends it again
+        """
+        with self.lock:
+            self._write()
+            self.db.execute("DELETE FROM transfers WHERE local=? AND remote=?", (local, remote))
+            self.changes += 1
+            if self.changes >= self.batch_size:
+                self._flush()
+
+#------------------------------------------------------------
+    def count(self):
+        with self.lock:
+            self._write()
+            return self.db.execute("SELECT COUNT(*) FROM transfers").fetchone()[0]
+
+#------------------------------------------------------------
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.db.close()
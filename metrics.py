@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+"""
+This module is a low overhead, thread safe registry of per operation metrics shared by the pshell clients
+It also provides an (optional) recorder for a Chrome Trace Event timeline of the session
+Author: Sean Fleming
+"""
+
+import os
+import time
+import json
+import bisect
+import threading
+import contextlib
+
+#------------------------------------------------------------
+class metrics_registry():
+    """
+    Per operation (eg mediaflux service or s3 API call) counts, latency histogram, bytes in/out, retries and errors
+    """
+# latency histogram bucket upper bounds (seconds) - there is one extra bucket for anything slower
+    buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.settings = {}
+        self.reset()
+
+#------------------------------------------------------------
+    def reset(self):
+        """
+        Discard everything recorded so far
+        """
+        with self.lock:
+            self.start_time = time.time()
+            self.operations = {}
+
+#------------------------------------------------------------
+    def _entry(self, name):
+        """
+        Get (or create) the entry for an operation, NB: caller must hold the lock
+        """
+        entry = self.operations.get(name)
+        if entry is None:
+            entry = {'count': 0, 'errors': 0, 'retries': 0, 'bytes_in': 0, 'bytes_out': 0, 'time': 0.0, 'max': 0.0, 'histogram': [0] * (len(self.buckets) + 1)}
+            self.operations[name] = entry
+        return entry
+
+#------------------------------------------------------------
+    def record(self, name, elapsed, bytes_in=0, bytes_out=0, error=False, retries=0, category="call"):
+        """
+        Record a completed call of an operation, elapsed is in seconds (measured with time.perf_counter)
+        """
+        if tracer.enabled is True:
+            end = time.perf_counter()
+            tracer.complete(name, category, end - elapsed, end, args={'bytes_in': bytes_in, 'bytes_out': bytes_out, 'error': error, 'retries': retries})
+        index = bisect.bisect_left(self.buckets, elapsed)
+        with self.lock:
+            entry = self._entry(name)
+            entry['count'] += 1
+            entry['time'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['histogram'][index] += 1
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+            entry['retries'] += retries
+            if error is True:
+                entry['errors'] += 1
+
+#------------------------------------------------------------
+    def add(self, name, retries=0, errors=0, bytes_in=0, bytes_out=0):
+        """
+        Record events that are not a complete call, eg a retry inside a call
+        """
+        with self.lock:
+            entry = self._entry(name)
+            entry['retries'] += retries
+            entry['errors'] += errors
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+
+#------------------------------------------------------------
+    def setting(self, name, value):
+        """
+        Report the current value of a tuned or pinned setting (eg a transfer buffer size), NB: kept across resets
+        """
+        with self.lock:
+            self.settings[name] = value
+
+#------------------------------------------------------------
+    def quantile(self, entry, q):
+        """
+        Estimate a latency quantile (seconds) from the histogram as the upper bound of the bucket it falls in
+        """
+        target = q * entry['count']
+        total = 0
+        for index, count in enumerate(entry['histogram']):
+            total += count
+            if count > 0 and total >= target:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], entry['max'])
+                return entry['max']
+        return 0.0
+
+#------------------------------------------------------------
+    def snapshot(self):
+        """
+        Return a (JSON serialisable) DICT copy of the current metrics
+        """
+        with self.lock:
+            operations = {}
+            for name, entry in self.operations.items():
+                item = dict(entry)
+                item['histogram'] = list(entry['histogram'])
+                operations[name] = item
+            start_time = self.start_time
+            settings = dict(self.settings)
+
+        for name, item in operations.items():
+            item['mean'] = item['time'] / item['count'] if item['count'] > 0 else 0.0
+            item['p50'] = self.quantile(item, 0.5)
+            item['p95'] = self.quantile(item, 0.95)
+        return {'start': start_time, 'elapsed': time.time() - start_time, 'buckets': self.buckets, 'operations': operations, 'settings': settings}
+
+#------------------------------------------------------------
+    @staticmethod
+    def human_size(nbytes):
+        """
+        Compact human readable byte count
+        """
+        for suffix in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if nbytes < 1000:
+                break
+            nbytes /= 1000.0
+        return ("%.1f" % nbytes).rstrip('0').rstrip('.') + suffix
+
+#------------------------------------------------------------
+    def report(self):
+        """
+        Return a LIST of lines tabulating the current metrics, slowest total time first
+        """
+        snapshot = self.snapshot()
+        lines = ["%-40s %7s %6s %7s %9s %9s %9s %9s %9s %9s" % ("operation", "calls", "errors", "retries", "mean ms", "p50 ms", "p95 ms", "max ms", "in", "out")]
+        for name, item in sorted(snapshot['operations'].items(), key=lambda kv: kv[1]['time'], reverse=True):
+            lines.append("%-40s %7d %6d %7d %9.1f %9.1f %9.1f %9.1f %9s %9s" % (name[:40], item['count'], item['errors'], item['retries'], 1000 * item['mean'], 1000 * item['p50'], 1000 * item['p95'], 1000 * item['max'], self.human_size(item['bytes_in']), self.human_size(item['bytes_out'])))
+        for name, value in sorted(snapshot['settings'].items()):
+            lines.append("%s: %s" % (name, value))
+        lines.append("elapsed: %.1fs" % snapshot['elapsed'])
+        return lines
+
+#------------------------------------------------------------
+class transfer_tuner():
+    """
+    Chooses a transfer buffer size from throughput measurements - the best measured size is used, after its (power of 2) neighbours have been tried
+    A pinned size is never changed
+    """
+# minimum seconds of data before a size's throughput is trusted
+    sample_time = 0.5
+
+    def __init__(self, name, size=1048576, minimum=65536, maximum=8388608):
+        self.name = name
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.pinned = False
+        self.samples = {}
+        self.lock = threading.Lock()
+        registry.setting(self.name, self.size)
+
+#------------------------------------------------------------
+    def pin(self, size):
+        """
+        Fix the buffer size (eg from the endpoint config)
+        """
+        with self.lock:
+            self.size = int(size)
+            self.pinned = True
+        registry.setting(self.name, "%d (pinned)" % self.size)
+
+#------------------------------------------------------------
+    def observe(self, size, nbytes, elapsed):
+        """
+        Add a measurement of nbytes moved in elapsed seconds using a buffer size, returns the size to use next
+        """
+        if self.pinned is True or elapsed <= 0:
+            return self.size
+        with self.lock:
+            total_bytes, total_time = self.samples.get(size, (0, 0.0))
+            self.samples[size] = (total_bytes + nbytes, total_time + elapsed)
+            rates = {}
+            for item, (total_bytes, total_time) in self.samples.items():
+                if total_time >= self.sample_time:
+                    rates[item] = total_bytes / total_time
+            choice = self.size
+            if size not in rates:
+# keep measuring the current size
+                choice = size
+            elif len(rates) > 0:
+                best = max(rates, key=rates.get)
+                choice = best
+# explore any untried neighbours of the best size
+                for neighbour in (2 * best, best // 2):
+                    if self.minimum <= neighbour <= self.maximum and neighbour not in rates:
+                        choice = neighbour
+                        break
+            changed = (choice != self.size)
+            self.size = choice
+        if changed is True:
+            registry.setting(self.name, choice)
+        return choice
+
+#------------------------------------------------------------
+    def stream(self, window=0.25, duration=5.0):
+        """
+        Create a per-stream tracker, which measures throughput in windows during the first seconds of a transfer
+        """
+        return transfer_stream(self, window=window, duration=duration)
+
+#------------------------------------------------------------
+class transfer_stream():
+    """
+    Throughput tracker for a single transfer, size is the buffer size the transfer should currently use
+    """
+    def __init__(self, tuner, window=0.25, duration=5.0):
+        self.tuner = tuner
+        self.size = tuner.size
+        self.window = window
+        self.start = time.monotonic()
+        self.end = self.start + duration
+        self.window_start = self.start
+        self.window_bytes = 0
+        self.tuning = (tuner.pinned is False)
+
+#------------------------------------------------------------
+    def update(self, nbytes):
+        """
+        Account for nbytes transferred, which may change the buffer size
+        """
+        if self.tuning is False:
+            return
+        self.window_bytes += nbytes
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.size = self.tuner.observe(self.size, self.window_bytes, now - self.window_start)
+            self.window_start = now
+            self.window_bytes = 0
+            if now >= self.end:
+                self.tuning = False
+
+#------------------------------------------------------------
+class trace_recorder():
+    """
+    Collects spans (per thread) as Chrome Trace Event JSON, which can be loaded into chrome://tracing or Perfetto
+    Does nothing until started
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = {}
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+#------------------------------------------------------------
+    def start(self):
+        """
+        Begin recording a new timeline
+        """
+        with self.lock:
+            self.events = []
+            self.threads = {}
+            self.origin = time.perf_counter()
+            self.enabled = True
+
+#------------------------------------------------------------
+    def complete(self, name, category, start, end=None, args=None):
+        """
+        Add a span for the current thread, start and end are time.perf_counter() values
+        """
+        if self.enabled is False:
+            return
+        if end is None:
+            end = time.perf_counter()
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6, 'pid': self.pid, 'tid': thread.ident}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+
+#------------------------------------------------------------
+    @contextlib.contextmanager
+    def span(self, name, category="pshell", **args):
+        """
+        Context manager that records the enclosed code as a span
+        """
+        if self.enabled is False:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, args=args)
+
+#------------------------------------------------------------
+    def save(self, filepath):
+        """
+        Write the timeline recorded so far as Chrome Trace Event JSON
+        """
+        with self.lock:
+            events = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'pshell'}}]
+            for tid, name in self.threads.items():
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}})
+            events.extend(self.events)
+        with open(filepath, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+# registry and trace recorder shared by all clients in this process
+registry = metrics_registry()
+tracer = trace_recorder()
@@ -11,12 +11,17 @@ import sys
 import ssl
 import math
 import time
+import select
 import zlib
+import json
 import shlex
 import random
 import string
+import tarfile
 import getpass
+import hashlib
 import logging
+import itertools
 import datetime
 import platform
 import posixpath
@@ -26,6 +31,404 @@ import configparser
 import xml.etree.ElementTree as ET
 import urllib.request, urllib.error, urllib.parse
 from pathlib import PurePath
+import metrics
+
+#------------------------------------------------------------
+class mf_https_connection(http.client.HTTPSConnection):
+    """
+    HTTPS connection that resumes the TLS session cached by its pool, to avoid a full handshake on every new connection
+    """
+    def __init__(self, host, pool=None, **kwargs):
+        super().__init__(host, **kwargs)
+        self.pool = pool
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        session = None
+        if self.pool is not None:
+            session = self.pool.tls_session
+        try:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host, session=session)
+        except ssl.SSLError:
+# eg server refused to resume - fallback to a full handshake
+            if session is None:
+                raise
+            logging.getLogger('mfclient').debug("TLS session resume failed")
+            http.client.HTTPConnection.connect(self)
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host)
+
+#------------------------------------------------------------
+class mf_connection_pool():
+    """
+    Thread safe pool of persistent (keep-alive) HTTP/HTTPS connections to a single host
+    Each worker thread checks out a connection for one request/reply exchange and returns it once the reply has been fully read
+    """
+# pools shared by all clients and threads, keyed by (host, encrypted)
+    shared_pools = {}
+    shared_lock = threading.Lock()
+
+    def __init__(self, host, encrypted=True, size=16, idle_timeout=60, timeout=120):
+        self.host = host
+        self.encrypted = encrypted
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.tls_session = None
+# usage counters
+        self.opened = 0
+        self.reused = 0
+        self.logging = logging.getLogger('mfclient')
+
+#------------------------------------------------------------
+    @classmethod
+    def shared(cls, host, encrypted=True, timeout=120):
+        """
+        Return the pool shared across all clients for a given host and encryption setting
+        """
+        key = (host, encrypted)
+        with cls.shared_lock:
+            pool = cls.shared_pools.get(key)
+            if pool is None:
+                pool = cls(host, encrypted=encrypted, timeout=timeout)
+                cls.shared_pools[key] = pool
+        return pool
+
+#------------------------------------------------------------
+    def _connection_new(self):
+        """
+        Create a new (not yet connected) connection object
+        """
+        with self.lock:
+            self.opened += 1
+        if self.encrypted is True:
+            return mf_https_connection(self.host, pool=self, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+#------------------------------------------------------------
+    @staticmethod
+    def _connection_dropped(conn):
+        """
+        Check if the server has closed an idle connection (readable socket with no request pending => EOF)
+        """
+        if conn.sock is None:
+            return False
+        try:
+            readable, writable, failed = select.select([conn.sock], [], [], 0)
+        except Exception:
+            return True
+        return len(readable) > 0
+
+#------------------------------------------------------------
+    def acquire(self, fresh=False):
+        """
+        Check out a connection, returns a tuple of the connection and a BOOLEAN indicating it was reused
+        """
+        now = time.time()
+        with self.lock:
+            while len(self.idle) > 0:
+                conn, last_used = self.idle.pop()
+# discard connections that have been idle too long or were closed by the server
+                if fresh is False and now - last_used < self.idle_timeout and not self._connection_dropped(conn):
+                    self.reused += 1
+                    return conn, True
+                conn.close()
+        return self._connection_new(), False
+
+#------------------------------------------------------------
+    def release(self, conn, reusable=True):
+        """
+        Return a connection to the pool, or close it if it can't be reused or the pool is full
+        """
+        if reusable is True:
+            with self.lock:
+# NB: TLS 1.3 session tickets only arrive after the handshake, so capture the session once a reply has been read
+                session = getattr(conn.sock, 'session', None)
+                if session is not None:
+                    self.tls_session = session
+                if len(self.idle) < self.size:
+                    self.idle.append((conn, time.time()))
+                    return
+        conn.close()
+
+#------------------------------------------------------------
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            for conn, last_used in self.idle:
+                conn.close()
+            self.idle = []
+
+#------------------------------------------------------------
+class mf_progress():
+    """
+    Rate limited wrapper for a transfer progress callback - byte counts are accumulated and reported at most once per interval
+    """
+    def __init__(self, callback, interval=0.25):
+        self.callback = callback
+        self.interval = interval
+        self.pending = 0
+        self.last = time.monotonic()
+
+    def update(self, nbytes):
+        if self.callback is None:
+            return
+        self.pending += nbytes
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.callback(self.pending)
+            self.pending = 0
+            self.last = now
+
+    def flush(self):
+        if self.callback is not None and self.pending > 0:
+            self.callback(self.pending)
+            self.pending = 0
+
+#------------------------------------------------------------
+class mf_batch():
+    """
+    Collection of aterm style service calls that are sent to the server as one request
+    Used as a context manager, the calls are sent on exit and the per-call results are then available in call order
+    """
+    def __init__(self, client):
+        self.client = client
+        self.services = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        return False
+
+#------------------------------------------------------------
+    def add(self, line):
+        """
+        Queue an aterm style service call and return the index of its result
+        NB: background (&) and :out calls are not supported
+        """
+        xml_text = self.client.aterm_run(line, post=False)
+        self.services.append(ET.fromstring(xml_text).find("service"))
+        return len(self.services) - 1
+
+#------------------------------------------------------------
+    def call(self, service_call, **args):
+        """
+        Queue a structured service call (see mf_client.call) and return the index of its result
+        """
+        xml_text = self.client.call(service_call, post=False, **args)
+        self.services.append(ET.fromstring(xml_text).find("service"))
+        return len(self.services) - 1
+
+#------------------------------------------------------------
+    def execute(self):
+        """
+        Send all queued calls, returns a LIST containing the reply XML or an Exception for each call
+        """
+        if len(self.services) > 0:
+            self.results = self.client._post_batch(self.services)
+        else:
+            self.results = []
+        return self.results
+
+#------------------------------------------------------------
+    def execute_iter(self, tags, parent=None):
+        """
+        Streaming version of execute() that yields (call index, element) for reply elements with a tag in tags as they are parsed
+        Failed calls yield (call index, Exception) instead
+        """
+        if isinstance(tags, str):
+            tags = (tags,)
+        if len(self.services) > 0:
+            yield from self.client._post_batch_iter(self.services, tags, parent=parent)
+
+#------------------------------------------------------------
+    def result(self, index):
+        """
+        Return the reply XML for a call, or raise the error it generated
+        """
+        item = self.results[index]
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+#------------------------------------------------------------
+class mf_asset():
+    """
+    Compact record of an asset's content, as yielded by get_iter() - get() accepts it in place of a path to avoid looking the asset up again
+    Also returned by put() for the asset it uploaded
+    """
+    def __init__(self, asset_id, path, size=None, csum=None, state=None, store=None, url=None):
+        self.id = asset_id
+        self.path = path
+        self.size = int(size) if size else 0
+        self.csum = csum
+        self.state = state
+        self.store = store
+        self.url = url
+
+    def __str__(self):
+        return self.path
+
+    def ready(self):
+        """
+        True if the content is online (or reachable, for externally referenced content)
+        """
+        if self.state is None or 'unreachable' in self.state:
+            return False
+        return 'online' in self.state or 'reachable' in self.state
+
+#------------------------------------------------------------
+class mf_job():
+    """
+    Handle for a service call running in the background on the server
+    The state is updated by the client's poller thread, call result() to wait for the reply
+    """
+    def __init__(self, client, job_id, service_call, show_progress=False):
+        self.client = client
+        self.id = job_id
+        self.service_call = service_call
+        self.show_progress = show_progress
+        self.state = "unknown"
+        self.description = None
+        self.reply = None
+        self.error = None
+        self.event = threading.Event()
+        self.start_time = time.perf_counter()
+
+    def done(self):
+        return self.event.is_set()
+
+    def _finish(self, reply=None, error=None):
+        self.reply = reply
+        self.error = error
+        metrics.registry.record("%s [background]" % self.service_call, time.perf_counter() - self.start_time, error=(error is not None), category="background")
+        self.event.set()
+
+#------------------------------------------------------------
+    def result(self, timeout=None):
+        """
+        Wait for the job to finish and return the XML results, or raise the error it generated
+        """
+        if self.event.wait(timeout) is False:
+            raise Exception("Timed out waiting for task id=%s" % self.id)
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+#------------------------------------------------------------
+class mf_job_poller():
+    """
+    Single thread that polls the state of all outstanding background jobs for a client
+    Each round is one request (with a describe call per job), the interval starts small and backs off while nothing completes
+    """
+    interval_min = 0.01
+    interval_max = 5.0
+
+    def __init__(self, client):
+        self.client = client
+        self.jobs = set()
+        self.interval = self.interval_min
+        self.condition = threading.Condition()
+        self.thread = None
+
+#------------------------------------------------------------
+    def submit(self, job):
+        """
+        Add a job to be polled, starting the polling thread if required
+        """
+        with self.condition:
+            self.jobs.add(job)
+            self.interval = self.interval_min
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+#------------------------------------------------------------
+    def _run(self):
+        while True:
+            with self.condition:
+                if len(self.jobs) == 0:
+                    self.thread = None
+                    return
+                self.condition.wait(self.interval)
+                jobs = list(self.jobs)
+                interval = self.interval
+            finished = self._poll(jobs)
+            with self.condition:
+                for job in finished:
+                    self.jobs.discard(job)
+# only back off if this round was quiet and no new job arrived in the meantime
+                if len(finished) == 0 and self.interval == interval:
+                    self.interval = min(2 * interval, self.interval_max)
+
+#------------------------------------------------------------
+    def _poll(self, jobs):
+        """
+        Describe all the jobs in a single request, fetch results for completed ones and return the LIST of jobs that are finished
+        """
+        try:
+            services = [ET.fromstring(self.client.call("service.background.describe", id=job.id, post=False)).find("service") for job in jobs]
+            replies = self.client._post_batch(services)
+        except Exception as e:
+            self.client.logging.error(str(e))
+            for job in jobs:
+                job._finish(error=Exception("task id=%s, polling error: %s" % (job.id, str(e))))
+            return jobs
+
+        finished = []
+        completed = []
+        for job, reply in zip(jobs, replies):
+            if isinstance(reply, Exception):
+                job._finish(error=reply)
+                finished.append(job)
+                continue
+# try and build a consistent user report using wildly different mediaflux reports
+            text = "task id=%s, " % job.id
+            elem = reply.find(".//task/description")
+            if elem is not None:
+                job.description = elem.text
+                text += "%s, " % job.description
+            elem = reply.find(".//task/state")
+            if elem is not None:
+                job.state = elem.text
+                text += "%s " % job.state
+            self.client.logging.debug("background %s" % text)
+            if job.show_progress is True:
+                sys.stdout.write("\r"+text)
+                sys.stdout.flush()
+
+            if "complete" in job.state:
+                completed.append(job)
+            elif "fail" in job.state:
+                elem = reply.find(".//task/error")
+                if elem is not None and elem.text is not None:
+                    job._finish(error=Exception(self.client._xml_succint_error(elem.text)))
+                else:
+                    job._finish(error=Exception("task id=%s failed" % job.id))
+                finished.append(job)
+
+        if len(completed) > 0:
+            try:
+                services = [ET.fromstring(self.client.call("service.background.results.get", id=job.id, post=False)).find("service") for job in completed]
+                replies = self.client._post_batch(services)
+            except Exception as e:
+                replies = [Exception(str(e))] * len(completed)
+            for job, reply in zip(completed, replies):
+                if isinstance(reply, Exception):
+                    job._finish(error=reply)
+                else:
+                    job._finish(reply=reply)
+                finished.append(job)
+
+        return finished
 
 #------------------------------------------------------------
 class mf_client():
@@ -33,6 +436,9 @@ class mf_client():
     Base Mediaflux authentication and communication client
     All unexpected failures are handled by raising exceptions
     """
+# request XML surrounding the arguments of call(), keyed by (service, background)
+    call_templates = {}
+
     def __init__(self, protocol="http", port="80", server="localhost", domain="system", encrypted_data=True):
         """
         Create a Mediaflux server connection instance. Raises an exception on failure.
@@ -63,15 +469,46 @@ class mf_client():
         self.session = ""
         self.token = ""
         self.logging = logging.getLogger('mfclient')
-
-# download/upload buffers
-        self.get_buffer = 8192
-        self.put_buffer = 8192
+# cached connect() probe results (saved with the endpoint) and how long they can be trusted for (seconds)
+        self.probe = {}
+        self.probe_ttl = 300
+
+# self tuning download/upload buffer sizes (NB: plain http uploads use sendfile and don't need a buffer)
+        self.get_tuner = metrics.transfer_tuner("%s get_buffer" % server, size=262144)
+        self.put_tuner = metrics.transfer_tuner("%s put_buffer" % server, size=1048576)
+# files at least this size are uploaded in acknowledged chunks via a server io job, so an interrupted put() can resume
+        self.resume_threshold = 1073741824
+        self.resume_chunk = 268435456
+        self.resume_dir = os.path.join(os.path.expanduser("~"), ".pshell_uploads")
+# concurrent chunk uploads (each on its own connection) for these files
+        self.put_streams = 4
+# files at least this size are downloaded as byte ranges over get_streams concurrent connections
+        self.get_threshold = 1073741824
+        self.get_chunk = 268435456
+        self.get_streams = 4
+# these (large) downloads can also be continued if interrupted, their progress is recorded here
+        self.get_resume_dir = os.path.join(os.path.expanduser("~"), ".pshell_downloads")
+# get_iter() keeps up to recall_window offline assets recalling, polling every recall_poll_min to recall_poll_max seconds
+        self.recall_window = 100
+        self.recall_poll_min = 5
+        self.recall_poll_max = 60
+# re-uploads of a file that fails checksum verification (see put)
+        self.verify_retries = 1
+# small files are grouped into archives of about pack_size bytes by put --pack
+        self.pack_size = 67108864
+        self.pack_threshold = 102400
+# pre-scanned destination namespaces (see put_index), which put() checks instead of querying each file
+        self.remote_index = {}
 # XML pretty print hack
         self.indent = 0
         self.enable_polling = True
 # POST URL
         self.post_url = "%s://%s/__mflux_svc__" % (protocol, server)
+# persistent connections for service calls (NB: connections are only opened on first use)
+        url = urllib.parse.urlparse(self.post_url)
+        self.post_pool = mf_connection_pool(url.netloc, encrypted=(url.scheme == 'https'), timeout=self.timeout)
+# background jobs (NB: polling thread is only started when there are jobs)
+        self.poller = mf_job_poller(self)
 
 # can override to test fast http data transfers (with https logins)
         if protocol == 'https':
@@ -120,6 +557,42 @@ class mf_client():
             client.session = endpoint['session']
         if 'token' in endpoint:
             client.token = endpoint['token']
+        if 'pool_size' in endpoint:
+            client.post_pool.size = int(endpoint['pool_size'])
+        if 'pool_idle' in endpoint:
+            client.post_pool.idle_timeout = float(endpoint['pool_idle'])
+        if 'probe' in endpoint:
+            client.probe = endpoint['probe']
+        if 'probe_ttl' in endpoint:
+            client.probe_ttl = float(endpoint['probe_ttl'])
+        if 'get_buffer' in endpoint:
+            client.get_buffer = endpoint['get_buffer']
+        if 'put_buffer' in endpoint:
+            client.put_buffer = endpoint['put_buffer']
+        if 'resume_threshold' in endpoint:
+            client.resume_threshold = int(endpoint['resume_threshold'])
+        if 'resume_chunk' in endpoint:
+            client.resume_chunk = int(endpoint['resume_chunk'])
+        if 'put_streams' in endpoint:
+            client.put_streams = int(endpoint['put_streams'])
+        if 'get_threshold' in endpoint:
+            client.get_threshold = int(endpoint['get_threshold'])
+        if 'get_chunk' in endpoint:
+            client.get_chunk = int(endpoint['get_chunk'])
+        if 'get_streams' in endpoint:
+            client.get_streams = int(endpoint['get_streams'])
+        if 'recall_window' in endpoint:
+            client.recall_window = int(endpoint['recall_window'])
+        if 'recall_poll_min' in endpoint:
+            client.recall_poll_min = float(endpoint['recall_poll_min'])
+        if 'recall_poll_max' in endpoint:
+            client.recall_poll_max = float(endpoint['recall_poll_max'])
+        if 'verify_retries' in endpoint:
+            client.verify_retries = int(endpoint['verify_retries'])
+        if 'pack_size' in endpoint:
+            client.pack_size = int(endpoint['pack_size'])
+        if 'pack_threshold' in endpoint:
+            client.pack_threshold = int(endpoint['pack_threshold'])
 
         return client
 
@@ -132,68 +605,164 @@ class mf_client():
         endpoint['encrypt'] = self.encrypted_data
         endpoint['session'] = self.session
         endpoint['token'] = self.token
+        endpoint['pool_size'] = self.post_pool.size
+        endpoint['pool_idle'] = self.post_pool.idle_timeout
+        endpoint['probe'] = self.probe
+        endpoint['probe_ttl'] = self.probe_ttl
+# only pinned buffer sizes are saved, tuned sizes are re-measured each session
+        if self.get_tuner.pinned is True:
+            endpoint['get_buffer'] = self.get_tuner.size
+        if self.put_tuner.pinned is True:
+            endpoint['put_buffer'] = self.put_tuner.size
+        endpoint['resume_threshold'] = self.resume_threshold
+        endpoint['resume_chunk'] = self.resume_chunk
+        endpoint['put_streams'] = self.put_streams
+        endpoint['get_threshold'] = self.get_threshold
+        endpoint['get_chunk'] = self.get_chunk
+        endpoint['get_streams'] = self.get_streams
+        endpoint['recall_window'] = self.recall_window
+        endpoint['recall_poll_min'] = self.recall_poll_min
+        endpoint['recall_poll_max'] = self.recall_poll_max
+        endpoint['verify_retries'] = self.verify_retries
+        endpoint['pack_size'] = self.pack_size
+        endpoint['pack_threshold'] = self.pack_threshold
 
         return endpoint
 
 #------------------------------------------------------------
-    def connect(self):
+    def _data_channel_http(self):
         """
-        Acquire connection status via session or token
+        Switch the data channel (only) to unencrypted http
+        """
+        self.logging.info("Setting data channel to http")
+        self.encrypted_data = False
+        self.data_get = "http://%s/mflux/content.mfjp" % self.server
+        self.data_put = "%s:%s" % (self.server, 80)
+
+#------------------------------------------------------------
+    @property
+    def get_buffer(self):
+        """
+        Current download buffer size, assigning a value pins it
+        """
+        return self.get_tuner.size
+
+    @get_buffer.setter
+    def get_buffer(self, size):
+        self.get_tuner.pin(size)
+
+#------------------------------------------------------------
+    @property
+    def put_buffer(self):
+        """
+        Current upload buffer size, assigning a value pins it
+        """
+        return self.put_tuner.size
+
+    @put_buffer.setter
+    def put_buffer(self, size):
+        self.put_tuner.pin(size)
+
+#------------------------------------------------------------
+    def _probe_reachable(self):
+        """
+        Reachability check, returns True if the server responded
         """
 # NEW - added /aterm path to connection test 
 # without this it will be attempting to connect to the web server - which may not be configured and doesn't need to be for API access
         url = "%s://%s:%d/aterm" % (self.protocol, self.server, self.port)
         self.logging.info("url=[%s]" % url)
-
-# reachability check
         try:
             code = urllib.request.urlopen(url, timeout=5).getcode()
             self.logging.info("connection code=%r" % code)
+            return True
         except Exception as e:
 # TODO - more precise messaging, eg using str(e) content
 # TODO - eg timeout status
-            self.status = "not connected" 
             self.logging.info(str(e))
-            return False
+        return False
 
-# fast data channel check
-        if self.protocol == 'https' and self.encrypted_data is True:
-            try:
+#------------------------------------------------------------
+    def _probe_data_channel(self):
+        """
+        Fast data channel check, returns True if plain http is available for data transfers
+        """
+        try:
 # updated connection path test
-                response = urllib.request.urlopen("http://%s:80/aterm" % self.server, timeout=5)
-                if response.code == 200:
-                    self.logging.info("Setting data channel to http")
-                    self.encrypted_data = False
-# override data channel only
-                    self.data_get = "http://%s/mflux/content.mfjp" % self.server
-                    self.data_put = "%s:%s" % (self.server, 80)
-            except Exception as e:
-                self.logging.debug(str(e))
+            response = urllib.request.urlopen("http://%s:80/aterm" % self.server, timeout=5)
+            if response.code == 200:
+                return True
+        except Exception as e:
+            self.logging.debug(str(e))
+        return False
 
-# convert session into a connection description
+#------------------------------------------------------------
+    def _probe_session(self):
+        """
+        Convert session into a connection description, returns the status string
+        """
         try:
 # NEW - better baseline check in terms of permissions
 # NB: don't use actor[name] as this might be an internal mediaflux ID
-            reply = self.aterm_run("actor.self.describe")
+            reply = self.call("actor.self.describe")
             elem = reply.find(".//actor")
             if elem is not None:
-#                self.status = "authenticated to: %s" % url
 # NEW - check for expired/destroyed token
                 if 'destroyed' in elem.attrib:
                     if elem.attrib['destroyed'] == 'true':
                         raise Exception("Delegate destroyed")
-                self.status = "authenticated"
-                return True
+                return "authenticated"
 
         except Exception as e:
             message = str(e)
             self.logging.info(message)
             if "maintenance mode" in message:
-                self.status = "maintenance"
-                return False
+                return "maintenance"
 
-        self.status = "login required"
-        return False
+        return "login required"
+
+#------------------------------------------------------------
+    def connect(self, refresh=False):
+        """
+        Acquire connection status via session or token
+        Authenticated probe results are cached (see probe_ttl) so repeated invocations can skip the network round trips, unless refresh is True
+        """
+# recent results for the same session can be trusted
+        age = time.time() - self.probe.get('time', 0)
+        if refresh is False and 0 <= age < self.probe_ttl and self.probe.get('session') == self.session:
+            self.logging.info("Using cached connection status (age=%.1fs)" % age)
+            if self.probe.get('data_http') is True and self.encrypted_data is True:
+                self._data_channel_http()
+            self.status = self.probe.get('status', "not connected")
+            return self.status == "authenticated"
+
+# the probes are independent - so run them concurrently
+        results = {}
+        def probe(name, method):
+            results[name] = method()
+        probes = [('reachable', self._probe_reachable), ('status', self._probe_session)]
+        if self.protocol == 'https' and self.encrypted_data is True:
+            probes.append(('data_http', self._probe_data_channel))
+# NB: daemon threads, so a hung service call on an unreachable server can be abandoned
+        threads = [threading.Thread(target=probe, args=item, daemon=True) for item in probes]
+        for thread in threads:
+            thread.start()
+        threads[0].join()
+        if results.get('reachable') is not True:
+            self.status = "not connected"
+            self.probe = {}
+            return False
+        for thread in threads[1:]:
+            thread.join()
+
+        if results.get('data_http') is True:
+            self._data_channel_http()
+        self.status = results.get('status', "login required")
+# NB: only a good result is cached - anything else (eg login required, maintenance) is probed again next time
+        self.probe = {}
+        if self.status == "authenticated":
+            self.probe = {'time': time.time(), 'session': self.session, 'status': self.status, 'data_http': results.get('data_http') is True}
+        return self.status == "authenticated"
 
 #------------------------------------------------------------
     def login(self, user=None, password=None, domain=None, token=None):
@@ -225,16 +794,16 @@ class mf_client():
             user = input("Username: ")
             password = getpass.getpass("Password: ")
 
-# create a session - failed aterm_run calls should raise an exception that gets handed back up
+# create a session - failed service calls should raise an exception that gets handed back up
 # priority order: user/password followed by token
         reply = None
         if user is not None:
-            reply = self.aterm_run("system.logon :domain %s :user %s :password %s" % (domain, user, password))
+            reply = self.call("system.logon", domain=domain, user=user, password=password)
         else:
             if token is not None:
                 if len(token) > 0:
                     logging.info("Secure token login.")
-                    reply = self.aterm_run("system.logon :token %s" % token)
+                    reply = self.call("system.logon", token=token)
                     self.token = token
 # attempt to extract a session
         try:
@@ -242,7 +811,7 @@ class mf_client():
             self.session = elem.text
             self.logging.info("Established session: %s" % self.session)
 # refresh connection info
-            self.connect()
+            self.connect(refresh=True)
         except Exception as e:
             self.logging.error(str(e))
             raise Exception("Invalid login call")
@@ -261,9 +830,10 @@ class mf_client():
         """
         Destroy the current session (NB: delegate can auto-create a new session if available)
         """
-        self.aterm_run("system.logoff")
+        self.call("system.logoff")
         self.session = ""
         self.status = "login required"
+        self.probe = {}
 
 #------------------------------------------------------------
     def delegate(self, line):
@@ -277,7 +847,7 @@ class mf_client():
 # destroy
         if line.startswith('off'):
             self.logging.debug("Destroying secure tokens...")
-            self.aterm_run("secure.identity.token.all.destroy")
+            self.call("secure.identity.token.all.destroy")
             self.token = ""
             return True
 
@@ -291,7 +861,7 @@ class mf_client():
 
         try:
 # query current authenticated identity
-            result = self.aterm_run("actor.self.describe")
+            result = self.call("actor.self.describe")
             elem = result.find(".//actor")
             actor = elem.attrib['name']
             i = actor.find(":")
@@ -299,7 +869,7 @@ class mf_client():
             user = actor[i+1:]
             self.logging.debug("Attempting to delegate for: domain=%s, user=%s, until=%r" % (domain, user, expiry))
 # attempt to delegate as current identity
-            result = self.aterm_run('secure.identity.token.create :to "%s" :role -type user "%s" :role -type domain "%s" :min-token-length 16 :wallet true' % (expiry, actor, domain))
+            result = self.call("secure.identity.token.create", to=expiry, role=[{'@type':'user', '#text':actor}, {'@type':'domain', '#text':domain}], min_token_length=16, wallet=True)
             elem = result.find(".//token")
             self.token = elem.text
             return True
@@ -314,7 +884,11 @@ class mf_client():
         """
         Display information about the authenticated identity
         """
-        xml_reply = self.aterm_run("actor.self.describe")
+# NB: token describe is only needed for delegates, but it's cheaper to fetch it in the same round trip
+        with self.batch() as batch:
+            batch.call("actor.self.describe")
+            batch.call("secure.identity.token.describe")
+        xml_reply = batch.result(0)
         result = []
 # main identity
         for elem in xml_reply.iter('actor'):
@@ -323,7 +897,7 @@ class mf_client():
             if 'identity' in user_type:
 # MFLUX BUG - can run a describe ... but if specify an id - even for a token I own - it generates a permission error
 # workaround - run and search for the right token to get it's validity
-                xml_expiry = self.aterm_run("secure.identity.token.describe")
+                xml_expiry = batch.result(1)
                 expiry = "Never"
                 for elem_id in xml_expiry.findall(".//identity"):
                     elem_actor = elem_id.find(".//actor")
@@ -364,36 +938,333 @@ class mf_client():
         return xml[:max_size]
 
 #------------------------------------------------------------
-    def _post(self, xml_bytes, out_filepath=None):
+    def _post_raw(self, xml_bytes, service="request"):
+        """
+        Primitive for sending XML bytes to the Mediaflux server over a pooled keep-alive connection and returning the raw reply
+        """
+        path = urllib.parse.urlparse(self.post_url).path
+        headers = {'Content-Type': 'text/xml', 'charset': 'utf-8'}
+        fresh = False
+        start_time = time.perf_counter()
+        while True:
+            conn, reused = self.post_pool.acquire(fresh=fresh)
+            try:
+                conn.request('POST', path, body=xml_bytes, headers=headers)
+                response = conn.getresponse()
+                xml = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+# stale keep-alive socket - try once more with a new connection
+                if reused is True:
+                    self.logging.debug("Reconnecting stale connection: %s" % str(e))
+                    fresh = True
+                    continue
+                metrics.registry.record(service, time.perf_counter() - start_time, bytes_out=len(xml_bytes), error=True, retries=int(fresh))
+                raise
+            except Exception:
+                conn.close()
+                metrics.registry.record(service, time.perf_counter() - start_time, bytes_out=len(xml_bytes), error=True, retries=int(fresh))
+                raise
+            self.post_pool.release(conn, reusable=not response.will_close)
+            break
+
+        metrics.registry.record(service, time.perf_counter() - start_time, bytes_in=len(xml), bytes_out=len(xml_bytes), error=(response.status != 200), retries=int(fresh))
+        if response.status != 200:
+            raise Exception("HTTP Error %d: %s" % (response.status, response.reason))
+
+        return xml
+
+#------------------------------------------------------------
+    def _post_iter(self, xml_bytes, tags, parent=None, service="request"):
+        """
+        Primitive for posting an XML message and incrementally parsing the reply as it arrives from the socket
+        Yields (reply index, element) for elements with a tag in tags (and optionally a parent tag) or (reply index, Exception) for failed replies
+        Elements are removed from the tree once processed, so memory use does not grow with the size of the reply
+        """
+        path = urllib.parse.urlparse(self.post_url).path
+        headers = {'Content-Type': 'text/xml', 'charset': 'utf-8'}
+        conn, reused = self.post_pool.acquire()
+        response = None
+        complete = False
+        retries = 0
+        errors = 0
+        bytes_in = 0
+        start_time = time.perf_counter()
+        try:
+            try:
+                conn.request('POST', path, body=xml_bytes, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+# stale keep-alive socket - nothing has been parsed yet, so try once more with a new connection
+                if reused is False:
+                    raise
+                self.logging.debug("Reconnecting stale connection: %s" % str(e))
+                conn.close()
+                retries = 1
+                conn, reused = self.post_pool.acquire(fresh=True)
+                conn.request('POST', path, body=xml_bytes, headers=headers)
+                response = conn.getresponse()
+            if response.status != 200:
+                raise Exception("HTTP Error %d: %s" % (response.status, response.reason))
+
+            parser = ET.XMLPullParser(events=('start', 'end'))
+            stack = []
+            index = -1
+            error = False
+            message = "Unknown server error"
+            while True:
+                data = response.read(65536)
+                if not data:
+                    break
+                bytes_in += len(data)
+                parser.feed(data)
+                for event, elem in parser.read_events():
+                    if event == 'start':
+                        if elem.tag == 'reply':
+                            index += 1
+                            error = False
+                            message = "Unknown server error"
+                        stack.append(elem)
+                        continue
+                    stack.pop()
+                    if elem.tag == 'error':
+                        error = True
+                    elif elem.tag == 'message' and error is True:
+                        message = elem.text
+                    elif elem.tag == 'reply' and error is True:
+                        errors += 1
+                        yield index, Exception(self._xml_succint_error(message))
+                    elif elem.tag in tags and error is False:
+                        if parent is None or (len(stack) > 0 and stack[-1].tag == parent):
+                            yield index, elem
+# done with this element - detach from the tree
+                            if len(stack) > 0:
+                                stack[-1].remove(elem)
+                            elem.clear()
+            parser.close()
+            complete = True
+        finally:
+# NB: elapsed includes any time the consumer spent between elements
+            metrics.registry.record(service, time.perf_counter() - start_time, bytes_in=bytes_in, bytes_out=len(xml_bytes), error=(complete is False or errors > 0), retries=retries)
+            if complete is True:
+                self.post_pool.release(conn, reusable=not response.will_close)
+            else:
+# reply was not fully read (error or consumer stopped early) - socket can't be reused
+                conn.close()
+
+#------------------------------------------------------------
+    def _post(self, xml_bytes, out_filepath=None, service="request"):
         """
         Primitive for sending an XML message to the Mediaflux server
         """
 # NB: timeout exception if server is unreachable
         elem=None
         try:
-            request = urllib.request.Request(self.post_url, data=xml_bytes, headers={'Content-Type': 'text/xml', 'charset': 'utf-8'})
-            response = urllib.request.urlopen(request, timeout=self.timeout)
-            xml = response.read()
+            xml = self._post_raw(xml_bytes, service=service)
             tree = ET.fromstring(xml.decode())
             elem = tree.find(".//reply/error")
 # process connection error
         except Exception as e:
             self.logging.debug(str(e))
+            self._probe_invalidate(str(e))
             raise Exception(str(e))
 # process server response error
         if elem is not None:
+            metrics.registry.add(service, errors=1)
             elem = tree.find(".//message")
             error_message = self._xml_succint_error(elem.text)
             self.logging.debug("raise: [%s]" % error_message)
+            self._probe_invalidate(error_message)
             raise Exception(error_message)
 
         return tree
 
 #------------------------------------------------------------
-    def _post_multipart_buffered(self, xml, filepath, cb_progress=None):
+    def _probe_invalidate(self, message):
+        """
+        Discard the cached connection status if a call failed because the session is no longer valid
+        """
+        if "session is not valid" in message or "authentication" in message.lower():
+            self.probe = {}
+
+#------------------------------------------------------------
+    def _session_restore(self):
+        """
+        Primitive for regenerating an expired session using the delegate token, raises an exception on failure
+        """
+# use raw post here ... not a recursive aterm_run() as this may get stuck in a re-try loop
+        self.logging.info("Attempting to restore session with token")
+        try:
+            xml_raw = '<request><service name="system.logon"><args><token>%s</token></args></service></request>' % self.token
+            xml_retry = self._post(xml_raw.encode(), service="system.logon")
+            elem = xml_retry.find(".//session")
+            self.session = elem.text
+        except Exception as e:
+            self.logging.debug(str(e))
+            self.session = ""
+            raise
+
+#------------------------------------------------------------
+    def _batch_replies(self, tree, count):
+        """
+        Split a multi-service response into a LIST of per-call reply elements or Exceptions (in call order)
+        """
+        results = []
+        for reply in tree.findall(".//reply"):
+            if reply.find("error") is not None:
+                elem = reply.find(".//message")
+                if elem is not None:
+                    results.append(Exception(self._xml_succint_error(elem.text)))
+                else:
+                    results.append(Exception("Unknown server error"))
+            else:
+                results.append(reply)
+        if len(results) != count:
+            raise Exception("Expected %d replies, got %d" % (count, len(results)))
+        return results
+
+#------------------------------------------------------------
+    @staticmethod
+    def _batch_name(services):
+        """
+        Metrics name for a batch, eg batch[asset.get+asset.query]
+        """
+        names = set()
+        for service in services:
+            inner = service.find("args/service")
+            if inner is None:
+                inner = service
+            names.add(inner.get("name"))
+        return "batch[%s]" % "+".join(sorted(names))
+
+#------------------------------------------------------------
+    def _batch_xml(self, services):
+        """
+        Build the request XML for a LIST of service elements using the current session
+        """
+        xml = ET.Element("request")
+        for service in services:
+            if service.get("session") is not None:
+                service.set("session", self.session)
+            xml.append(service)
+        self.logging.debug("XML out: %d service call(s)" % len(services))
+        return ET.tostring(xml)
+
+#------------------------------------------------------------
+    def _post_batch_iter(self, services, tags, parent=None):
+        """
+        Streaming version of _post_batch() that yields (call index, element or Exception) as the reply is parsed
+        """
+        count = 0
+        while True:
+            retry = False
+            for index, elem in self._post_iter(self._batch_xml(services), tags, parent=parent, service=self._batch_name(services)):
+                if isinstance(elem, Exception):
+                    self._probe_invalidate(str(elem))
+# only retry (once) if the session was invalid, nothing has been yielded and we have a token
+                if isinstance(elem, Exception) and "session is not valid" in str(elem) and count == 0 and len(self.token) > 0:
+                    retry = True
+                    continue
+                if retry is False:
+                    count += 1
+                    yield index, elem
+            if retry is False:
+                return
+            count = -1
+            self._session_restore()
+
+#------------------------------------------------------------
+    def _post_batch(self, services):
+        """
+        Primitive for sending a LIST of service elements to the server as a single request
+        """
+        post_count = 0
+        while True:
+            post_count += 1
+            xml_text = self._batch_xml(services)
+            try:
+                reply = self._post_raw(xml_text, service=self._batch_name(services))
+                tree = ET.fromstring(reply.decode())
+            except Exception as e:
+                self.logging.debug(str(e))
+                raise Exception(str(e))
+            results = self._batch_replies(tree, len(services))
+            failed = len([item for item in results if isinstance(item, Exception)])
+            if failed > 0:
+                metrics.registry.add(self._batch_name(services), errors=failed)
+# only retry (once) if the session was invalid and we have a token
+            expired = [item for item in results if isinstance(item, Exception) and "session is not valid" in str(item)]
+            if len(expired) > 0:
+                self.probe = {}
+            if len(expired) == 0 or len(self.token) == 0 or post_count > 1:
+                return results
+            self._session_restore()
+
+#------------------------------------------------------------
+    def wait(self, jobs):
+        """
+        Wait for a LIST of background jobs (see call with wait=False) and return their XML results in the same order
+        Raises the first error once all the jobs have finished
+        """
+        for job in jobs:
+            job.event.wait()
+        return [job.result() for job in jobs]
+
+#------------------------------------------------------------
+    def batch(self):
+        """
+        Create a batch of service calls that will be sent to the server as a single request, eg
+
+            with client.batch() as batch:
+                batch.add("asset.get :id 123")
+                batch.call("asset.content.status", id=123)
+            asset = batch.result(0)
+        """
+        return mf_batch(self)
+
+#------------------------------------------------------------
+    def _post_multipart_buffered(self, xml, filepath, cb_progress=None, checksum=False):
         """
         Primitive for doing buffered upload on a single file. Used by the put() method
         Sends a multipart POST to the server; consisting of the initial XML, followed by a streamed, buffered read of the file contents
+        Returns the asset ID and (if checksum is True) the crc32 of the content sent
+        """
+        progress = mf_progress(cb_progress)
+        reply, crc = self._post_multipart(xml, filepath, progress, os.path.basename(filepath), checksum=checksum)
+
+        tree = ET.fromstring(reply)
+        message = "response did not contain an asset ID."
+        for elem in tree.iter():
+            if elem.tag == 'id':
+                return int(elem.text), crc
+            if elem.tag == 'message':
+                message = elem.text
+
+        raise Exception(message)
+
+#------------------------------------------------------------
+    def _post_multipart(self, xml, filepath, progress, filename, offset=0, length=None, checksum=False):
+        """
+        Send a multipart POST of the XML request followed by length bytes (default: to the end) of a file from offset
+        Returns the raw reply and (if checksum is True) the crc32 of the bytes sent
+        """
+        if length is None:
+            length = os.path.getsize(filepath) - offset
+        crc = [None]
+
+        def send(conn):
+            with open(filepath, 'rb') as infile:
+# TODO - we *could* allow ctrl-C interruption here via enable_polling state, but could create a mess on the server
+                crc[0] = self._send_file(conn, infile, offset, length, progress, checksum=checksum)
+
+        self.logging.debug("File send: %s (offset=%d, length=%d)" % (filepath, offset, length))
+        reply = self._post_multipart_stream(xml, filename, length, send, progress)
+        return reply, crc[0]
+
+#------------------------------------------------------------
+    def _post_multipart_stream(self, xml, filename, length, send, progress, mimetype='application/octet-stream', service="upload"):
+        """
+        Send a multipart POST of the XML request followed by length bytes of attachment, written to the connection by send(conn), returns the raw reply
         """
 # mediaflux seems to have random periods of unresponsiveness - particularly around final ACK of transfer
 # retries don't seem to work at all, but increasing the timeout seems to help cover the problem 
@@ -401,9 +1272,6 @@ class mf_client():
 # setup
         pid = os.getpid()
         boundary = ''.join(random.choice(string.digits + string.ascii_letters) for i in range(30))
-        filename = os.path.basename(filepath)
-# default
-        mimetype = 'application/octet-stream'
 # multipart - request xml and file
         lines = []
         lines.extend(('--%s' % boundary, 'Content-Disposition: form-data; name="request"', '', str(xml),))
@@ -413,66 +1281,136 @@ class mf_client():
         lines.extend(('--%s' % boundary, 'Content-Disposition: form-data; name="filename"; filename="%s"' % filename, 'Content-Type: %s' % mimetype, '', ''))
         body = '\r\n'.join(lines)
 # NB - should include everything AFTER the first /r/n after the headers
-        total_size = len(body) + os.path.getsize(filepath) + len(boundary) + 8
-
-# different connection object for HTTPS vs HTTP
-        if self.encrypted_data is True:
-            self.logging.debug("Using https for data: [%s]" % self.data_put)
-            conn = http.client.HTTPSConnection(self.data_put, timeout=upload_timeout)
-        else:
-            self.logging.debug("Using http for data: [%s]" % self.data_put)
-            conn = http.client.HTTPConnection(self.data_put, timeout=upload_timeout)
-
+        total_size = len(body) + length + len(boundary) + 8
+
+# reuse a keep-alive connection to the data channel if available
+        pool = mf_connection_pool.shared(self.data_put, self.encrypted_data, timeout=upload_timeout)
+        fresh = False
+        start_time = time.perf_counter()
+        while True:
+            conn, reused = pool.acquire(fresh=fresh)
+            self.logging.debug("Data channel [%s] encrypted=%r reused=%r (opened=%d, reused=%d)" % (self.data_put, self.encrypted_data, reused, pool.opened, pool.reused))
+            try:
 # kickoff
-        self.logging.debug("[pid=%d] File send starting: %s" % (pid, filepath))
-        conn.putrequest('POST', '/__mflux_svc__')
+                self.logging.debug("[pid=%d] File send starting" % pid)
+                conn.putrequest('POST', '/__mflux_svc__')
 # headers
-        conn.putheader('Connection', 'keep-alive')
-        conn.putheader('Cache-Control', 'no-cache')
-        conn.putheader('Content-Length', str(total_size))
-        conn.putheader('Content-Type', 'multipart/form-data; boundary=%s' % boundary)
-        conn.putheader('Content-Transfer-Encoding', 'binary')
-        conn.endheaders()
+                conn.putheader('Connection', 'keep-alive')
+                conn.putheader('Cache-Control', 'no-cache')
+                conn.putheader('Content-Length', str(total_size))
+                conn.putheader('Content-Type', 'multipart/form-data; boundary=%s' % boundary)
+                conn.putheader('Content-Transfer-Encoding', 'binary')
+                conn.endheaders()
+# NB: a server that closed the idle connection leaves it readable (EOF), which may only show up once the headers are written
+                if reused is True and pool._connection_dropped(conn):
+                    raise ConnectionResetError("Connection closed by server")
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+# stale keep-alive socket - no body bytes have been sent yet, so try once more with a new connection
+                if reused is True:
+                    self.logging.debug("Reconnecting stale connection: %s" % str(e))
+                    fresh = True
+                    continue
+                metrics.registry.record(service, time.perf_counter() - start_time, error=True, retries=int(fresh), category="transfer")
+                raise
+            except Exception:
+                conn.close()
+                metrics.registry.record(service, time.perf_counter() - start_time, error=True, retries=int(fresh), category="transfer")
+                raise
+            break
 
+        try:
 # start sending the file
-        conn.send(body.encode())
-        with open(filepath, 'rb') as infile:
-# TODO - we *could* allow ctrl-C interruption here via enable_polling state, but could create a mess on the server
-            while True:
-# trap disk IO issues
-                try:
-                    chunk = infile.read(self.put_buffer)
-                except Exception as e:
-                    raise Exception("File read error: %s" % str(e))
-# exit condition
-                if not chunk:
-                    break
-# trap network IO issues
-                try:
-                    conn.send(chunk)
-                    if cb_progress is not None:
-                        cb_progress(len(chunk))
-                except Exception as e:
-                    raise Exception("Network send error: %s" % str(e))
+            conn.send(body.encode())
+            send(conn)
+            progress.flush()
 
 # terminating line (len(boundary) + 8)
-        chunk = "\r\n--%s--\r\n" % boundary
-        conn.send(chunk.encode())
-        self.logging.debug("[pid=%d] File send completed, waiting for server..." % pid)
+            chunk = "\r\n--%s--\r\n" % boundary
+            conn.send(chunk.encode())
+            self.logging.debug("[pid=%d] File send completed, waiting for server..." % pid)
 
 # get ACK from server (asset ID) else error (raise exception)
-        resp = conn.getresponse()
-        reply = resp.read()
-        conn.close()
-        tree = ET.fromstring(reply)
-        message = "response did not contain an asset ID."
-        for elem in tree.iter():
-            if elem.tag == 'id':
-                return int(elem.text)
-            if elem.tag == 'message':
-                message = elem.text
+            resp = conn.getresponse()
+            reply = resp.read()
+        except Exception:
+# never return a connection in an unknown state to the pool
+            conn.close()
+            metrics.registry.record(service, time.perf_counter() - start_time, error=True, retries=int(fresh), category="transfer")
+            raise
+        pool.release(conn, reusable=not resp.will_close)
+        metrics.registry.record(service, time.perf_counter() - start_time, bytes_in=len(reply), bytes_out=total_size, retries=int(fresh), category="transfer")
+
+        return reply
+
+#------------------------------------------------------------
+    def _send_file(self, conn, infile, offset, length, progress, checksum=False):
+        """
+        Send length bytes of an open file from offset, with sendfile where the connection allows it
+        Returns the crc32 of the bytes sent if checksum is True
+        """
+# NB: a checksum needs the bytes in user space anyway, so the buffer that is sent is also the one checksummed (no second read)
+        if checksum is True or isinstance(conn.sock, ssl.SSLSocket):
+            infile.seek(offset)
+            return self._send_buffered(conn, infile, progress, length=length, checksum=checksum)
+        return self._send_zerocopy(conn, infile, offset, length, progress)
+
+#------------------------------------------------------------
+    def _send_zerocopy(self, conn, infile, offset, length, progress):
+        """
+        Send length bytes of file content from offset over an unencrypted connection with sendfile (kernel copies file -> socket, no python buffers)
+        """
+# segments keep progress reporting going on large files
+        segment = 16 * 1048576
+        end = offset + length
+        while offset < end:
+            try:
+                sent = conn.sock.sendfile(infile, offset, min(segment, end - offset))
+            except Exception as e:
+                raise Exception("Network send error: %s" % str(e))
+            if sent == 0:
+                raise Exception("File read error: file changed size during upload")
+            offset += sent
+            progress.update(sent)
 
-        raise Exception(message)
+#------------------------------------------------------------
+    def _send_buffered(self, conn, infile, progress, length=None, checksum=False):
+        """
+        Send file content (from the current position, length bytes or to the end) reading into a single reused buffer - used for TLS connections (encryption requires a user space copy) and checksummed sends
+        Returns the crc32 of the bytes sent if checksum is True
+        """
+        crc = 0 if checksum is True else None
+        stream = self.put_tuner.stream()
+        buffer = bytearray(stream.size)
+        view = memoryview(buffer)
+        while length is None or length > 0:
+# the tuner may have picked a new size
+            if len(buffer) != stream.size:
+                buffer = bytearray(stream.size)
+                view = memoryview(buffer)
+            size = len(buffer) if length is None else min(len(buffer), length)
+# trap disk IO issues
+            try:
+                count = infile.readinto(view[:size])
+            except Exception as e:
+                raise Exception("File read error: %s" % str(e))
+# exit condition
+            if not count:
+                if length is not None:
+                    raise Exception("File read error: file changed size during upload")
+                break
+# trap network IO issues
+            try:
+                conn.sock.sendall(view[:count])
+            except Exception as e:
+                raise Exception("Network send error: %s" % str(e))
+            if checksum is True:
+                crc = zlib.crc32(view[:count], crc)
+            if length is not None:
+                length -= count
+            progress.update(count)
+            stream.update(count)
+        return crc
 
 #------------------------------------------------------------
     @staticmethod
@@ -501,13 +1439,14 @@ class mf_client():
 
 #------------------------------------------------------------
 # TODO - convert to background always true -> will need to fix :out first (see below) and a whole lot of other things
-    def aterm_run(self, input_line, background=False, post=True, description=None, show_progress=False):
+    def aterm_run(self, input_line, background=False, post=True, description=None, show_progress=False, wait=True):
         """
         Method for parsing aterm's compressed XML syntax and sending to the Mediaflux server
 
         Args:
              service_call: raw input text that is assumed to be in aterm syntax
                post: if False will just return the argument part of the serialized XML, if True will post and return reply
+               wait: if False, background calls return an mf_job handle immediately instead of the reply
 
         Returns:
             A STRING containing the server reply (if post is TRUE, if false - just the XML for test comparisons)
@@ -668,20 +1607,137 @@ class mf_client():
 # convert XML to string for posting ...
         xml_text = ET.tostring(xml)
 
-# PYTHON3 - bytes v strings
-        xml_hidden = self._xml_cloak(xml_text.decode()).encode() 
-        self.logging.debug("XML out: %r" % xml_hidden)
-
 # testing hook
         if post is not True:
             return xml_text
 
+        return self._execute(xml_text, service_call, background=background, show_progress=show_progress, data_out_name=data_out_name, wait=wait)
+
+#------------------------------------------------------------
+    @staticmethod
+    def _xml_element(tag, value):
+        """
+        Helper method for serialising a single service argument, a DICT value becomes nested elements with @attribute and #text keys
+        """
+        if value is None:
+            return ""
+        if isinstance(value, (list, tuple)):
+            return "".join([mf_client._xml_element(tag, item) for item in value])
+        attrib = ""
+        if ":" in tag:
+            attrib += ' xmlns:%s="%s"' % (tag.split(":")[0], tag.split(":")[0])
+        text = ""
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key.startswith('@'):
+                    attrib += ' %s="%s"' % (key[1:], mf_client._xml_value(item))
+                elif key == '#text':
+                    text += mf_client._xml_value(item)
+                else:
+                    text += mf_client._xml_element(key, item)
+        else:
+            text = mf_client._xml_value(value)
+        return "<%s%s>%s</%s>" % (tag, attrib, text, tag)
+
+# --- helper
+    @staticmethod
+    def _xml_value(value):
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return mf_client._xml_sanitise(str(value))
+
+#------------------------------------------------------------
+    @classmethod
+    def _call_template(cls, service, background=False):
+        """
+        Return the cached (head, tail) request text surrounding the session and arguments of a service call
+        """
+        key = (service, background)
+        template = cls.call_templates.get(key)
+        if template is None:
+            if service == "system.logon":
+# the case where the call can't be wrapped in a service.execute (NB: no session)
+                template = ('<request><service name="system.logon"><args>', None, '</args></service></request>')
+            else:
+                middle = '"><args>'
+                if background is True:
+                    middle += '<background>True</background>'
+                middle += '<service name="%s">' % cls._xml_sanitise(service)
+                template = ('<request><service name="service.execute" session="', middle, '</service></args></service></request>')
+            cls.call_templates[key] = template
+        return template
+
+#------------------------------------------------------------
+    def call(self, service_call, background=False, post=True, show_progress=False, wait=True, **args):
+        """
+        Structured alternative to aterm_run() that builds the request XML directly, without lexing aterm syntax
+
+        Args:
+            service_call: a STRING giving the service name, eg asset.get
+            args: service arguments, keyword underscores become hyphens and a trailing underscore is dropped (eg as_ => as)
+                  values may be scalars, LISTS for repeated elements or DICTS with @attribute, #text and child element keys
+            wait: if False, background calls return an mf_job handle immediately instead of the reply
+
+        Returns:
+            The XML reply (if post is True, otherwise the serialised request XML)
+        """
+        head, middle, tail = self._call_template(service_call, background)
+        body = "".join([self._xml_element(key.rstrip('_').replace('_', '-'), value) for key, value in args.items()])
+        if middle is None:
+            xml_text = (head + body + tail).encode()
+        else:
+            xml_text = (head + self.session + middle + body + tail).encode()
+
+        if post is not True:
+            return xml_text
+
+        return self._execute(xml_text, service_call, background=background, show_progress=show_progress, wait=wait)
+
+#------------------------------------------------------------
+    def call_iter(self, service_call, tags, parent=None, **args):
+        """
+        Streaming version of call() that yields reply elements with a tag in tags as they are parsed, rather than building the whole reply
+        NB: each element is cleared once the consumer moves on to the next one
+        """
+        if isinstance(tags, str):
+            tags = (tags,)
+        count = 0
+        while True:
+            xml_text = self.call(service_call, post=False, **args)
+            try:
+                for index, elem in self._post_iter(xml_text, tags, parent=parent, service=service_call):
+                    if isinstance(elem, Exception):
+                        raise elem
+                    count += 1
+                    yield elem
+                return
+            except Exception as e:
+                self._probe_invalidate(str(e))
+# only retry (once) if the session was invalid, nothing has been yielded and we have a token
+                if "session is not valid" in str(e) and count == 0 and len(self.token) > 0:
+                    count = -1
+                    self._session_restore()
+                    continue
+                raise
+
+#------------------------------------------------------------
+    def _execute(self, xml_text, service_call, background=False, show_progress=False, data_out_name=None, wait=True):
+        """
+        Primitive for posting a serialised service call, handling background polling, output downloads and session restoration
+        """
+# only pay for the cloaking regexes if someone is going to see the result
+        if self.logging.isEnabledFor(logging.DEBUG):
+# PYTHON3 - bytes v strings
+            xml_hidden = self._xml_cloak(xml_text.decode()).encode() 
+            self.logging.debug("XML out: %r" % xml_hidden)
+
 # send the service call and see what happens ...
         message = "This shouldn't happen"
 #        while True:
 # CURRENT - only 2 tries - 1st ... possibly second if session has expired (and we can regen with token) ... after that - done
         post_count = 0
         post_retry = True
+        job = None
 
         while post_retry is True:
             self.logging.debug("loop: post_count=%d, post_retry=%r" % (post_count, post_retry))
@@ -691,72 +1747,13 @@ class mf_client():
 # NEW - INFO on timing for mflux service calls
                 start_time = time.time()
 # main POST to server
-                reply = self._post(xml_text)
+                reply = self._post(xml_text, service=service_call)
                 if background is True:
+# CASE 1 - run in background, the poller thread tracks the job from here
                     elem = reply.find(".//id")
-                    job = elem.text
-                    done = False
-                    while done is False:
-                        self.logging.debug("background task [%s] poll..." % job)
-
-# CURRENT - an issue with calling self in some edge cases?
-# TODO - switch to plain _post ... ?
-                        state = "unknown"
-                        description = "unknown"
-
-                        xml_poll = None
-                        try:
-                            xml_poll = self.aterm_run("service.background.describe :id %s" % job)
-
-#                            self.xml_print(xml_poll)
-# try and build a consistent user report using wildly different mediaflux reports
-                            text = "task id=%s, " % job
-
-                            elem = xml_poll.find(".//task/description")
-                            if elem is not None:
-                                description = elem.text
-                                text += "%s, " % description
-
-                            elem = xml_poll.find(".//task/state")
-                            if elem is not None:
-                                state = elem.text
-                                text += "%s " % state
-
-# set exit flag
-                            if "complete" in state:
-                                xml_poll = self.aterm_run("service.background.results.get :id %s" % job)
-                                done = True
-                            elif "fail" in state:
-                                done = True
-
-# TODO
-#                            text += "elapsed=%s    " % exec_time
-
-                        except Exception as e:
-                            text = "task id=%s, polling error  " % job
-                            self.logging.error(str(e))
-                            done = True
-
-# show progress report, if requested
-                        if show_progress is True:
-#                            sys.stdout.write("\r"+text)
-                            sys.stdout.write("\r"+text)
-                            sys.stdout.flush()
-#                            if done is True:
-#                                print("        ")
-
-# if not done, sleep to prevent overloading server with requests
-                        if done is False:
-                            time.sleep(5)
-
-# successful
-# NB: mediaflux seems to not return any output if run in background (eg asset.get :id xxxx &)
-# this seems like a bug?
-#                    self.xml_print(xml_poll)
-                    elapsed = time.time() - start_time
-                    self.logging.debug("completed: %s, elapsed: %r" % (service_call, elapsed))
-                    return xml_poll
-
+                    job = mf_job(self, elem.text, service_call, show_progress=show_progress)
+                    self.poller.submit(job)
+                    break
                 else:
 # CASE 2 - not run in background
                     if data_out_name is not None:
@@ -800,25 +1797,28 @@ class mf_client():
                     if len(self.token) > 0:
                         if post_count == 1:
                             post_retry = True
+                            metrics.registry.add(service_call, retries=1)
 
             if post_retry is True:
-# use raw post here ... not a recursive aterm_run() as this may get stuck in a re-try loop
-                self.logging.info("Attempting to restore session with token")
                 try:
-                    xml_raw = '<request><service name="system.logon"><args><token>%s</token></args></service></request>' % self.token
-                    xml_retry = self._post(xml_raw.encode())
-                    elem = xml_retry.find(".//session")
-                    self.session = elem.text
+                    self._session_restore()
 # PYTHON3 - due to the strings vs bytes change (ie xml_text is bytes rather than string) 
                     xml_text = re.sub('session=[^>]*', 'session="%s"' % self.session, xml_text.decode()).encode()
 
                 except Exception as e:
 # no point continuing to retry - couldn't regenerate a valid session
                     message = str(e)
-                    self.logging.debug(message)
-                    self.session = ""
                     post_retry = False
 
+        if job is not None:
+            if wait is False:
+                return job
+            with metrics.tracer.span("wait %s" % service_call, "background"):
+                reply = job.result()
+            elapsed = time.time() - start_time
+            self.logging.debug("completed: %s, elapsed: %r" % (service_call, elapsed))
+            return reply
+
 # give up with the most recent error message
         raise Exception(message)
 
@@ -898,7 +1898,7 @@ class mf_client():
         """
         Wrapper around the generic service call mechanism (for testing namespace existence) that parses the result XML and returns a BOOLEAN
         """
-        reply = self.aterm_run('asset.namespace.exists :namespace "%s"' % namespace.replace('"', '\\\"'))
+        reply = self.call("asset.namespace.exists", namespace=namespace)
         elem = reply.find(".//exists")
         if elem is not None:
             if elem.text == "true":
@@ -951,10 +1951,8 @@ class mf_client():
         self.logging.debug("cn seek: target_ns: [%s] : prefix=[%r] : pattern=[%r] : start=%r : xlat=%r" % (target_ns, prefix, pattern, start, xlat_offset))
 
 # generate listing in target namespace for completion matches
-        result = self.aterm_run('asset.namespace.list :namespace "%s"' % target_ns)
-
         ns_list = []
-        for elem in result.iter('namespace'):
+        for elem in self.call_iter("asset.namespace.list", "namespace", parent="namespace", namespace=target_ns):
             if elem.text is not None:
 # namespace matches the pattern we're looking for?
                 item = None
@@ -983,36 +1981,49 @@ class mf_client():
         self.logging.debug("ca seek: cwd=[%s] partial_asset=[%s] start=[%d]" % (cwd, partial_asset_path, start))
 # construct an absolute namespace (required for any remote lookups)
         candidate_ns = self.abspath(cwd, partial_asset_path)
+        match = re.match(r".*/", candidate_ns)
+
+# candidate may be a namespace (list everything in it) or a partial name (match in the parent) - ask for both in a single round trip
+        batch = self.batch()
+        batch.call("asset.namespace.exists", namespace=candidate_ns)
+        batch.call("asset.query", where="namespace='%s'" % self.escape_single_quotes(candidate_ns), action="get-values", xpath={'@ename':'name', '#text':'name'})
+        if match:
+            batch.call("asset.query", where="namespace='%s' and name ='%s*'" % (self.escape_single_quotes(match.group(0)), candidate_ns[match.end():]), action="get-values", xpath={'@ename':'name', '#text':'name'})
 
-        if self.namespace_exists(candidate_ns):
+# the exists reply arrives first and decides which of the (streamed) query replies we keep
+        wanted = None
+        asset_list = []
+        for index, elem in batch.execute_iter(("exists", "name")):
+            if index == 0:
+                if isinstance(elem, Exception):
+                    raise elem
+                if elem.tag != "exists":
+                    continue
+                if elem.text == "true":
 # candidate is a namespace -> it's our target for listing
-            target_ns = candidate_ns
+                    target_ns = candidate_ns
 # no pattern -> add all namespaces
-            pattern = None
+                    pattern = None
 # replacement prefix for any matches
-            prefix = partial_asset_path[start:]
-        else:
+                    prefix = partial_asset_path[start:]
+                    wanted = 1
+                else:
 # candidate not a namespace -> set the parent as the namespace target
-            match = re.match(r".*/", candidate_ns)
-            if match:
-                target_ns = match.group(0)
+                    if match:
+                        target_ns = match.group(0)
 # extract pattern to search and prefix for any matches
-                pattern = candidate_ns[match.end():]
-                prefix = partial_asset_path[start:-len(pattern)]
-            else:
-                return None
-
-        target_ns = self.escape_single_quotes(target_ns)
-        self.logging.debug("ca seek: target_ns: [%s] : pattern = %r : prefix = %r" % (target_ns, pattern, prefix))
-
-        if pattern is not None:
-            result = self.aterm_run("asset.query :where \"namespace='%s' and name ='%s*'\" :action get-values :xpath -ename name name" % (target_ns, pattern))
-        else:
-            result = self.aterm_run("asset.query :where \"namespace='%s'\" :action get-values :xpath -ename name name" % target_ns)
-
-#       ALT? eg for elem in result.findall(".//name")
-        asset_list = []
-        for elem in result.iter("name"):
+                        pattern = candidate_ns[match.end():]
+                        prefix = partial_asset_path[start:-len(pattern)]
+                        wanted = 2
+                    else:
+                        return None
+                self.logging.debug("ca seek: target_ns: [%s] : pattern = %r : prefix = %r" % (target_ns, pattern, prefix))
+                continue
+
+            if index != wanted:
+                continue
+            if isinstance(elem, Exception):
+                raise elem
             if elem.text is not None:
 #                asset_list.append(posixpath.join(prefix, elem.text))
 # NEW - check we're not suggesting a repeat of the non-editable part of the completion string
@@ -1052,14 +2063,18 @@ class mf_client():
 #------------------------------------------------------------
     def rmdir(self, namespace, prompt=None):
         """
-        remove a namespace
+        remove a namespace (or a LIST of namespaces, which are destroyed concurrently)
         """
+        if isinstance(namespace, str):
+            namespace = [namespace]
 # TODO - compute count and size of assets for prompt
         if prompt is not None:
-            if prompt("Delete folder %s (y/n): " % namespace) is False:
-                return False
+            for item in namespace:
+                if prompt("Delete folder %s (y/n): " % item) is False:
+                    return False
 # run the removal
-        self.aterm_run('asset.namespace.destroy :namespace "%s"' % namespace.replace('"', '\\\"'), background=True, show_progress=True)
+        jobs = [self.call("asset.namespace.destroy", namespace=item, background=True, show_progress=True, wait=False) for item in namespace]
+        self.wait(jobs)
         print("")
         return True
 
@@ -1068,7 +2083,7 @@ class mf_client():
         """
         create a namespace
         """
-        self.aterm_run('asset.namespace.create :namespace "%s"' % namespace.replace('"', '\\\"'))
+        self.call("asset.namespace.create", namespace=namespace)
 
 #------------------------------------------------------------
     def cd(self, namespace):
@@ -1079,16 +2094,23 @@ class mf_client():
 #------------------------------------------------------------
     def rm(self, fullpath, prompt=None):
         """
-        remove a file pattern
+        remove a file pattern (or a LIST of patterns, which are counted and removed concurrently)
         """
-        query = self.get_query(fullpath)
-        if 'and name' not in query:
-            raise Exception("Use rmdir for folders")
+        if isinstance(fullpath, str):
+            fullpath = [fullpath]
+        queries = []
+        for item in fullpath:
+            query = self.get_query(item)
+            if 'and name' not in query.get('where', ''):
+                raise Exception("Use rmdir for folders")
+            queries.append(query)
 
 # get the number of items to delete 
-        reply = self.aterm_run('asset.query %s :action count' % query, background=True)
-        elem = reply.find(".//value")
-        count = int(elem.text)
+        jobs = [self.call("asset.query", action="count", background=True, wait=False, **query) for query in queries]
+        count = 0
+        for reply in self.wait(jobs):
+            elem = reply.find(".//value")
+            count += int(elem.text)
         if count == 0:
             raise Exception("Nothing to delete")
 # query to confirm removal
@@ -1096,7 +2118,8 @@ class mf_client():
             if prompt("Delete %d files (y/n): " % count) is False:
                 return False
         self.logging.info("Destroy confirmed.")
-        self.aterm_run('asset.query %s :action pipe :service -name asset.destroy' % query, background=True, show_progress=True)
+        jobs = [self.call("asset.query", action="pipe", service={'@name':'asset.destroy'}, background=True, show_progress=True, wait=False, **query) for query in queries]
+        self.wait(jobs)
         print("")
         return True
 
@@ -1105,10 +2128,18 @@ class mf_client():
         """
         information on a named file or folder
         """
-        if self.namespace_exists(fullpath):
+# namespace and asset lookups are independent - so fetch them in a single round trip
+        with self.batch() as batch:
+            batch.call("asset.namespace.exists", namespace=fullpath)
+            batch.call("asset.get", id="path=%s" % fullpath)
+            batch.call("asset.content.status", id="path=%s" % fullpath)
+            if fullpath.startswith('/projects/'):
+                batch.call("asset.label.exists", id="path=%s" % fullpath, label="PUBLISHED")
+
+        if self._xml_xpath_boolean(".//exists", batch.result(0)) is True:
             self.logging.info("Namespace exists")
             yield "%20s : %s" % ('namespace', fullpath) 
-            xml_reply = self.aterm_run('asset.namespace.describe :namespace %s' % fullpath, background=True)
+            xml_reply = self.call("asset.namespace.describe", namespace=fullpath, background=True)
             elem = xml_reply.find(".//namespace/ctime")
             if elem is not None:
                 yield "%20s : %s" % ('ctime', elem.text) 
@@ -1125,7 +2156,7 @@ class mf_client():
 #                query = "namespace>='%s'" % fullpath
 #                xml_reply = self.aterm_run('asset.query :where "%s" :count true :action sum :xpath content/size' % query, background=True)
 # july 2024 - performance improvement
-                xml_reply = self.aterm_run('asset.query :namespace "%s" :count true :action sum :xpath content/size' % fullpath, background=True)
+                xml_reply = self.call("asset.query", namespace=fullpath, count=True, action="sum", xpath="content/size", background=True)
                 elem = xml_reply.find(".//value")
                 if elem is not None:
                     yield "%20s : %s" % ('usage', self.human_size(elem.text))
@@ -1134,7 +2165,7 @@ class mf_client():
             try:
 # get asset information, if it exists
 # TODO (maybe) - redo to allow patterns ... 
-                result = self.aterm_run('asset.get :id "path=%s"' % fullpath)
+                result = batch.result(1)
                 elem = result.find(".//asset")
                 yield "%20s : %s" % ('asset', elem.attrib['id'])
                 xpath_list = [".//asset/path", ".//asset/ctime", ".//asset/type", ".//content/csum"]
@@ -1148,14 +2179,14 @@ class mf_client():
                     yield "%20s : %s" % ('size', self.human_size(elem.text))
 
 # get content status 
-                result = self.aterm_run('asset.content.status :id "path=%s"' % fullpath)
+                result = batch.result(2)
                 elem = result.find(".//asset/state")
                 if elem is not None:
                     yield "%20s : %s" % (elem.tag, elem.text)
 
 # published (public URL)
                 if fullpath.startswith('/projects/'):
-                    result = self.aterm_run('asset.label.exists :id "path=%s" :label PUBLISHED' % fullpath)
+                    result = batch.result(3)
                     elem = result.find(".//exists")
                     if elem is not None:
                         if 'true' in elem.text.lower():
@@ -1175,28 +2206,27 @@ class mf_client():
 # yield folders first (only if pattern is a folder)
 # NB: mediaflux quirk - can't pattern match against namespaces (only assets/files)
         if self.namespace_exists(pattern):
-            reply = self.aterm_run('asset.namespace.list :namespace %s' % pattern)
-            ns_list = reply.findall('.//namespace/namespace')
-            for ns in ns_list:
+            for ns in self.call_iter("asset.namespace.list", "namespace", parent="namespace", namespace=pattern):
                 yield "[folder] %s" % ns.text
 
 # yield all matching assets 
         query = self.get_query(pattern)
-        result = self.aterm_run('asset.query %s :as iterator :action get-values :xpath -ename id id :xpath -ename name name :xpath -ename size content/size' % query)
+        xpath = [{'@ename':'id', '#text':'id'}, {'@ename':'name', '#text':'name'}, {'@ename':'size', '#text':'content/size'}]
+        result = self.call("asset.query", as_="iterator", action="get-values", xpath=xpath, **query)
 
         elem = result.find(".//iterator")
         iterator = int(elem.text)
 
-        iterate_size = 100
+# replies are streamed, so larger chunks cost fewer round trips without holding the whole chunk in memory
+        iterate_size = 1000
         complete = "false"
         while complete != "true":
-            result = self.aterm_run("asset.query.iterate :id %d :size %d" % (iterator, iterate_size))
-            elem = result.find(".//iterated")
-            if elem is not None:
-                complete = elem.attrib['complete'].lower()
-            self.logging.debug("asset query iterator chunk [%d] - complete[%s]" % (iterator, complete))
+            for elem in self.call_iter("asset.query.iterate", ("asset", "iterated"), id=iterator, size=iterate_size):
+                if elem.tag == "iterated":
+                    complete = elem.attrib['complete'].lower()
+                    self.logging.debug("asset query iterator chunk [%d] - complete[%s]" % (iterator, complete))
+                    continue
 # parse the asset results
-            for elem in result.findall(".//asset"):
                 asset_id = '?'
                 name = '?'
                 size = '?'
@@ -1227,18 +2257,18 @@ class mf_client():
 #------------------------------------------------------------
     def get_query(self, fullpath_pattern, recurse=False):
         """
-        Query helper function
+        Query helper function, returns the asset.query arguments (as a DICT for call()) that select the pattern
         """
         if self.namespace_exists(fullpath_pattern):
             if recurse is True:
 # NEW - reworked for better perf
-                query = ":namespace '%s'" % fullpath_pattern
+                query = {'namespace': fullpath_pattern}
             else:
-                query = ":where \"namespace='%s'\"" % fullpath_pattern
+                query = {'where': "namespace='%s'" % fullpath_pattern}
         else:
             pattern = posixpath.basename(fullpath_pattern)
             namespace = posixpath.dirname(fullpath_pattern)
-            query = ":where \"namespace='%s' and name='%s'\"" % (namespace, pattern)
+            query = {'where': "namespace='%s' and name='%s'" % (namespace, pattern)}
 
         return(query)
 
@@ -1246,13 +2276,20 @@ class mf_client():
 # TODO - more fine-grained access (eg downloadable with password)
     def publish(self, fullpath_pattern):
         """
-        For all assets that match the pattern, generate publicly downloadable URLs
+        For all assets that match the pattern (or a LIST of patterns), generate publicly downloadable URLs
         """
+        if isinstance(fullpath_pattern, str):
+            fullpath_pattern = [fullpath_pattern]
         try:
-            query = self.get_query(fullpath_pattern, recurse=True)
-            reply = self.aterm_run('asset.query %s :count true :action pipe :service -name asset.label.add < :label PUBLISHED >' % query, background=True)
-            elem = reply.find(".//count")
-            return(int(elem.text))
+            jobs = []
+            for item in fullpath_pattern:
+                query = self.get_query(item, recurse=True)
+                jobs.append(self.call("asset.query", count=True, action="pipe", service={'@name':'asset.label.add', 'label':'PUBLISHED'}, background=True, wait=False, **query))
+            count = 0
+            for reply in self.wait(jobs):
+                elem = reply.find(".//count")
+                count += int(elem.text)
+            return count
         except Exception as e:
             self.logging.debug(str(e))
         return 0
@@ -1260,35 +2297,58 @@ class mf_client():
 #------------------------------------------------------------
     def unpublish(self, fullpath_pattern):
         """
-        For all assets that match the pattern, remove and publicly downloadable URLs
+        For all assets that match the pattern (or a LIST of patterns), remove and publicly downloadable URLs
         """
+        if isinstance(fullpath_pattern, str):
+            fullpath_pattern = [fullpath_pattern]
         try:
-            query = self.get_query(fullpath_pattern, recurse=True)
-            reply = self.aterm_run('asset.query %s :count true :action pipe :service -name asset.label.remove < :label PUBLISHED >' % query, background=True)
-            elem = reply.find(".//count")
-            return(int(elem.text))
+            jobs = []
+            for item in fullpath_pattern:
+                query = self.get_query(item, recurse=True)
+                jobs.append(self.call("asset.query", count=True, action="pipe", service={'@name':'asset.label.remove', 'label':'PUBLISHED'}, background=True, wait=False, **query))
+            count = 0
+            for reply in self.wait(jobs):
+                elem = reply.find(".//count")
+                count += int(elem.text)
+            return count
         except Exception as e:
             self.logging.debug(str(e))
         return 0
 
 #------------------------------------------------------------
-    def get_iter(self, fullpath_pattern):
+    def get_iter(self, fullpath_pattern, cb_message=None):
         """
         Creates an iterator for get() file candidates based on an input pattern
 
         Args:
             fullpath_pattern: a STRING giving the search pattern for files
+                  cb_message: a FUNCTION which is called with each line of the recall plan, to show the user
 
         Returns:
             First - the total file count that matched the pattern
             Second - the total bytes of all the files that were matched
-            Thereafter - the file names of all the matches
+            Thereafter - an mf_asset record (id, path, size, checksum and content state) for each match, once its content is online
         """
         try:
 # count download results and get total size
             query = self.get_query(fullpath_pattern, recurse=True)
-# get the number of results and total size
-            reply = self.aterm_run('asset.query %s :count true :action sum :xpath content/size' % query, background=True, show_progress=True)
+# get the number of results and total size (in the background, while the iterator is set up)
+            job = self.call("asset.query", count=True, action="sum", xpath="content/size", background=True, show_progress=True, wait=False, **query)
+        except Exception as e:
+            raise FileNotFoundError()
+
+# get the file list as an iterator (NB: with the values get() needs, so it doesn't have to look each asset up again)
+        try:
+            xpath = [{'@ename':'id', '#text':'id'}, {'@ename':'namespace', '#text':'namespace'}, {'@ename':'name', '#text':'name'}, {'@ename':'size', '#text':'content/size'}, {'@ename':'csum', '#text':'content/csum'}, {'@ename':'store', '#text':'content/store'}, {'@ename':'url', '#text':'content/url'}]
+            result = self.call("asset.query", as_="iterator", action="get-values", xpath=xpath, **query)
+            elem = result.find(".//iterator")
+            iterator = elem.text
+        except Exception as e:
+            self.logging.error(str(e))
+            iterator = None
+
+        try:
+            reply = job.result()
             elem = reply.find(".//value")
 # must return valid ints (NB: mflux will return empty space rather than 0 if no query match)
             total_bytes = int(elem.text)
@@ -1298,85 +2358,137 @@ class mf_client():
         except Exception as e:
             raise FileNotFoundError()
 
-# get the file list as an iterator
+        if iterator is None:
+            return
+
+# recall pipeline - keep up to recall_window assets recalling (in tape order) and yield each one as soon as its content is online
+        recalling = {}
+        exhausted = False
+        interval = self.recall_poll_min
         try:
-            result = self.aterm_run('asset.query %s :as iterator :action get-path' % query)
-            elem = result.find(".//iterator")
-            iterator = elem.text
+            source = self._recall_schedule(self._iterate_assets(iterator), cb_message=cb_message)
+            while self.enable_polling:
+# top up the window, content that is already online is yielded without a recall
+                space = self.recall_window - len(recalling)
+                if exhausted is False and space > 0:
+                    batch = {}
+                    while len(batch) < space:
+                        asset = next(source, None)
+                        if asset is None:
+                            exhausted = True
+                            break
+                        if asset.ready() is True:
+                            yield asset
+                        else:
+                            batch[asset.id] = asset
+                    if len(batch) > 0:
+                        self.logging.info("Recall batch count: %d" % len(batch))
+                        self.call("asset.content.migrate", destination="online", id=list(batch.keys()))
+                        recalling.update(batch)
+
+                if len(recalling) == 0:
+                    if exhausted is True:
+                        return
+                    continue
+
+# poll quickly while content is arriving, back off while it isn't
+                with metrics.tracer.span("recall wait", "recall", count=len(recalling)):
+                    time.sleep(interval)
+                ready = self._recall_poll(recalling)
+                for asset in ready:
+                    yield asset
+                if len(ready) > 0:
+                    interval = self.recall_poll_min
+                else:
+                    interval = min(2 * interval, self.recall_poll_max)
+
+# recall + polling loop 
         except Exception as e:
             self.logging.error(str(e))
             return
 
-# effectively the recall batch size
-#        iterate_size = 100
-        iterate_size = 50
-        iterate = True
+#------------------------------------------------------------
+    def _iterate_assets(self, iterator, size=100):
+        """
+        Yield an mf_asset record for each result of a get_iter() asset.query iterator
+        """
+        complete = "false"
+        while complete != "true":
+# NB: each page is read in full, so a connection isn't held while the consumer waits on recalls
+            page = []
+            for elem in self.call_iter("asset.query.iterate", ("asset", "iterated"), id=iterator, size=size):
+                if elem.tag == "iterated":
+                    complete = elem.attrib['complete'].lower()
+                    continue
+                values = {child.tag: child.text for child in elem}
+                page.append(mf_asset(values['id'], posixpath.join(values['namespace'], values['name'] or ""), values.get('size'), values.get('csum'), store=values.get('store'), url=values.get('url')))
+            for asset in page:
+                yield asset
 
-        try:
-            while iterate:
-                xml_batch = self.aterm_run("asset.query.iterate :id %s :size %d" % (iterator, iterate_size))
-# setup recall and polling for current batch
-                hash_path = {}
-                hash_done = {}
-                polling_ids = ""
-                count = 0
-                for elem in xml_batch.findall(".//path"):
-                    elem_id = elem.attrib['id']
-                    hash_path[elem_id] = elem.text
-                    hash_done[elem_id] = False
-                    polling_ids += " :id %d" % int(elem_id)
-                    count += 1
-# flag termination if this batch is marked as the last 
-                elem = xml_batch.find(".//iterated")
-                if elem is not None:
-                    if 'true' in elem.attrib['complete']:
-                        iterate = False
-# technically, shouldn't happen
-                if count == 0:
-                    self.logging.warning("Nothing to recall")
-                    return
+#------------------------------------------------------------
+    def _recall_schedule(self, assets, page_size=1000, cb_message=None):
+        """
+        Order get_iter() assets for recall, a page at a time - online content in the page is yielded first, then its offline content grouped by store
+        and ordered by its location in the store, so migrate requests follow the order the content was written (fewer tape mounts and seeks)
+        Pages are scheduled as they arrive, so recalls start (and overlap with downloads) without scanning every match first
+        NB: Mediaflux doesn't expose tape volumes or offsets, the content URL folder and asset ID (ingest order) stand in for them
+        The plan for each page is logged and (if given) passed to cb_message
+        """
+        page = {}
+        for asset in itertools.chain(assets, [None]):
+            if asset is not None:
+                page[asset.id] = asset
+            if len(page) < page_size and (asset is not None or len(page) == 0):
+                continue
+            for ready in self._recall_poll(page):
+                yield ready
+            offline = sorted(page.values(), key=lambda asset: (asset.store or "", posixpath.dirname(asset.url or ""), int(asset.id)))
+            page = {}
+            if len(offline) == 0:
+                continue
+# expected recall batches (per store) for this page, before any of it is recalled
+            stores = {}
+            for item in offline:
+                count, size = stores.get(item.store, (0, 0))
+                stores[item.store] = (count + 1, size + item.size)
+            plan = ["Recall plan: %d offline files in %d batches of up to %d" % (len(offline), math.ceil(len(offline) / self.recall_window), self.recall_window)]
+            for store, (count, size) in stores.items():
+                plan.append("Recall plan: store=%s, %d files, %s" % (store, count, metrics.registry.human_size(size)))
+            for line in plan:
+                self.logging.info(line)
+                if cb_message is not None:
+                    cb_message(line)
+            for item in offline:
+                yield item
 
-# issue the recall command for current batch
-                self.logging.info("Recall batch count: %d" % count)
-                self.aterm_run('asset.content.migrate :destination online %s' % polling_ids)
-
-# technically, could check for status first ... but simpler logic to recall all
-# poll this batch
-                polling = True
-                while polling:
-                    self.logging.info("Polling %s" % polling_ids)
-                    xml_poll = self.aterm_run("asset.content.status %s" % polling_ids)
-                    for item in xml_poll.findall(".//asset"):
-                        elem_id = item.attrib['id']
-                        state = item.find(".//state")
+#------------------------------------------------------------
+    def _recall_poll(self, assets):
+        """
+        Check the content status of a DICT (by ID) of assets, removing and returning a LIST of those that are online (or reachable)
+        Assets with content that can't be recovered are removed and skipped
+        """
+        ready = []
+        if len(assets) == 0:
+            return ready
+        self.logging.debug("Polling %r" % list(assets.keys()))
+        xml_poll = self.call("asset.content.status", id=list(assets.keys()))
+        for item in xml_poll.findall(".//asset"):
+            asset = assets.get(item.attrib['id'])
+            if asset is None:
+                continue
+            state = item.find(".//state")
 # known states: online, online+offline, offline, invalid, reachable, unreachable
 # the last 2 are for externally referenced content (not managed by mflux)
-                        if state is not None:
-# if available - yield for downloading
-                            if 'online' in state.text or 'reachable' in state.text:
-                                self.logging.info("Content ready, id=%s" % elem_id)
-                                hash_done[elem_id] = True
-                                yield hash_path[elem_id]
+            asset.state = state.text if state is not None else None
+            if asset.state is None or 'unreachable' in asset.state or 'invalid' in asset.state:
 # skip non-recoverable content - eg unreachable url, unmounted asset store, etc
-                            if 'unreachable' in state.text or 'invalid' in state.text:
-                                self.logging.error("Skipping id=%s, state=%s" % (elem_id, state.text))
-                                hash_done[elem_id] = True
-
-# rebuild polling list and flag exit if nothing left
-                    polling_ids = ""
-                    polling = False
-                    for key in hash_done.keys():
-                        if hash_done[key] is False:
-                            polling_ids += " :id %s" % key
-                            polling = True
-
-                    if polling is True:
-                        time.sleep(30)
-
-# recall + polling loop 
-        except Exception as e:
-            self.logging.error(str(e))
-            return
+                self.logging.error("Skipping id=%s, state=%s" % (asset.id, asset.state or "no content"))
+                del assets[asset.id]
+            elif asset.ready() is True:
+                self.logging.info("Content ready, id=%s" % asset.id)
+                ready.append(asset)
+                del assets[asset.id]
+        return ready
 
 #------------------------------------------------------------
 # get_iter() should have already brought the file online; but testing reachability of external content is possibly still useful
@@ -1384,7 +2496,7 @@ class mf_client():
         recall = True
         while self.enable_polling:
             try:
-                xml_reply = self.aterm_run('asset.content.status :id "path=%s"' % remote_filepath, background=True)
+                xml_reply = self.call("asset.content.status", id="path=%s" % remote_filepath, background=True)
                 elem = xml_reply.find(".//asset/state")
                 if elem is None:
                     self.logging.error("No content found for asset")
@@ -1394,7 +2506,7 @@ class mf_client():
 # limited visibility on externally managed content - do a small test
                 if "reachable" in elem.text:
                     self.logging.info("Verifying external content: %s" % remote_filepath)
-                    xml_reply = self.aterm_run('asset.content.hexdump :id "path=%s" :length 1' % remote_filepath, background=True)
+                    xml_reply = self.call("asset.content.hexdump", id="path=%s" % remote_filepath, length=1, background=True)
                     return True
             except Exception as e:
                 self.logging.error(str(e))
@@ -1403,9 +2515,10 @@ class mf_client():
 # issue recall command
             if recall is True:
                 self.logging.info("Issuing recall for: %s" % remote_filepath)
-                self.aterm_run('asset.content.migrate :destination online :id "path=%s"' % remote_filepath, background=True)
+                self.call("asset.content.migrate", destination="online", id="path=%s" % remote_filepath, background=True)
                 recall = False
-            time.sleep(30)
+            with metrics.tracer.span("recall wait", "recall", path=remote_filepath):
+                time.sleep(30)
 
         return False
 
@@ -1415,7 +2528,7 @@ class mf_client():
         Download a remote file to the current working directory
 
         Args:
-            filepath: a STRING representing the full path and filename of the remote file
+            filepath: a STRING representing the full path and filename of the remote file (or an mf_asset record from get_iter)
             local_filepath: a STRING representing the local destination for the download
             cb_progress: a FUNCTION which may be repeatedly called with a single argument for the number of bytes (non-cummulative) successfully recieved 
             overwrite: a BOOLEAN indicating the action to take if a local copy already exists
@@ -1427,72 +2540,172 @@ class mf_client():
             An error on failure
         """
 
+        if isinstance(remote_filepath, mf_asset):
+            asset = remote_filepath
+        else:
+            elem = self.call("asset.get", id="path=%s" % remote_filepath).find(".//asset")
+            asset = mf_asset(elem.attrib['id'], remote_filepath, elem.findtext("content/size"), elem.findtext("content/csum"))
+        remote_filepath = asset.path
+        asset_id = asset.id
+        size = asset.size
+        csum = asset.csum
         if local_filepath is None:
             local_filepath = os.path.join(os.getcwd(), posixpath.basename(remote_filepath))
+        remote_filename = posixpath.basename(remote_filepath)
 
+# NB: a local file of a different size is an incomplete copy, not a skip
         if os.path.isfile(local_filepath) and not overwrite:
-            self.logging.info("Already exists, skipping: %s" % local_filepath)
-            cb_progress(os.path.getsize(local_filepath))
-            return(-1)
-        else:
-            self.logging.info("Downloading remote file: %s" % remote_filepath)
-            remote_filename = os.path.basename(remote_filepath)
+            if os.path.getsize(local_filepath) == size:
+                self.logging.info("Already exists, skipping: %s" % local_filepath)
+                if cb_progress is not None:
+                    cb_progress(size)
+                return(-1)
+            self.logging.info("Size mismatch, downloading again: %s" % local_filepath)
+
+        self.logging.info("Downloading remote file: %s" % remote_filepath)
 
 # Windows path names and the posix lexer in aterm_run() are not good friends
-            if "Windows" in platform.system():
-                local_filepath = local_filepath.replace("\\", "\\\\")
+        if "Windows" in platform.system():
+            local_filepath = local_filepath.replace("\\", "\\\\")
 
 # make any intermediate folders required ...
-            local_parent = os.path.dirname(local_filepath)
-            if os.path.exists(local_parent) is False:
-                self.logging.info("Creating required local folder(s): [%s]" % local_parent)
-                os.makedirs(local_parent, exist_ok=True)
-
-# download only when file is online 
-            if self._wait_until_online(remote_filepath) is True:
-                xml_reply = self.aterm_run('asset.get :id "path=%s"' % remote_filepath)
-                elem = xml_reply.find(".//asset")
-                asset_id = elem.attrib['id']
-
-# try to open the content URL
-                try:
-                    url = self.data_get + "?_skey={0}&id={1}".format(self.session, asset_id)
-                    request = urllib.request.Request(url)
-                    response = urllib.request.urlopen(request)
-                except Exception as e:
-                    self.logging.debug(str(e))
-                    print("")
-                    self.logging.error("Bad content URL: %s" % remote_filename)
-#                    raise Exception("Download failed")
-                    raise IOError()
-
-# buffered write to open file
-                with open(local_filepath, 'wb') as output:
-                    while self.enable_polling:
-
-# handle interruption to data stream
-                        try:
-                            data = response.read(self.get_buffer)
-                        except Exception as e:
-                            self.logging.debug(str(e))
-                            self.logging.error("Content read interrupted: %s" % remote_filename)
-                            raise IOError()
-#                            raise Exception("Download failed")
-
-                        if data:
-                            output.write(data)
-                            if cb_progress is not None:
-                                cb_progress(len(data))
-                        else:
-                            return(0)
-            else:
-                raise Exception("Online recall failed for: %s" % remote_filename)
+        local_parent = os.path.dirname(local_filepath)
+        if os.path.exists(local_parent) is False:
+            self.logging.info("Creating required local folder(s): [%s]" % local_parent)
+            os.makedirs(local_parent, exist_ok=True)
+
+# download only when file is online (NB: get_iter() records are only yielded once online)
+        if (asset.state is None or "online" not in asset.state) and self._wait_until_online(remote_filepath) is False:
+            raise Exception("Online recall failed for: %s" % remote_filename)
+
+# content goes into a .part file that is renamed once complete
+        url = self.data_get + "?_skey={0}&id={1}".format(self.session, asset_id)
+        part_filepath = local_filepath + ".part"
+# only large files are worth continuing if a previous download of the same content was interrupted, smaller ones start again
+        state_filepath = None
+        chunk = None
+        if size >= self.get_threshold:
+# large files are downloaded as concurrent byte ranges (NB: requires os.pwrite, so not on windows)
+            if self.get_streams > 1 and hasattr(os, 'pwrite'):
+                chunk = self.get_chunk
+            state_filepath, state = self._get_partial(part_filepath, asset_id, size, csum, chunk)
+        elif os.path.isfile(part_filepath):
+            os.remove(part_filepath)
+        try:
+            done = False
+            if chunk is not None:
+                done = self._get_segmented(url, part_filepath, state_filepath, state, cb_progress)
+                if done is False:
+                    self.logging.info("Range requests not supported, downloading as a single stream: %s" % remote_filename)
+                    state_filepath, state = self._get_partial(part_filepath, asset_id, size, csum, None, restart=True)
+            if done is False:
+                self._get_stream(url, part_filepath, size, cb_progress)
+            if os.path.getsize(part_filepath) != size:
+                raise IOError("Downloaded %d of %d bytes: %s" % (os.path.getsize(part_filepath), size, remote_filename))
+        except Exception as e:
+            self.logging.debug(str(e))
+            self.logging.error("Content read interrupted: %s" % remote_filename)
+# don't leave partial content that won't be continued in the destination
+            if state_filepath is None and os.path.isfile(part_filepath):
+                os.remove(part_filepath)
+            raise IOError(str(e))
+
+        os.replace(part_filepath, local_filepath)
+        if state_filepath is not None:
+            os.remove(state_filepath)
+        return(0)
+
+#------------------------------------------------------------
+    def _get_partial(self, part_filepath, asset_id, size, csum, chunk, restart=False):
+        """
+        Return the saved state of an interrupted download of the same content (asset, size and checksum) into part_filepath, otherwise a new download
+        NB: the state is kept in get_resume_dir, not next to the download
+        """
+        key = "%s|%s" % (self.server, os.path.abspath(part_filepath))
+        state_filepath = os.path.join(self.get_resume_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+        if restart is False:
+            try:
+                with open(state_filepath) as f:
+                    state = json.load(f)
+                if [state['id'], state['size'], state['csum'], state['chunk']] == [asset_id, size, csum, chunk] and os.path.isfile(part_filepath):
+                    return state_filepath, state
+            except Exception as e:
+                self.logging.debug("No partial download to continue: %s" % str(e))
+        if os.path.isfile(part_filepath):
+            os.remove(part_filepath)
+        state = {'id': asset_id, 'size': size, 'csum': csum, 'chunk': chunk, 'done': []}
+        self._resume_save(state_filepath, state)
+        return state_filepath, state
+
+#------------------------------------------------------------
+    def _get_stream(self, url, part_filepath, size, cb_progress=None):
+        """
+        Download content as a single stream, continuing from the current length of part_filepath with a Range request
+        """
+        offset = 0
+        if os.path.isfile(part_filepath):
+            offset = os.path.getsize(part_filepath)
+        if offset > size:
+            offset = 0
+        request = urllib.request.Request(url)
+        if 0 < offset < size:
+            request.add_header('Range', "bytes=%d-" % offset)
+
+        start_time = time.perf_counter()
+        received = 0
+        try:
+            if offset < size or size == 0:
+                response = urllib.request.urlopen(request)
+                if offset > 0 and response.status != 206:
+                    self.logging.info("Range requests not supported, restarting download")
+                    offset = 0
+            if offset > 0 and cb_progress is not None:
+                self.logging.info("Continuing download from %d bytes" % offset)
+                cb_progress(offset)
+
+            stream = self.get_tuner.stream()
+            with open(part_filepath, 'ab' if offset > 0 else 'wb') as output:
+                while offset + received < size or size == 0:
+                    if self.enable_polling is False:
+                        raise Exception("Download interrupted")
+                    data = response.read(stream.size)
+                    if not data:
+                        break
+                    output.write(data)
+                    received += len(data)
+                    stream.update(len(data))
+                    if cb_progress is not None:
+                        cb_progress(len(data))
+        except Exception as e:
+            metrics.registry.record("download", time.perf_counter() - start_time, bytes_in=received, error=True, category="transfer")
+            raise
+        metrics.registry.record("download", time.perf_counter() - start_time, bytes_in=received, category="transfer")
 
-# should only occur if polling was turned off (eg ctrl-c)
-        raise Exception("Download failed: %s" % remote_filename)
+#------------------------------------------------------------
+    def put_index(self, namespace):
+        """
+        Fetch the ID, size and checksum of every asset in a namespace with one iterated query, so put() can make its skip/overwrite decisions locally
+        Returns the number of assets indexed
+        """
+        index = {}
+        if self.namespace_exists(namespace) is True:
+            xpath = [{'@ename':'id', '#text':'id'}, {'@ename':'name', '#text':'name'}, {'@ename':'size', '#text':'content/size'}, {'@ename':'crc32', '#text':'content/csum'}]
+            result = self.call("asset.query", where="namespace='%s'" % self.escape_single_quotes(namespace), as_="iterator", action="get-values", xpath=xpath)
+            iterator = int(result.find(".//iterator").text)
+            complete = "false"
+            while complete != "true":
+                for elem in self.call_iter("asset.query.iterate", ("asset", "iterated"), id=iterator, size=1000):
+                    if elem.tag == "iterated":
+                        complete = elem.attrib['complete'].lower()
+                        continue
+                    values = {child.tag: child.text for child in elem}
+                    if values.get('name') is not None:
+                        index[values['name']] = {'id': values.get('id'), 'size': values.get('size'), 'crc32': values.get('crc32')}
+        self.remote_index[namespace] = index
+        return len(index)
 
 #------------------------------------------------------------
-    def put(self, namespace, filepath, cb_progress=None, metadata=False, overwrite=True):
+    def put(self, namespace, filepath, cb_progress=None, metadata=False, overwrite=True, verify=False, compare=True):
         """
         Creates a new asset on the Mediaflux server and uploads from a local filepath to supply its content
 
@@ -1500,11 +2713,13 @@ class mf_client():
             namespace: a STRING representing the remote destination in which to create the asset
              filepath: a STRING giving the absolute path and name of the local file
           cb_progress: a FUNCTION which may be repeatedly called with a single argument for the number of bytes (non-cummulative) successfully sent 
-             metadata: a BOOLEAN indicating that filepath plus ".meta" should contain metadata
+             metadata: a BOOLEAN indicating that filepath plus ".meta" should contain metadata (sent in the same request as the content)
             overwrite: a BOOLEAN indicating action if remote copy exists
+              compare: a BOOLEAN indicating an existing remote copy of the same size should be skipped (False if the file is known to have changed)
+               verify: a BOOLEAN indicating the crc32 of the content sent should be checked against the server's checksum (re-uploading up to verify_retries times on a mismatch)
 
         Returns:
-            0 on success or -1 if the file was skipped 
+            an mf_asset record of the uploaded asset (csum is the crc32 computed while sending, if verified) or -1 if the file was skipped 
 
         Raises:
             An error message if unsuccessful
@@ -1512,47 +2727,410 @@ class mf_client():
 
 # construct destination arguments
         filename = os.path.basename(filepath)
-        filename = self._xml_sanitise(filename)
-        namespace = self._xml_sanitise(namespace)
         remotepath = posixpath.join(namespace, filename)
         asset_id = None
-# find remote asset ID, if exists 
-        result = self.aterm_run('asset.get :id -only-if-exists true "path=%s" :xpath -ename id id :xpath -ename crc32 content/csum :xpath -ename size content/size' % remotepath)
-        xml_id = result.find(".//id")
-        if xml_id is None:
+        crc = None
+# metadata goes in the asset.create/asset.set request, so the asset never exists without it
+        args = {}
+        if metadata is True:
+            args = self.metadata_args(filepath + ".meta")
+# find remote asset ID and size, if exists (from the pre-scanned index if there is one)
+        index = self.remote_index.get(namespace)
+        if index is not None:
+            existing = index.get(filename)
+        else:
+            xpath = [{'@ename':'id', '#text':'id'}, {'@ename':'crc32', '#text':'content/csum'}, {'@ename':'size', '#text':'content/size'}]
+            result = self.call("asset.get", id={'@only-if-exists':True, '#text':"path=%s" % remotepath}, xpath=xpath)
+            existing = None
+            xml_id = result.find(".//id")
+            if xml_id is not None:
+                xml_size = result.find(".//size")
+                existing = {'id': xml_id.text, 'size': xml_size.text if xml_size is not None else None}
+        if existing is None:
 # not found, create as new
             self.logging.debug("Creating new file: %s" % remotepath)
-            xml_string = '<request><service name="service.execute" session="%s"><args><service name="asset.create">' % self.session
-            xml_string += '<namespace create="true">%s</namespace><name>%s</name></service></args></service></request>' % (namespace, filename)
-            asset_id = self._post_multipart_buffered(xml_string, filepath, cb_progress=cb_progress)
+            if self.resume_threshold > 0 and os.path.getsize(filepath) >= self.resume_threshold:
+                asset_id, crc = self._put_large(namespace, filepath, cb_progress=cb_progress, verify=verify, args=args)
+            else:
+                asset_id, crc = self._put_content(namespace, filepath, cb_progress=cb_progress, verify=verify, args=args)
         else:
 # found, overwrite?
             if overwrite is False:
                 self.logging.debug("Skip existing file: %s" % remotepath)
                 return(-1)
 # if overwriting, check size first
-            asset_id = int(xml_id.text)
+            asset_id = int(existing['id'])
             remote_size = 0
-            xml_size = result.find(".//size")
-            if xml_size is not None:
-                if xml_size.text is not None:
-                    remote_size = int(xml_size.text)
+            if existing['size'] is not None:
+                remote_size = int(existing['size'])
 # if sizes match (checksum compare is excrutiatingly slow) don't overwrite
             local_size = int(os.path.getsize(filepath))
-            if remote_size == local_size:
+            if compare is True and remote_size == local_size:
                 self.logging.debug("Skip matching file: %s" % remotepath)
                 return(-1)
             else:
                 self.logging.debug("Uploading new content for asset=%d: [%s] -> [%s]" % (asset_id, filepath, remotepath))
-                xml_string = '<request><service name="service.execute" session="%s"><args><service name="asset.set">' % self.session
-                xml_string += '<id>%d</id></service></args></service></request>' % asset_id
-                asset_id = self._post_multipart_buffered(xml_string, filepath, cb_progress=cb_progress)
+                if self.resume_threshold > 0 and local_size >= self.resume_threshold:
+                    asset_id, crc = self._put_large(namespace, filepath, asset_id=asset_id, cb_progress=cb_progress, verify=verify, args=args)
+                else:
+                    asset_id, crc = self._put_content(namespace, filepath, asset_id=asset_id, cb_progress=cb_progress, verify=verify, args=args)
 
-# if required, search for associated metadata file to import
-        if metadata is True and asset_id is not None:
-            self.import_metadata(asset_id, filepath + ".meta")
+        return mf_asset(str(asset_id), remotepath, os.path.getsize(filepath), "%08X" % crc if crc is not None else None)
 
-        return(0)
+#------------------------------------------------------------
+    def _put_content(self, namespace, filepath, asset_id=None, cb_progress=None, verify=False, args={}):
+        """
+        Upload a file as a new asset (or the new content of asset_id), optionally checking the crc32 computed while sending against the server's checksum
+        args are any extra asset.create/asset.set arguments (eg metadata)
+        Returns the asset ID and the crc32 (None if not verified)
+        """
+        attempts = 1
+        if verify is True:
+            attempts += self.verify_retries
+        for attempt in range(attempts):
+            if asset_id is None:
+                xml_string = self.call("asset.create", post=False, **dict(args, namespace={'@create':True, '#text':namespace}, name=os.path.basename(filepath))).decode()
+            else:
+                xml_string = self.call("asset.set", post=False, **dict(args, id=asset_id)).decode()
+            asset_id, crc = self._post_multipart_buffered(xml_string, filepath, cb_progress=cb_progress, checksum=verify)
+            if verify is False:
+                return asset_id, None
+            if self._verify_crc(asset_id, crc & 0xFFFFFFFF, filepath) is True:
+                return asset_id, crc & 0xFFFFFFFF
+        raise Exception("Checksum verification failed: %s" % filepath)
+
+#------------------------------------------------------------
+    def _put_large(self, namespace, filepath, asset_id=None, cb_progress=None, verify=False, args={}):
+        """
+        Resumable upload of a large file (see _put_resumable), optionally checking the crc32 of the local file against the server's checksum once complete
+        NB: chunks are sent from several streams (and maybe several sessions), so verifying costs an extra read of the file
+        Returns the asset ID and the crc32 (None if not verified)
+        """
+        attempts = 1
+        if verify is True:
+            attempts += self.verify_retries
+        crc = None
+        for attempt in range(attempts):
+            asset_id = self._put_resumable(namespace, filepath, asset_id=asset_id, cb_progress=cb_progress, args=args)
+            if verify is False:
+                return asset_id, None
+            if crc is None:
+                crc = self.get_local_checksum(filepath)
+            if self._verify_crc(asset_id, crc, filepath) is True:
+                return asset_id, crc
+        raise Exception("Checksum verification failed: %s" % filepath)
+
+#------------------------------------------------------------
+    def _verify_crc(self, asset_id, crc, filepath, reply=None):
+        """
+        True if the server's checksum of an asset's content (from reply if already fetched) matches crc, otherwise records and logs the mismatch
+        """
+        if reply is None:
+            reply = self.call("asset.get", id=asset_id, xpath={'@ename':'crc32', '#text':'content/csum'})
+        elem = reply.find(".//crc32")
+        if elem is not None and elem.text is not None and int(elem.text, 16) == crc:
+            return True
+        metrics.registry.add("verify", errors=1)
+        self.logging.warning("Checksum mismatch for asset=%s (local=%08X, remote=%s): %s" % (asset_id, crc, elem.text if elem is not None else None, filepath))
+        return False
+
+#------------------------------------------------------------
+    def _resume_filepath(self, filepath, remotepath):
+        """
+        Local file that records the server io job of a resumable upload
+        """
+        key = "%s|%s|%s" % (self.server, os.path.abspath(filepath), remotepath)
+        return os.path.join(self.resume_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+#------------------------------------------------------------
+    def _resume_save(self, state_filepath, state):
+        """
+        Atomically persist the state of a resumable upload (or download)
+        """
+        os.makedirs(os.path.dirname(state_filepath), exist_ok=True)
+        tmp_filepath = state_filepath + ".tmp"
+        with open(tmp_filepath, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_filepath, state_filepath)
+
+#------------------------------------------------------------
+    def _resume_job(self, namespace, filepath, remotepath):
+        """
+        Return the saved state of an interrupted upload of the same (unmodified) file if its server io job still exists, otherwise a new job
+        """
+        state_filepath = self._resume_filepath(filepath, remotepath)
+        info = os.stat(filepath)
+        try:
+            with open(state_filepath) as f:
+                state = json.load(f)
+            if state['size'] == info.st_size and state['mtime'] == info.st_mtime:
+                self.call("server.io.job.describe", ticket=state['ticket'])
+                self.logging.info("Resuming upload of [%s] with %d chunks already sent" % (filepath, len(state['done'])))
+                return state_filepath, state
+            self.logging.debug("Local file has changed since the interrupted upload, restarting: %s" % filepath)
+        except Exception as e:
+            self.logging.debug("No resumable upload for [%s]: %s" % (filepath, str(e)))
+
+# new server io job on the namespace's store
+        if self.namespace_exists(namespace) is False:
+            self.call("asset.namespace.create", namespace=namespace, all=True)
+        reply = self.call("asset.namespace.describe", namespace=namespace)
+        store = reply.find(".//store").text
+        reply = self.call("server.io.job.create", store="asset:%s" % store)
+        ticket = int(reply.find(".//ticket").text)
+        reply = self.call("server.io.job.describe", ticket=ticket)
+        tmpfile = reply.find(".//path").text
+        state = {'ticket': ticket, 'store': store, 'tmpfile': tmpfile, 'chunk': self.resume_chunk, 'done': [], 'size': info.st_size, 'mtime': info.st_mtime}
+        self._resume_save(state_filepath, state)
+        return state_filepath, state
+
+#------------------------------------------------------------
+    def _write_range(self, response, fd, offset, length, progress):
+        """
+        Write length bytes read from an HTTP response at offset in an open file descriptor
+        """
+        stream = self.get_tuner.stream()
+        received = 0
+        while received < length:
+            if self.enable_polling is False:
+                raise Exception("Download interrupted")
+            data = response.read(min(stream.size, length - received))
+            if not data:
+                raise IOError("Content ended after %d of %d bytes at offset %d" % (received, length, offset))
+            view = memoryview(data)
+            while len(view) > 0:
+                written = os.pwrite(fd, view, offset + received)
+                view = view[written:]
+                received += written
+                progress.update(written)
+            stream.update(len(data))
+        return received
+
+#------------------------------------------------------------
+    def _get_range(self, url, fd, offset, length, progress):
+        """
+        Download length bytes of content from offset with an HTTP Range request
+        Returns False (and nothing is written) if the server ignored the range
+        """
+        start_time = time.perf_counter()
+        received = 0
+        try:
+            request = urllib.request.Request(url, headers={'Range': "bytes=%d-%d" % (offset, offset + length - 1)})
+            with urllib.request.urlopen(request) as response:
+                if response.status != 206:
+                    return False
+                received = self._write_range(response, fd, offset, length, progress)
+        except Exception as e:
+            metrics.registry.record("download [range]", time.perf_counter() - start_time, bytes_in=received, error=True, category="transfer")
+            raise
+        metrics.registry.record("download [range]", time.perf_counter() - start_time, bytes_in=received, category="transfer")
+        return True
+
+#------------------------------------------------------------
+    def _get_segmented(self, url, part_filepath, state_filepath, state, cb_progress=None):
+        """
+        Download content as byte ranges, up to get_streams at once (each on its own connection), written in place to a preallocated local file
+        Each completed range is recorded in the download state, so an interrupted download continues from there
+        Returns False if the server does not support range requests
+        """
+        size = state['size']
+        chunk = state['chunk']
+        pending = [offset for offset in range(0, size, chunk) if offset not in state['done']]
+# count content already downloaded
+        if cb_progress is not None and len(state['done']) > 0:
+            cb_progress(sum([min(chunk, size - offset) for offset in state['done']]))
+        lock = threading.Lock()
+        errors = []
+        ignored = []
+
+        def receiver():
+            progress = mf_progress(cb_progress)
+            while True:
+                with lock:
+                    if len(pending) == 0 or len(errors) > 0 or len(ignored) > 0:
+                        break
+                    offset = pending.pop(0)
+                try:
+                    if self._get_range(url, fd, offset, min(chunk, size - offset), progress) is False:
+                        with lock:
+                            ignored.append(offset)
+                        break
+                except Exception as e:
+                    self.logging.debug(str(e))
+                    with lock:
+                        errors.append(e)
+                    break
+                with lock:
+                    state['done'].append(offset)
+                    self._resume_save(state_filepath, state)
+            progress.flush()
+
+        fd = os.open(part_filepath, os.O_WRONLY | os.O_CREAT, 0o666)
+        try:
+            os.ftruncate(fd, size)
+            threads = [threading.Thread(target=receiver, daemon=True) for i in range(max(1, min(self.get_streams, len(pending))))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.close(fd)
+        if len(errors) > 0:
+            raise IOError(str(errors[0]))
+        return len(ignored) == 0
+
+#------------------------------------------------------------
+    def _put_chunk(self, filepath, state, offset, progress):
+        """
+        Send one chunk of a file to its offset in the server io job
+        """
+        length = min(state['chunk'], state['size'] - offset)
+        xml_string = self.call("server.io.write", ticket=state['ticket'], offset=offset, post=False).decode()
+# NB: the job's tmp file name is required (otherwise the bytes go into a black hole)
+        reply, crc = self._post_multipart(xml_string, filepath, progress, state['tmpfile'], offset=offset, length=length)
+        tree = ET.fromstring(reply)
+        if tree.find(".//reply/error") is not None:
+            elem = tree.find(".//message")
+            raise Exception(self._xml_succint_error(elem.text if elem is not None else "server.io.write failed"))
+
+#------------------------------------------------------------
+    def _put_resumable(self, namespace, filepath, asset_id=None, cb_progress=None, args={}):
+        """
+        Upload a file in chunks to a server io job, recording each acknowledged chunk locally so an interrupted upload continues from there
+        Up to put_streams chunks are sent at once, each on its own connection
+        Creates the asset (or sets the content of asset_id) from the io job once complete and returns its ID
+        """
+        filename = os.path.basename(filepath)
+        remotepath = posixpath.join(namespace, filename)
+        state_filepath, state = self._resume_job(namespace, filepath, remotepath)
+        ticket = state['ticket']
+        pending = [offset for offset in range(0, state['size'], state['chunk']) if offset not in state['done']]
+# count content already on the server
+        if cb_progress is not None and len(state['done']) > 0:
+            cb_progress(sum([min(state['chunk'], state['size'] - offset) for offset in state['done']]))
+
+        lock = threading.Lock()
+        errors = []
+
+        def sender():
+            progress = mf_progress(cb_progress)
+            while True:
+                with lock:
+                    if len(pending) == 0 or len(errors) > 0:
+                        break
+                    offset = pending.pop(0)
+                try:
+                    self._put_chunk(filepath, state, offset, progress)
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    break
+                with lock:
+                    state['done'].append(offset)
+                    self._resume_save(state_filepath, state)
+            progress.flush()
+
+        threads = [threading.Thread(target=sender, daemon=True) for i in range(max(1, min(self.put_streams, len(pending))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+
+# complete the job and build the asset from it
+        self.call("server.io.write.finish", ticket=ticket)
+        if asset_id is None:
+            xml_string = self.call("asset.create", post=False, **dict(args, namespace={'@create':True, '#text':namespace}, name=filename, store=state['store']))
+        else:
+            xml_string = self.call("asset.set", post=False, **dict(args, id=asset_id))
+        xml_string = xml_string.replace(b'</service></args>', b'</service><input-ticket>%d</input-ticket></args>' % ticket)
+        reply = self._execute(xml_string, "asset.create" if asset_id is None else "asset.set")
+        os.remove(state_filepath)
+        elem = reply.find(".//id")
+        if elem is not None:
+            return int(elem.text)
+        return asset_id
+
+#------------------------------------------------------------
+    def put_pack(self, namespace, items, cb_progress=None, verify=False):
+        """
+        Upload a group of (small) files as a single tar archive, streamed from the files as it is sent (no temporary file), that the server expands into a namespace
+
+        Args:
+            namespace: a STRING giving the remote destination the archive is expanded into
+                items: a LIST of (local filepath, relative remote path) TUPLES
+          cb_progress: a FUNCTION which may be repeatedly called with a single argument for the number of bytes (non-cummulative) successfully sent
+               verify: a BOOLEAN indicating the crc32 of each file sent should be checked against the server's checksum (mismatches are re-sent on their own)
+
+        Returns:
+            0 on success
+
+        Raises:
+            An error message if unsuccessful
+        """
+# tar headers are generated up front, so the exact archive length is known for the Content-Length
+        members = []
+        length = 0
+        for filepath, arcname in items:
+            info = os.stat(filepath)
+            member = tarfile.TarInfo(name=arcname)
+            member.size = info.st_size
+            member.mtime = int(info.st_mtime)
+            member.mode = 0o644
+            header = member.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+            padding = -member.size % tarfile.BLOCKSIZE
+            members.append((header, filepath, member.size, padding))
+            length += len(header) + member.size + padding
+# end of archive marker
+        length += 2 * tarfile.BLOCKSIZE
+
+        crcs = []
+
+        def send(conn):
+            del crcs[:]
+            for header, filepath, size, padding in members:
+                conn.send(header)
+                with open(filepath, 'rb') as infile:
+                    crcs.append(self._send_file(conn, infile, 0, size, progress, checksum=verify))
+                if padding > 0:
+                    conn.send(bytes(padding))
+            conn.send(bytes(2 * tarfile.BLOCKSIZE))
+
+        if self.namespace_exists(namespace) is False:
+            self.call("asset.namespace.create", namespace=namespace, all=True)
+        xml_string = self.call("asset.import", namespace=namespace, archive=True, update=True, post=False).decode()
+        progress = mf_progress(cb_progress)
+        self.logging.debug("Sending pack of %d files (%d bytes) to [%s]" % (len(members), length, namespace))
+        reply = self._post_multipart_stream(xml_string, "pack.tar", length, send, progress, mimetype='application/x-tar', service="upload [pack]")
+        tree = ET.fromstring(reply)
+        if tree.find(".//reply/error") is not None:
+            elem = tree.find(".//message")
+            raise Exception(self._xml_succint_error(elem.text if elem is not None else "asset.import failed"))
+        if verify is True:
+            self._put_pack_verify(namespace, items, crcs)
+        return 0
+
+#------------------------------------------------------------
+    def _put_pack_verify(self, namespace, items, crcs):
+        """
+        Check the crc32 of each file sent in a pack against the server's checksum (one batched request) and re-send any mismatches with put verification
+        """
+        xpath = [{'@ename':'id', '#text':'id'}, {'@ename':'crc32', '#text':'content/csum'}]
+        with self.batch() as batch:
+            for filepath, arcname in items:
+                batch.call("asset.get", id="path=%s" % posixpath.join(namespace, arcname), xpath=xpath)
+        for index, (filepath, arcname) in enumerate(items):
+            remotepath = posixpath.join(namespace, arcname)
+            try:
+                reply = batch.result(index)
+                asset_id = reply.find(".//id").text
+            except Exception as e:
+                self.logging.debug(str(e))
+                reply = ET.fromstring("<result/>")
+                asset_id = None
+            if self._verify_crc(asset_id, crcs[index] & 0xFFFFFFFF, filepath, reply=reply) is False:
+                self._put_content(posixpath.dirname(remotepath), filepath, asset_id=asset_id, verify=True)
 
 #------------------------------------------------------------
     def copy(self, from_fullpath, to_host, to_fullpath, cb_progress=None):
@@ -1565,12 +3143,10 @@ class mf_client():
 # ordinary copy
 #        cmd = 'asset.export :id "path=%s" :include-namespaces False :url -create True %s' % (from_fullpath, to_url)
 # recall first, then copy
-        cmd = 'asset.preparation.request.create :id "path=%s" :migrate online :asset-service -name asset.export < :include-namespaces False :url -create True %s >' % (from_fullpath, to_url)
-
-#        print("CMD: [%s]" % cmd)
+        asset_service = {'@name':'asset.export', 'include-namespaces':False, 'url':{'@create':True, '#text':to_url}}
 
 # main call (async)
-        xml = self.aterm_run(cmd)
+        xml = self.call("asset.preparation.request.create", id="path=%s" % from_fullpath, migrate="online", asset_service=asset_service)
         elem = xml.find(".//id")
         prep_id = int(elem.text)
 
@@ -1578,7 +3154,7 @@ class mf_client():
         self.logging.debug("Polling asset preparation request id=%d" % prep_id)
         try:
             while True:
-                xml = self.aterm_run('asset.preparation.request.describe :id %d' % prep_id)
+                xml = self.call("asset.preparation.request.describe", id=prep_id)
                 time.sleep(5)
         except Exception as e:
 # NB: it's an error (exception) when the task is done, since it no longer exists ... even though it isn't really
@@ -1587,7 +3163,7 @@ class mf_client():
 # update byte progress to indicate we completed the whole thing 
 # FIXME - better way than just telling it the source file size???
         if cb_progress is not None:
-            xml = self.aterm_run('asset.get :id "path=%s" :xpath -ename size content/size' % from_fullpath)
+            xml = self.call("asset.get", id="path=%s" % from_fullpath, xpath={'@ename':'size', '#text':'content/size'})
             elem = xml.find(".//size")
             if elem is not None:
                 size = int(elem.text)
@@ -1604,7 +3180,7 @@ class mf_client():
         """
 
 # MAYBE? run a to_remote.bucket_exists() check -> verify if S3 and bucket exists ...
-        xml = self.aterm_run("s3.client.host.exists :host %s" % to_host)
+        xml = self.call("s3.client.host.exists", host=to_host)
         if self._xml_xpath_boolean(".//exists", xml) is True:
             self.logging.info("s3.client.host [%s] exists" % to_host)
             return
@@ -1643,8 +3219,8 @@ class mf_client():
         yield count
         yield size
         for item in item_list:
-            remote_fullpath = self.copy_fullpath_get(from_pattern, item, to_root)
-            yield item, remote_fullpath
+            remote_fullpath = self.copy_fullpath_get(from_pattern, item.path, to_root)
+            yield item.path, remote_fullpath
 
 #------------------------------------------------------------
     def xml_to_mf(self, xml_root, result=None):
@@ -1665,59 +3241,59 @@ class mf_client():
         return result
 
 #------------------------------------------------------------
-    def import_metadata(self, asset_id, filepath):
+    def metadata_args(self, filepath):
         """
-        populate metadata for an asset using INI style file
-        the section is the xml document namespace and options are flat element node + values
+        Convert an INI style metadata file to asset.create/asset.set arguments (for call)
+        the section is the xml document namespace and options are flat element node + values, an [asset] section supplies direct arguments (eg type)
         """
-
-        self.logging.debug("import_metadata() [asset ID=%s] : [%s]" % (asset_id, filepath))
+        self.logging.debug("metadata_args() : [%s]" % filepath)
         if os.path.isfile(filepath) is False:
             self.logging.warning("Missing metadata file: %s" % filepath)
-            return
+            return {}
 
         try:
             config = configparser.ConfigParser()
             config.read(filepath)
-# section -> xmlns
-            xml_root = ET.Element(None)
+            args = {}
+            meta = {}
             for section in config.sections():
-                xml_child = ET.SubElement(xml_root, section)
+                if section == 'asset':
+                    document = args
+                else:
+                    document = meta.setdefault(section, {})
                 for option in config.options(section):
+# create any/all intermediate nodes in the xpath or merge with existing
+                    item = document
                     elem_list = option.split('/')
-                    xml_item = xml_child
-                    xpath = './'
-# create any/all intermediate XML nodes in the xpath or merge with existing
-                    for elem in elem_list:
-                        xpath += "/%s" % elem
-                        match = xml_root.find(xpath)
-                        if match is not None:
-                            xml_item = match
-                            continue
-                        xml_item = ET.SubElement(xml_item, elem)
+                    for elem in elem_list[:-1]:
+                        child = item.get(elem)
+                        if not isinstance(child, dict):
+                            child = {} if child is None else {'#text': child}
+                            item[elem] = child
+                        item = child
 # terminate at the final element to populate with the current option data
-                    if xml_item is not None:
-                        xml_item.text = config.get(section, option)
-# DEBUG
-#            self.xml_print(xml_root)
-
-# construct the command
-            xml_command = 'asset.set :id %d' % asset_id
-            for xml_child in xml_root:
-                if xml_child.tag == 'asset':
-                    for xml_arg in xml_child:
-                        xml_command += self.xml_to_mf(xml_arg)
-                else:
-                    xml_command += ' :meta <%s >' % self.xml_to_mf(xml_child)
+                    item[elem_list[-1]] = config.get(section, option)
+            if len(meta) > 0:
+                args['meta'] = meta
+        except Exception as e:
+            self.logging.error("Metadata parsing failed: %s" % str(e))
+# flag the upload as failed
+            raise IOError()
+
+        return args
 
-# update the asset metadata
-            self.aterm_run(xml_command)
-# re-analyze the content - stricly only needs to be done if type/ctype/lctype was changed
-# NEW - don't do this by default - it will generate stacktrace in mediaflux for DMF (offline) files
+#------------------------------------------------------------
+    def import_metadata(self, asset_id, filepath):
+        """
+        populate metadata for an asset using INI style file (see metadata_args)
+        """
+        self.logging.debug("import_metadata() [asset ID=%s] : [%s]" % (asset_id, filepath))
+        args = self.metadata_args(filepath)
+        if len(args) == 0:
+            return
+        try:
+            self.call("asset.set", **dict(args, id=asset_id))
         except Exception as e:
             self.logging.error("Metadata population failed: %s" % str(e))
-
-            # NEW - test this ... 
-            # If metadata import fails ... flag the upload as failed
             raise IOError()
 
@@ -7,12 +7,17 @@ import glob
 import math
 import time
 import json
+import functools
+import queue
 import logging
 import posixpath
 import threading
 import concurrent.futures
+import metrics
+import manifest
 import mfclient
 import s3client
+import aiomfclient
 
 #------------------------------------------------------------
 class parser(cmd.Cmd):
@@ -27,6 +32,13 @@ class parser(cmd.Cmd):
     script_output = None
     thread_executor = None
     thread_max = 3
+# maximum scanned files waiting to be submitted (bounds memory for very large trees)
+    put_queue_max = 10000
+# files queued for one folder by a file or pattern put before its existing contents are pre-scanned (rather than checked one by one)
+    put_index_min = 10
+# asyncio client for bulk metadata work (requests in flight are not limited by thread_max)
+    aio_client = None
+    aio_max = 256
 
 # documentation headers
     doc_header = "Standard commands"
@@ -44,6 +56,11 @@ class parser(cmd.Cmd):
 
     logging = logging.getLogger('parser')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+# NB: the progress counters are updated from the scan producer, worker callbacks and the display - all changes must hold this lock
+        self.progress_lock = threading.Lock()
+
 # --- command parsing hooks
     def preloop(self):
 # set the initial prompt
@@ -118,6 +135,37 @@ class parser(cmd.Cmd):
             return self.remotes[self.remotes_current]
         raise Exception("No current active remote")
 
+#------------------------------------------------------------
+    def remote_aio(self):
+        """
+        asyncio client for the active remote (mflux only), for commands that need many requests in flight
+        """
+        remote = self.remote_active()
+        if remote.type != 'mflux':
+            raise Exception("Remote type=%s does not support bulk operations" % remote.type)
+        if self.aio_client is None or self.aio_client.client is not remote:
+            self.aio_client = aiomfclient.aio_mf_client(remote, concurrency=self.aio_max)
+        return self.aio_client
+
+#------------------------------------------------------------
+    def remote_aio_map(self, fn, items):
+        """
+        Bridge for running the coroutine function fn(aio_client, item) over all items, returns a LIST of results (or Exceptions)
+        """
+        aio = self.remote_aio()
+        async def call(item):
+            return await fn(aio, item)
+        return aio.run(aio.map(call, items))
+
+#------------------------------------------------------------
+    @staticmethod
+    def traced(name, method, *args, **kwargs):
+        """
+        Run a (thread pool) task inside a trace span
+        """
+        with metrics.tracer.span(name, "transfer"):
+            return method(*args, **kwargs)
+
 #------------------------------------------------------------
     def remote_complete(self, partial, start, file_search=True, folder_search=True):
         try:
@@ -139,7 +187,7 @@ class parser(cmd.Cmd):
     def remotes_config_save(self):
         endpoints = json.loads(self.config.get(self.config_name, 'endpoints'))
         for mount, endpoint in endpoints.items():
-            client = self.remotes[mount]
+            client = self.remotes.get(mount)
             self.logging.debug("updating mount=[%s] using client=[%r]" % (mount, client))
             if client is not None:
                 endpoints[mount] = client.endpoint()
@@ -201,8 +249,8 @@ class parser(cmd.Cmd):
             self.cwd = home 
             self.config.set(self.config_name, 'remotes_current', name)
             self.config.set(self.config_name, 'remotes_home', home)
-            with open(self.config_filepath, 'w') as f:
-                self.config.write(f)
+# NB: also saves the (possibly refreshed) cached connection status of the remotes
+            self.remotes_config_save()
         except Exception as e:
             self.logging.debug(str(e))
             self.logging.error("No such remote [%s]" % name)
@@ -297,7 +345,7 @@ class parser(cmd.Cmd):
 
 #------------------------------------------------------------
     def requires_auth(self, line):
-        local_commands = ["login", "help", "lls", "lcd", "lpwd", "processes", "remote", "exit", "quit"]
+        local_commands = ["login", "help", "lls", "lcd", "lpwd", "processes", "remote", "stats", "exit", "quit"]
         try:
             primary = line.strip()
             for item in local_commands:
@@ -352,13 +400,15 @@ class parser(cmd.Cmd):
 # thread-safe background task progress helpers for file transfers
     def progress_start(self, total_items, total_bytes=0):
 
-        self.progress_total_items = total_items
-        self.progress_total_bytes = total_bytes
-        self.progress_completed_items = 0
-        self.progress_completed_bytes = 0
-        self.progress_running = 0
-        self.progress_skipped = 0
-        self.progress_errors = 0
+        with self.progress_lock:
+            self.progress_total_items = total_items
+            self.progress_total_bytes = total_bytes
+            self.progress_completed_items = 0
+            self.progress_completed_bytes = 0
+            self.progress_running = 0
+            self.progress_skipped = 0
+            self.progress_errors = 0
+            self.progress_scanning = False
 
 # long tail to cleanup any background task running/completed messages
         self.print_over("Preparing %d files...                          " % total_items)
@@ -366,33 +416,40 @@ class parser(cmd.Cmd):
         self.progress_start_time = time.time()
 
 #---
-    def progress_item_add(self, future):
-        future.add_done_callback(self.progress_item_completed)
-        with threading.Lock():
+    def progress_item_add(self, future, items=1):
+        future.add_done_callback(functools.partial(self.progress_item_completed, items=items))
+        with self.progress_lock:
             self.progress_running += 1
 
 #---
-    def progress_item_completed(self, future):
+# items > 1 for a single task that transfers several files (eg put --pack)
+    def progress_item_completed(self, future, items=1):
         error = 0
         skip = 0
         try:
-            code = int(future.result())
-            if code < 0:
-                skip = 1
+# NB: 0 or a record of the transferred asset (mflux put) on success, -1 if skipped
+            code = future.result()
+            if isinstance(code, int) and code < 0:
+                skip = items
         except Exception as e:
 # NB: can get some really strange stack traces here
             self.logging.debug(str(e))
-            error = 1
+            error = items
 # update
-        with threading.Lock():
-            self.progress_completed_items += 1
+        with self.progress_lock:
+            self.progress_completed_items += items
             self.progress_running -= 1
             self.progress_skipped += skip
             self.progress_errors += error
 
+#---
+# a line for the user that stays above the (overwritten) progress line
+    def progress_message(self, text):
+        self.print_over("%-80s\n" % text)
+
 #---
     def progress_byte_chunk(self, chunk):
-        with threading.Lock():
+        with self.progress_lock:
             self.progress_completed_bytes += int(chunk)
 
 #---
@@ -400,18 +457,17 @@ class parser(cmd.Cmd):
 
         elapsed = time.time() - self.progress_start_time
 
-# avoid naughtiness
+# avoid naughtiness (NB: without writing to the totals, which the scan may still be adding to)
         if elapsed == 0:
             elapsed = 1
-        if self.progress_total_bytes == 0:
-            self.progress_total_bytes = 1
+        total_bytes = max(self.progress_total_bytes, 1)
 
         rate = float(self.progress_completed_bytes) / float(elapsed)
         rate = rate / 1000000.0
-        progress_pc = 100.0 * float(self.progress_completed_bytes) / float(self.progress_total_bytes)
+        progress_pc = 100.0 * float(self.progress_completed_bytes) / float(total_bytes)
 
         msg = "progress=%3.1f%%, " % progress_pc
-        msg+= "%d/%d files, " % (self.progress_completed_items-self.progress_errors, self.progress_total_items)
+        msg+= "%d/%d%s files, " % (self.progress_completed_items-self.progress_errors, self.progress_total_items, "+" if self.progress_scanning else "")
         msg += "errors=%s, " % self.progress_errors
         msg += "skipped=%s, " % self.progress_skipped
         msg += "running=%s, " % self.progress_running
@@ -424,7 +480,8 @@ class parser(cmd.Cmd):
     def progress_throttle(self, size=0, wait=5):
         self.progress_display()
         while self.progress_running > size:
-            time.sleep(wait)
+            with metrics.tracer.span("throttle", "throttle", running=self.progress_running):
+                time.sleep(wait)
             self.progress_display()
 
 #------------------------------------------------------------
@@ -540,6 +597,38 @@ class parser(cmd.Cmd):
     def do_import(self, line):
         self.do_put(line, metadata=True)
 
+#------------------------------------------------------------
+    def help_metadata(self):
+        print("\nApply metadata to files already on the remote server (Mediaflux only)")
+        print("For every <filename.ext.meta> file (INI format, see import) the remote <filename.ext> in the current folder is updated, with many requests in flight at once\n")
+        print("Usage: metadata <file or folder>\n")
+
+# ---
+    def do_metadata(self, line):
+        if len(line) == 0:
+            raise Exception("Nothing specified to apply metadata from")
+        aio = self.remote_aio()
+        items = []
+        for remote_fullpath, local_fullpath, info in self.put_iter(line):
+            if local_fullpath.endswith(".meta"):
+                args = aio.client.metadata_args(local_fullpath)
+                if len(args) > 0:
+                    items.append((posixpath.join(remote_fullpath, os.path.basename(local_fullpath)[:-5]), args))
+
+        async def apply(aio, item):
+            remotepath, args = item
+            await aio.call("asset.set", **dict(args, id="path=%s" % remotepath))
+
+        results = self.remote_aio_map(apply, items)
+        errors = 0
+        for (remotepath, args), result in zip(items, results):
+            if isinstance(result, Exception):
+                self.logging.error("%s: %s" % (remotepath, str(result)))
+                errors += 1
+        print("Updated metadata for %d file(s)" % (len(items) - errors))
+        if errors > 0:
+            raise Exception("metadata: update failed for %d file(s)" % errors)
+
 #------------------------------------------------------------
     def help_get(self):
         print("\nDownload remote files to the current local folder\n")
@@ -555,7 +644,11 @@ class parser(cmd.Cmd):
         abspath = self.abspath(line)
 
         if remote is not None:
-            results = remote.get_iter(abspath)
+# mflux recalls from tape are planned up front, show the plan
+            extra = {}
+            if remote.type == 'mflux':
+                extra['cb_message'] = self.progress_message
+            results = remote.get_iter(abspath, **extra)
             total_count = int(next(results))
             total_bytes = int(next(results))
             self.progress_start(total_count, total_bytes)
@@ -565,11 +658,13 @@ class parser(cmd.Cmd):
                 batch_size = self.thread_max * 2 - 1
 # TODO - redo as a queue instead of iter? 
 # TODO - should allow better progress reporting as we're not stuck in mfclient waiting for a recall
-                for remote_fullpath in results:
+# NB: items are paths or (mflux) asset records, which get() accepts in place of a path
+                for item in results:
+                    remote_fullpath = getattr(item, 'path', item)
 # TODO - this needs a tweak so we don't get the intermediate directories ...
                     remote_relpath = posixpath.relpath(path=remote_fullpath, start=self.cwd)
                     local_filepath = os.path.join(os.getcwd(), remote_relpath)
-                    future = self.thread_executor.submit(remote.get, remote_fullpath, local_filepath, self.progress_byte_chunk)
+                    future = self.thread_executor.submit(self.traced, "get %s" % remote_fullpath, remote.get, item, local_filepath, self.progress_byte_chunk)
                     self.progress_item_add(future)
 # NEW - don't submit any more than the batch size - this allows for faster cleanup of threads
                     self.progress_throttle(batch_size)
@@ -589,87 +684,314 @@ class parser(cmd.Cmd):
 #------------------------------------------------------------
     def help_put(self):
         print("\nUpload local files or folders to the current folder on the remote server\n")
-        print("Usage: put <file or folder>\n")
+        print("Usage: put [--pack] [--verify] <file or folder>\n")
+        print("Options:")
+        print("  --pack: upload small files as streamed tar archives that are expanded on the server (Mediaflux only)")
+        print("          the archive size and small file threshold are the pack_size and pack_threshold remote settings")
+        print("  --verify: check the checksum of each file sent against the server's copy, failures are re-sent verify_retries times (Mediaflux only)\n")
 
 # --
-    def put_iter(self, line, metadata=False, setup=False):
-        count = 0
-        size = 0
+# single pass scan of the local files to upload, yields (remote folder, local filepath, os.stat result)
+    def put_iter(self, line, metadata=False):
         if os.path.isdir(line):
             self.logging.info("Analysing directories...")
             line = os.path.abspath(line)
             parent = os.path.normpath(os.path.join(line, ".."))
-            for root, directory_list, name_list in os.walk(line):
-                local_relpath = os.path.relpath(path=root, start=parent)
-                relpath_list = local_relpath.split(os.sep)
-                remote_relpath = "/".join(relpath_list)
+            folders = [line]
+            while len(folders) > 0:
+                root = folders.pop()
+                remote_relpath = "/".join(os.path.relpath(path=root, start=parent).split(os.sep))
                 remote_fullpath = posixpath.join(self.cwd, remote_relpath)
-                for name in name_list:
-                    ignore = False
-                    if metadata:
-                        if name.endswith(".meta"):
-                            ignore = True
-                    if ignore is False:
-                        fullpath = os.path.normpath(os.path.join(os.getcwd(), root, name))
-                        if setup is False:
-                            yield remote_fullpath, fullpath
-                        else:
-                            count += 1
-                            size += int(os.path.getsize(fullpath))
+                try:
+                    entries = list(os.scandir(root))
+                except OSError as e:
+                    self.logging.warning("Skipping folder: %s" % str(e))
+                    continue
+                for entry in entries:
+# NB: same rules as os.walk() - symlinked folders are not followed (or uploaded)
+                    try:
+                        if entry.is_dir():
+                            if entry.is_symlink() is False:
+                                folders.append(entry.path)
+                            continue
+                        if metadata and entry.name.endswith(".meta"):
+                            continue
+# NB: scandir caches the stat result, so this is the only one for each file
+                        info = entry.stat()
+                    except OSError as e:
+                        self.logging.warning("Skipping file: %s" % str(e))
+                        continue
+                    yield remote_fullpath, os.path.normpath(entry.path), info
         else:
             self.logging.info("Building file list... ")
             for name in glob.glob(line):
+                if metadata and name.endswith(".meta"):
+                    continue
                 local_fullpath = os.path.abspath(name)
-                ignore = False
-                if metadata:
-                    if name.endswith(".meta"):
-                        ignore = True
-                if ignore is False:
-                    if setup is False:
-                        yield self.cwd, local_fullpath
-                    else:
-                        count += 1 
-                        size += int(os.path.getsize(local_fullpath))
+                yield self.cwd, local_fullpath, os.stat(local_fullpath)
 
-        if setup is True:
-            yield count
-            yield size
+# --
+# producer thread - feeds the bounded work queue from the scan and updates the progress totals as it goes
+# NB: stops (rather than blocking forever on a full queue) once the consumer has gone
+    def put_producer(self, line, metadata, work, stop):
+        def put(item):
+            while stop.is_set() is False:
+                try:
+                    work.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for item in self.put_iter(line, metadata=metadata):
+                with self.progress_lock:
+                    self.progress_total_items += 1
+                    self.progress_total_bytes += item[2].st_size
+                if put(item) is False:
+                    return
+        except Exception as e:
+            self.logging.error(str(e))
+        finally:
+            put(None)
+
+# --
+# start the scan and yield its items, uploads can start as soon as the first file is found
+    def put_scan(self, line, metadata=False):
+        self.progress_start(0, 0)
+        with self.progress_lock:
+            self.progress_scanning = True
+        work = queue.Queue(maxsize=self.put_queue_max)
+        stop = threading.Event()
+        threading.Thread(target=self.put_producer, args=(line, metadata, work, stop), name="put scan", daemon=True).start()
+        try:
+            while True:
+                item = work.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+# also reached if the consumer stops early (the generator is closed)
+            stop.set()
+            with self.progress_lock:
+                self.progress_scanning = False
+
+# --
+    def put_pack_submit(self, remote, items, **kwargs):
+        future = self.thread_executor.submit(self.traced, "put pack of %d files" % len(items), remote.put_pack, self.cwd, items, cb_progress=self.progress_byte_chunk, **kwargs)
+        self.progress_item_add(future, items=len(items))
+
+# --
+# index each destination folder once (mflux only), returns the future for the folder's index or None
+    def put_index_submit(self, remote, namespace, indexed):
+        if remote.type != 'mflux':
+            return None
+        future = indexed.get(namespace)
+        if future is None:
+            future = self.thread_executor.submit(remote.put_index, namespace)
+            indexed[namespace] = future
+        return future
+
+# --
+# small files for put --pack, once their folder's index is known (or for every folder if wait is True)
+    def put_pack_ready(self, remote, indexed, waiting, packer, submit, wait=False):
+        for namespace in list(waiting.keys()):
+            index = indexed[namespace]
+            if wait is False and index.done() is False:
+                continue
+            files = waiting.pop(namespace)
+            try:
+                index.result()
+                existing = remote.remote_index.get(namespace)
+            except Exception as e:
+                self.logging.debug("could not index [%s]: %s" % (namespace, str(e)))
+                existing = None
+            for local_fullpath, size in files:
+                name = os.path.basename(local_fullpath)
+# files that already exist on the server (or might, if the folder couldn't be indexed) are left to put() to skip or overwrite
+                if existing is None or name in existing:
+                    submit(namespace, local_fullpath)
+                    continue
+                packer['items'].append((local_fullpath, posixpath.relpath(posixpath.join(namespace, name), self.cwd)))
+                packer['bytes'] += size
+                if packer['bytes'] >= remote.pack_size:
+                    self.put_pack_submit(remote, packer['items'], **packer['extra'])
+                    packer['items'] = []
+                    packer['bytes'] = 0
+                    self.progress_throttle(self.thread_max * 2 - 1)
+
+# --
+# NB: the index task is always queued on the (FIFO) executor before the puts that wait for it
+    def put_indexed(self, index, method, *args, **kwargs):
+        if index is not None:
+            try:
+                index.result()
+            except Exception as e:
+# put() falls back to checking each file
+                self.logging.debug("could not index folder: %s" % str(e))
+        return method(*args, **kwargs)
 
 # --
     def do_put(self, line, metadata=False):
+        options = []
+        while line.startswith("--"):
+            option, _, line = line.partition(" ")
+            options.append(option)
+            line = line.strip()
+        pack = "--pack" in options
+        verify = "--verify" in options
         if len(line) == 0:
             raise Exception("Nothing specified to put")
 
         self.logging.info("[%s]" % line)
         remote = self.remote_active()
+        extra = {}
+        if verify is True:
+            if remote.type != 'mflux':
+                raise Exception("put: --verify is not supported for remote type=%s" % remote.type)
+            extra['verify'] = True
+        scan = self.put_scan(line, metadata=metadata)
         try:
-
-# determine size of upload
             self.print_over("put: analysing...")
-            results = self.put_iter(line, metadata=metadata, setup=True)
-            total_count = next(results)
-            total_bytes = next(results)
-
-# iterate over upload items
-            self.progress_start(total_count, total_bytes)
-            results = self.put_iter(line, metadata=metadata)
             batch_size = self.thread_max * 2 - 1
-            for remote_fullpath, local_fullpath in results:
-                future = self.thread_executor.submit(remote.put, remote_fullpath, local_fullpath, cb_progress=self.progress_byte_chunk, metadata=metadata)
+            pack = pack and remote.type == 'mflux' and metadata is False
+            packer = {'items': [], 'bytes': 0, 'extra': extra}
+# small files wait (per folder) for their folder's index, without holding up the scan
+            waiting = {}
+# one query per destination folder for what already exists, rather than one per file
+            indexed = {}
+            queued = {}
+            directory = os.path.isdir(line)
+
+            def submit(remote_fullpath, local_fullpath):
+                future = self.thread_executor.submit(self.traced, "put %s" % local_fullpath, self.put_indexed, indexed.get(remote_fullpath), remote.put, remote_fullpath, local_fullpath, cb_progress=self.progress_byte_chunk, metadata=metadata, **extra)
                 self.progress_item_add(future)
                 self.progress_throttle(batch_size)
 
+            for remote_fullpath, local_fullpath, info in scan:
+# NB: a folder may hold far more assets than are being sent, so only worth it for directories or several files
+                queued[remote_fullpath] = queued.get(remote_fullpath, 0) + 1
+                if directory is True or queued[remote_fullpath] >= self.put_index_min:
+                    self.put_index_submit(remote, remote_fullpath, indexed)
+# packing needs the folder's index to know which files are new
+                if pack is True and info.st_size < remote.pack_threshold and remote_fullpath in indexed:
+                    waiting.setdefault(remote_fullpath, []).append((local_fullpath, info.st_size))
+                    self.put_pack_ready(remote, indexed, waiting, packer, submit)
+                    continue
+                submit(remote_fullpath, local_fullpath)
+                if pack is True:
+                    self.put_pack_ready(remote, indexed, waiting, packer, submit)
+            if pack is True:
+                self.put_pack_ready(remote, indexed, waiting, packer, submit, wait=True)
+                if len(packer['items']) > 0:
+                    self.put_pack_submit(remote, packer['items'], **extra)
+
         except Exception as e:
             self.logging.error(str(e))
             pass
+        finally:
+# stop the scan if it didn't finish (NB: including KeyboardInterrupt)
+            scan.close()
 
 # wait until completed (cb_put does progress updates)
         self.progress_throttle()
         print("")
+        if remote.type == 'mflux':
+            remote.remote_index.clear()
 
         if self.progress_errors > 0:
             raise Exception("put: upload failed for %d file(s)" % self.progress_errors)
 
+#------------------------------------------------------------
+    def help_sync(self):
+        print("\nUpload new or changed local files to the current remote folder, using a local record of previous transfers\n")
+        print("Usage: sync [--verify] <file or folder>\n")
+        print("Options:")
+        print("  --verify: reconcile the record with the server first, so missing or changed remote files are sent again (Mediaflux only)\n")
+
+# --
+    def sync_put(self, remote, record, remote_fullpath, local_fullpath, size, mtime, **kwargs):
+        result = remote.put(remote_fullpath, local_fullpath, cb_progress=self.progress_byte_chunk, **kwargs)
+# only record real transfers (NB: a skip doesn't mean the remote copy is the same)
+        if isinstance(result, int) and result < 0:
+            return result
+        csum = getattr(result, 'csum', None)
+        record.record(local_fullpath, posixpath.join(remote_fullpath, os.path.basename(local_fullpath)), size, mtime, int(csum, 16) if csum else None, getattr(result, 'id', None))
+        return result
+
+# --
+    def sync_reconcile(self, remote, record, namespace):
+        count = 0
+        remote.put_index(namespace)
+        index = remote.remote_index[namespace]
+        for local, remotepath, size in record.remotes(namespace):
+            existing = index.get(posixpath.basename(remotepath))
+            if existing is None or existing['size'] is None or int(existing['size']) != size:
+                record.forget(local, remotepath)
+                count += 1
+            else:
+                crc32 = int(existing['crc32'], 16) if existing['crc32'] else None
+                record.update(local, remotepath, crc32, existing['id'])
+        return count
+
+# --
+    def do_sync(self, line):
+        options = []
+        while line.startswith("--"):
+            option, _, line = line.partition(" ")
+            options.append(option)
+            line = line.strip()
+        verify = "--verify" in options
+        if len(line) == 0:
+            raise Exception("Nothing specified to sync")
+
+        remote = self.remote_active()
+        extra = {}
+        if verify is True:
+            if remote.type != 'mflux':
+                raise Exception("sync: --verify is not supported for remote type=%s" % remote.type)
+            extra['verify'] = True
+        record = manifest.transfer_manifest.open(remote.endpoint(), self.cwd)
+        scan = self.put_scan(line)
+        try:
+            self.print_over("sync: analysing...")
+            batch_size = self.thread_max * 2 - 1
+            reconciled = set()
+            for remote_fullpath, local_fullpath, info in scan:
+# optional check of the folder's records against the server
+                if verify is True and remote_fullpath not in reconciled:
+                    count = self.sync_reconcile(remote, record, remote_fullpath)
+                    self.logging.info("%d recorded file(s) missing or changed on the server in [%s]" % (count, remote_fullpath))
+                    reconciled.add(remote_fullpath)
+# only new or changed files (NB: no server calls for unchanged files)
+                remote_filepath = posixpath.join(remote_fullpath, os.path.basename(local_fullpath))
+                if record.unchanged(local_fullpath, remote_filepath, info.st_size, info.st_mtime):
+                    with self.progress_lock:
+                        self.progress_completed_items += 1
+                        self.progress_completed_bytes += info.st_size
+                        self.progress_skipped += 1
+                    continue
+# a recorded file that has changed is sent even if the remote copy is the same size
+                compare = record.lookup(local_fullpath, remote_filepath) is None
+                future = self.thread_executor.submit(self.traced, "sync %s" % local_fullpath, self.sync_put, remote, record, remote_fullpath, local_fullpath, info.st_size, info.st_mtime, compare=compare, **extra)
+                self.progress_item_add(future)
+                self.progress_throttle(batch_size)
+
+        except Exception as e:
+            self.logging.error(str(e))
+        finally:
+            scan.close()
+
+# wait until completed
+        self.progress_throttle()
+        print("")
+        if remote.type == 'mflux':
+            remote.remote_index.clear()
+        record.close()
+
+        if self.progress_errors > 0:
+            raise Exception("sync: upload failed for %d file(s)" % self.progress_errors)
+
 #------------------------------------------------------------
 #    def help_cp(self):
 #        print("\nCopy folders/files from the current remote to a folder in a different remote.")
@@ -737,7 +1059,7 @@ class parser(cmd.Cmd):
 
 
 # submit and throttle against the batch_size - allows for faster cleanup of threads (if cancelled)
-                future = self.thread_executor.submit(remote.copy, src, to[0], dest, cb_progress=self.progress_byte_chunk)
+                future = self.thread_executor.submit(self.traced, "copy %s" % src, remote.copy, src, to[0], dest, cb_progress=self.progress_byte_chunk)
                 self.progress_item_add(future)
                 self.progress_throttle(size=batch_size)
 
@@ -927,6 +1249,33 @@ class parser(cmd.Cmd):
         count = remote.unpublish(fullpath)
         print("Unpublished %d item(s)" % count)
 
+#------------------------------------------------------------
+    def help_stats(self):
+        print("\nDisplay call counts, latency, bytes transferred, retries and errors for each remote operation in this session\n")
+        print("Usage: stats <--reset><--json <file>>\n")
+        print("Examples:")
+        print("    stats")
+        print("    stats --json stats.json")
+        print("    stats --reset\n")
+
+# --
+    def do_stats(self, line):
+        args = line.split()
+        if "--json" in args:
+            index = args.index("--json")
+            text = json.dumps(metrics.registry.snapshot(), indent=2)
+# optional filename - for batch jobs
+            if index + 1 < len(args) and args[index + 1].startswith("--") is False:
+                with open(args[index + 1], 'w') as f:
+                    f.write(text)
+            else:
+                print(text)
+        elif "--reset" not in args:
+            for item in metrics.registry.report():
+                print(item)
+        if "--reset" in args:
+            metrics.registry.reset()
+
 #------------------------------------------------------------
     def help_whoami(self):
         print("\nReport the current authenticated user or delegate and associated roles\n")
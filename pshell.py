@@ -11,12 +11,14 @@ if sys.version_info < VERSION_MIN:
     sys.exit("ERROR: Python >= %d.%d is required, your version = %d.%d\n" % (VERSION_MIN[0], VERSION_MIN[1], sys.version_info[0], sys.version_info[1]))
 import os
 import json
+import atexit
 import logging
 import argparse
 import platform
 import itertools
 import configparser
 import concurrent.futures
+import metrics
 import parser
 # no readline on windows
 try:
@@ -39,6 +41,7 @@ def main():
     p.add_argument("-v", dest='verbose', default=None, help="set verbosity level (0,1,2)")
     p.add_argument("-u", dest='url', default=None, help="Remote endpoint URL")
     p.add_argument("-t", dest='type', default=None, help="Remote endpoint type (eg mflux, s3)")
+    p.add_argument("-T", dest='trace', default=None, help="record a timeline of the session to a Chrome trace (JSON) file")
     p.add_argument("command", nargs="?", default="", help="a single command to execute")
     args = p.parse_args()
 
@@ -52,6 +55,11 @@ def main():
 #    print("log level = %d" % logging_level)
     logging.basicConfig(format='%(levelname)9s %(asctime)-15s >>> %(module)s.%(funcName)s(): %(message)s', level=logging_level)
 
+# session timeline - saved however we exit
+    if args.trace is not None:
+        metrics.tracer.start()
+        atexit.register(metrics.tracer.save, args.trace)
+
 # basic info
     logging.info("PSHELL=%s" % build)
     logging.info("PLATFORM=%s" % platform.system())
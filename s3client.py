@@ -12,15 +12,18 @@ import math
 import string
 import fnmatch
 import getpass
+import time
 import logging
 import pathlib
 import datetime
+import metrics
 # deprec in favour of pathlib?
 import posixpath
 
 try:
     import boto3
     import botocore
+    from boto3.s3.transfer import TransferConfig
     logging.getLogger('boto3').setLevel(logging.WARNING)
     logging.getLogger('botocore').setLevel(logging.WARNING)
     ok=True
@@ -117,6 +120,8 @@ class s3_client():
         self.status = "not connected"
         self.enable_polling = True
         self.logging = logging.getLogger('s3client')
+# self tuning transfer manager read/write size (boto3 default is 256KB)
+        self.tuner = metrics.transfer_tuner("s3 io_chunksize", size=262144)
 # test invoke - standalone
         if log_level is not None:
             logging.basicConfig(format='%(levelname)9s %(asctime)-15s >>> %(module)s.%(funcName)s(): %(message)s', level=log_level)
@@ -138,6 +143,8 @@ class s3_client():
             client.access = endpoint['access']
         if 'secret' in endpoint:
             client.secret = endpoint['secret']
+        if 'io_chunksize' in endpoint:
+            client.tuner.pin(endpoint['io_chunksize'])
 
         return client
 
@@ -156,6 +163,10 @@ class s3_client():
             else:
                 self.logging.debug("Assuming url is region")
                 self.s3 = boto3.client('s3', region_name=self.url, aws_access_key_id=self.access, aws_secret_access_key=self.secret, config=s3config)
+# per operation metrics (covers the transfer manager's part requests too)
+            self.s3.meta.events.register('before-call.s3', self._metrics_before)
+            self.s3.meta.events.register('after-call.s3', self._metrics_after)
+            self.s3.meta.events.register('after-call-error.s3', self._metrics_error)
 # authenticated user check - test the client
             self.s3.list_buckets()
             self.status = "authenticated"
@@ -171,6 +182,45 @@ class s3_client():
                 self.status = "login required" 
         return False
 
+#------------------------------------------------------------
+    @staticmethod
+    def _metrics_before(model, params, context, **kwargs):
+        """
+        boto3 event hook - note the start time and request size of an API call
+        """
+        context['metrics_name'] = model.name
+        context['metrics_start'] = time.perf_counter()
+        body = params.get('body')
+        size = 0
+        try:
+# eg bytes or the transfer manager's file chunk readers
+            if body is not None:
+                size = len(body)
+        except Exception:
+            pass
+        context['metrics_out'] = size
+
+#------------------------------------------------------------
+    @staticmethod
+    def _metrics_after(http_response, parsed, model, context, **kwargs):
+        """
+        boto3 event hook - record a completed API call
+        """
+        elapsed = time.perf_counter() - context.get('metrics_start', time.perf_counter())
+        bytes_in = int(http_response.headers.get('content-length', 0))
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        error = 'Error' in parsed or http_response.status_code >= 300
+        metrics.registry.record(model.name, elapsed, bytes_in=bytes_in, bytes_out=context.get('metrics_out', 0), error=error, retries=retries, category="s3")
+
+#------------------------------------------------------------
+    @staticmethod
+    def _metrics_error(context, **kwargs):
+        """
+        boto3 event hook - record an API call that failed without a response (eg network error)
+        """
+        elapsed = time.perf_counter() - context.get('metrics_start', time.perf_counter())
+        metrics.registry.record(context.get('metrics_name', 'unknown'), elapsed, bytes_out=context.get('metrics_out', 0), error=True, category="s3")
+
 #------------------------------------------------------------
     def login(self, access=None, secret=None):
         if access is None:
@@ -180,7 +230,10 @@ class s3_client():
 
 #------------------------------------------------------------
     def endpoint(self):
-        return { 'type':self.type, 'url':self.url, 'access':self.access, 'secret':self.secret }
+        endpoint = { 'type':self.type, 'url':self.url, 'access':self.access, 'secret':self.secret }
+        if self.tuner.pinned is True:
+            endpoint['io_chunksize'] = self.tuner.size
+        return endpoint
 
 #------------------------------------------------------------
     def polling(self, polling_state=True):
@@ -471,6 +524,24 @@ class s3_client():
                 if fnmatch.fnmatch(item['Key'], key_pattern):
                     yield "/%s/%s" % (bucket, item['Key'])
 
+#------------------------------------------------------------
+    def _transfer(self, method, *args, cb_progress=None):
+        """
+        Run a transfer manager upload/download with the tuned read/write size and report its throughput to the tuner
+        NB: boto3 fixes the size for the whole transfer, so measurements are per transfer rather than within it
+        """
+        size = self.tuner.size
+        moved = [0]
+
+        def callback(nbytes):
+            moved[0] += nbytes
+            if cb_progress is not None:
+                cb_progress(nbytes)
+
+        start = time.monotonic()
+        method(*args, Callback=callback, Config=TransferConfig(io_chunksize=size))
+        self.tuner.observe(size, moved[0], time.monotonic() - start)
+
 # === WORKING EXAMPLE
     def smart_open_get(self, remote_filepath, local_filepath=None, cb_progress=None):
         import smart_open
@@ -500,34 +571,30 @@ class s3_client():
             self.logging.info("Creating required local folder(s): [%s]" % local_parent)
             os.makedirs(local_parent)
 
-# can tweak this, default concurrency is 10
-#        from boto3.s3.transfer import TransferConfig
-#        config = TransferConfig(max_concurrency=5)
-#        self.s3.download_file(str(bucket), str(fullkey), local_filepath, Config=config)
-
-        self.s3.download_file(str(bucket), str(fullkey), local_filepath, Callback=cb_progress)
+        self._transfer(self.s3.download_file, str(bucket), str(fullkey), local_filepath, cb_progress=cb_progress)
 
         return(0)
 
 #------------------------------------------------------------
-    def put(self, remote_path, local_filepath, cb_progress=None, metadata=False):
+    def put(self, remote_path, local_filepath, cb_progress=None, metadata=False, compare=True):
         bucket,prefix,key = self.path_convert(remote_path+'/')
         filename = os.path.basename(local_filepath)
         fullkey = posixpath.join(prefix, filename)
 
 # attempt to get remote size (if exists) and then local size for comparison
-        try:
-            response = self.s3.head_object(Bucket=bucket, Key=fullkey)
-            rsize = int(response['ResponseMetadata']['HTTPHeaders']['content-length'])
-            lsize = os.path.getsize(local_filepath)
-            if lsize == rsize:
-                self.logging.info("File of same size already exists, skipping [%s]" % local_filepath)
-                return(-1)
-        except Exception as e:
-            # file doesn't exist (or couldn't get size)
-            self.logging.debug(str(e))
+        if compare is True:
+            try:
+                response = self.s3.head_object(Bucket=bucket, Key=fullkey)
+                rsize = int(response['ResponseMetadata']['HTTPHeaders']['content-length'])
+                lsize = os.path.getsize(local_filepath)
+                if lsize == rsize:
+                    self.logging.info("File of same size already exists, skipping [%s]" % local_filepath)
+                    return(-1)
+            except Exception as e:
+                # file doesn't exist (or couldn't get size)
+                self.logging.debug(str(e))
 
-        self.s3.upload_file(local_filepath, bucket, fullkey, Callback=cb_progress)
+        self._transfer(self.s3.upload_file, local_filepath, bucket, fullkey, cb_progress=cb_progress)
         return(0)
 
 #------------------------------------------------------------
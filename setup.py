@@ -6,5 +6,5 @@ setup(name='pshell',
       author_email='sean.fleming@pawsey.org.au',
       url='https://bitbucket.org/datapawsey/mfclient',
       packages=['data'],
-      py_modules=['pshell','parser', 'mfclient', 's3client'],
+      py_modules=['pshell','parser', 'mfclient', 's3client', 'aiomfclient', 'metrics', 'manifest'],
       )
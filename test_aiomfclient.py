@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import os
+import asyncio
+import tempfile
+import unittest
+import mfclient
+import aiomfclient
+
+# global to avoid setup for every test class
+aio_client = None
+
+#------------------------------------------------------------
+class aiomfclient_main(unittest.TestCase):
+
+    def setUp(self):
+        global aio_client
+        self.aio_client = aio_client
+
+# --- helper: feed canned bytes through a stream reader
+    def _reader(self, data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return reader
+
+    def _body(self, data, headers):
+        async def main():
+            reader = self._reader(data)
+            return b''.join([chunk async for chunk in self.aio_client._response_body(reader, headers)])
+        return self.aio_client.run(main())
+
+    def test_response_headers(self):
+        async def main():
+            reader = self._reader(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello')
+            return await self.aio_client._response_headers(reader)
+        status, headers = self.aio_client.run(main())
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-length'], "5")
+        self.assertEqual(headers['connection'], "close")
+
+    def test_body_sized(self):
+        self.assertEqual(self._body(b'hello world', {'content-length': '5'}), b'hello')
+
+    def test_body_chunked(self):
+        self.assertEqual(self._body(b'5\r\nhello\r\n6;x=y\r\n world\r\n0\r\n\r\n', {'transfer-encoding': 'chunked'}), b'hello world')
+
+    def test_body_until_close(self):
+        self.assertEqual(self._body(b'hello world', {}), b'hello world')
+
+    def test_map_order(self):
+        async def slow(item):
+            await asyncio.sleep(0.001 * (10 - item))
+            if item == 3:
+                raise Exception("failed")
+            return item * 2
+        results = self.aio_client.run(self.aio_client.map(slow, range(10)))
+        self.assertEqual(results[:3], [0, 2, 4])
+        self.assertIsInstance(results[3], Exception)
+        self.assertEqual(results[9], 18)
+
+#------------------------------------------------------------
+class aiomfclient_stubbed(unittest.TestCase):
+    """
+    Client operations against a stubbed HTTP transport (canned replies, no server)
+    """
+    def setUp(self):
+        self.client = mfclient.mf_client("http", "80", "localhost.invalid")
+        self.client.session = "abc"
+        self.aio_client = aiomfclient.aio_mf_client(self.client, concurrency=4)
+        self.requests = []
+        self.replies = []
+
+# --- helper: the next canned reply for every request, the (consumed) body is recorded
+        async def request(url, method, path, headers, body=None, sink=None):
+            if body is not None and not isinstance(body, bytes):
+                body = b''.join([chunk async for chunk in body])
+            self.requests.append((method, path, body))
+            status, data = self.replies.pop(0)
+            if sink is not None:
+                await sink(data)
+                data = b''
+            return status, data
+        self.aio_client._request = request
+
+    def _result(self, xml):
+        return (200, ('<response><reply type="result"><result>%s</result></reply></response>' % xml).encode())
+
+    def _error(self, message):
+        return (200, ('<response><reply type="error"><error>x</error><message>%s</message></reply></response>' % message).encode())
+
+    def test_call(self):
+        self.replies = [self._result('<asset id="5"><name>a</name></asset>')]
+        reply = self.aio_client.run(self.aio_client.call("asset.get", id=5))
+        self.assertEqual(reply.find(".//asset").attrib['id'], "5")
+        self.assertIn(b'asset.get', self.requests[0][2])
+
+    def test_call_error(self):
+        self.replies = [self._error("no such asset")]
+        with self.assertRaises(Exception):
+            self.aio_client.run(self.aio_client.call("asset.get", id=5))
+
+    def test_call_session_restore(self):
+        self.client.token = "secret"
+        self.replies = [self._error("session is not valid"), self._result('<session>def</session>'), self._result('<id>5</id>')]
+        reply = self.aio_client.run(self.aio_client.call("asset.get", id=5))
+        self.assertEqual(reply.find(".//id").text, "5")
+        self.assertEqual(self.client.session, "def")
+        self.assertIn(b'session="def"', self.requests[2][2])
+
+    def test_login(self):
+        self.replies = [self._result('<session>xyz</session>')]
+        self.aio_client.run(self.aio_client.login(user="user", password="pass", domain="ivec"))
+        self.assertEqual(self.client.session, "xyz")
+        self.assertEqual(self.client.status, "authenticated")
+
+    def test_query_iter(self):
+        self.replies = [self._result('<iterator>7</iterator>'), self._result('<path id="1">/a</path><path id="2">/b</path><iterated complete="false">2</iterated>'), self._result('<path id="3">/c</path><iterated complete="true">1</iterated>')]
+        async def main():
+            return [elem.text async for elem in self.aio_client.query_iter(size=2, namespace="/projects", action="get-path")]
+        self.assertEqual(self.aio_client.run(main()), ["/a", "/b", "/c"])
+
+    def test_get(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "sub", "file.dat")
+        self.replies = [self._result('<asset id="9"><state>online</state></asset>'), (200, b'content')]
+        size = self.aio_client.run(self.aio_client.get("/projects/file.dat", filepath))
+        self.assertEqual(size, 7)
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'content')
+        self.assertIn("id=9", self.requests[1][1])
+
+    def test_put(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "file.dat")
+        with open(filepath, 'wb') as f:
+            f.write(b'0123456789' * 1000)
+        self.client.put_buffer = 4096
+        self.replies = [self._result(''), (200, b'<response><reply><result><id>12</id></result></reply></response>')]
+        asset_id = self.aio_client.run(self.aio_client.put("/projects", filepath))
+        self.assertEqual(asset_id, 12)
+        self.assertIn(b'0123456789' * 1000, self.requests[1][2])
+        self.assertIn(b'asset.create', self.requests[1][2])
+
+    def test_put_skip(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "file.dat")
+        with open(filepath, 'wb') as f:
+            f.write(b'abc')
+        self.replies = [self._result('<id>12</id><size>3</size>')]
+        self.assertEqual(self.aio_client.run(self.aio_client.put("/projects", filepath)), -1)
+
+######
+# main
+######
+if __name__ == '__main__':
+
+# acquire a dummy client instance
+    try:
+        aio_client = aiomfclient.aio_mf_client(mfclient.mf_client("http", "80", None), concurrency=4)
+
+        print("\n----------------------------------------------------------------------")
+        print("Running offline tests for: aiomfclient module")
+        print("----------------------------------------------------------------------\n")
+    except Exception as e:
+        print(str(e))
+        exit(-1)
+
+# classes to test
+    test_class_list = [aiomfclient_main, aiomfclient_stubbed]
+
+# build suite
+    suite_list = []
+    for test_class in test_class_list:
+        suite_list.append(unittest.TestLoader().loadTestsFromTestCase(test_class))
+    suite = unittest.TestSuite(suite_list)
+
+# run suite
+    unittest.TextTestRunner(verbosity=2).run(suite)
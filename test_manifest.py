@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import tempfile
+import unittest
+import manifest
+
+#------------------------------------------------------------
+class manifest_main(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.manifest = manifest.transfer_manifest(os.path.join(self.folder.name, "sync.db"))
+
+    def tearDown(self):
+        self.manifest.close()
+
+    def test_unchanged(self):
+        self.manifest.record("/data/a.dat", "/projects/a.dat", 100, 1000.5)
+        self.assertTrue(self.manifest.unchanged("/data/a.dat", "/projects/a.dat", 100, 1000.5))
+        self.assertFalse(self.manifest.unchanged("/data/a.dat", "/projects/a.dat", 100, 2000.0))
+        self.assertFalse(self.manifest.unchanged("/data/b.dat", "/projects/b.dat", 100, 1000.5))
+
+    def test_persist(self):
+        self.manifest.record("/data/a.dat", "/projects/a.dat", 100, 1000.5)
+        self.manifest.close()
+        self.manifest = manifest.transfer_manifest(os.path.join(self.folder.name, "sync.db"))
+        self.assertEqual(self.manifest.count(), 1)
+
+    def test_lookup_pending(self):
+        self.manifest.record("/data/a.dat", "/projects/a.dat", 100, 1000.5)
+        self.assertTrue(self.manifest.unchanged("/data/a.dat", "/projects/a.dat", 100, 1000.5))
+# lookups don't commit the batch
+        other = sqlite3.connect(os.path.join(self.folder.name, "sync.db"))
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM transfers").fetchone()[0], 0)
+        other.close()
+
+    def test_remotes_indexed(self):
+        plan = self.manifest.db.execute("EXPLAIN QUERY PLAN SELECT local, remote, size FROM transfers WHERE folder=?", ("/projects",)).fetchall()
+        self.assertIn("transfers_folder", str(plan))
+
+    def test_remotes_folder(self):
+        self.manifest.record("/data/a.dat", "/projects/a.dat", 1, 0)
+        self.manifest.record("/data/sub/b.dat", "/projects/sub/b.dat", 2, 0)
+        self.manifest.record("/data/c.dat", "/projects_other/c.dat", 3, 0)
+        self.assertEqual(self.manifest.remotes("/projects"), [("/data/a.dat", "/projects/a.dat", 1)])
+        self.assertEqual(self.manifest.remotes("/"), [])
+
+    def test_update_forget(self):
+        self.manifest.record("/data/a.dat", "/projects/a.dat", 100, 1000.5)
+        self.manifest.update("/data/a.dat", "/projects/a.dat", 0x1234ABCD, "42")
+        self.assertEqual(self.manifest.lookup("/data/a.dat", "/projects/a.dat"), (100, 1000.5, 0x1234ABCD, "42"))
+        self.manifest.forget("/data/a.dat", "/projects/a.dat")
+        self.assertIsNone(self.manifest.lookup("/data/a.dat", "/projects/a.dat"))
+
+######
+# main
+######
+if __name__ == '__main__':
+
+    print("\n----------------------------------------------------------------------")
+    print("Running tests for: manifest module")
+    print("----------------------------------------------------------------------\n")
+
+# classes to test
+    test_class_list = [manifest_main]
+
+# build suite
+    suite_list = []
+    for test_class in test_class_list:
+        suite_list.append(unittest.TestLoader().loadTestsFromTestCase(test_class))
+    suite = unittest.TestSuite(suite_list)
+
+# run suite
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import tempfile
+import unittest
+import metrics
+
+#------------------------------------------------------------
+class metrics_main(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.metrics_registry()
+
+    def test_record(self):
+        self.registry.record("asset.get", 0.003, bytes_in=100, bytes_out=50)
+        self.registry.record("asset.get", 0.2, error=True, retries=1)
+        entry = self.registry.snapshot()['operations']['asset.get']
+        self.assertEqual(entry['count'], 2)
+        self.assertEqual(entry['errors'], 1)
+        self.assertEqual(entry['retries'], 1)
+        self.assertEqual(entry['bytes_in'], 100)
+        self.assertEqual(entry['bytes_out'], 50)
+        self.assertEqual(sum(entry['histogram']), 2)
+
+    def test_quantiles(self):
+        for i in range(95):
+            self.registry.record("asset.query", 0.004)
+        for i in range(5):
+            self.registry.record("asset.query", 7.0)
+        entry = self.registry.snapshot()['operations']['asset.query']
+        self.assertEqual(entry['p50'], 0.005)
+        self.assertEqual(entry['p95'], 0.005)
+        self.assertAlmostEqual(entry['max'], 7.0)
+
+    def test_add_reset(self):
+        self.registry.add("upload", retries=2)
+        self.assertEqual(self.registry.snapshot()['operations']['upload']['retries'], 2)
+        self.registry.reset()
+        self.assertEqual(self.registry.snapshot()['operations'], {})
+
+    def test_json_report(self):
+        self.registry.record("GetObject", 0.05, bytes_in=2000000)
+        text = json.dumps(self.registry.snapshot())
+        self.assertIn("GetObject", text)
+        lines = self.registry.report()
+        self.assertTrue(lines[1].startswith("GetObject"))
+        self.assertIn("2MB", lines[1])
+
+    def test_trace(self):
+        tracer = metrics.trace_recorder()
+        with tracer.span("throttle", "throttle"):
+            pass
+        self.assertEqual(len(tracer.events), 0)
+        tracer.start()
+        with tracer.span("throttle", "throttle", running=3):
+            pass
+        self.assertEqual(tracer.events[0]['ph'], "X")
+        self.assertEqual(tracer.events[0]['args']['running'], 3)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "trace.json")
+        tracer.save(filepath)
+        with open(filepath) as f:
+            trace = json.load(f)
+        names = [event['name'] for event in trace['traceEvents']]
+        self.assertIn("thread_name", names)
+        self.assertIn("throttle", names)
+
+    def test_tuner(self):
+        tuner = metrics.transfer_tuner("test get_buffer", size=262144)
+# simulated link that is fastest with a 1MB buffer
+        rate = {65536: 10, 131072: 20, 262144: 50, 524288: 80, 1048576: 100, 2097152: 90, 4194304: 60, 8388608: 40}
+        size = tuner.size
+        for i in range(20):
+            size = tuner.observe(size, rate[size], 1.0)
+        self.assertEqual(size, 1048576)
+        self.assertEqual(metrics.registry.snapshot()['settings']['test get_buffer'], 1048576)
+
+    def test_tuner_pinned(self):
+        tuner = metrics.transfer_tuner("test put_buffer", size=262144)
+        tuner.pin(65536)
+        self.assertEqual(tuner.observe(65536, 100, 1.0), 65536)
+        stream = tuner.stream()
+        stream.update(100)
+        self.assertEqual(stream.size, 65536)
+        self.assertIn("test put_buffer: 65536 (pinned)", metrics.registry.report())
+
+######
+# main
+######
+if __name__ == '__main__':
+
+    print("\n----------------------------------------------------------------------")
+    print("Running tests for: metrics module")
+    print("----------------------------------------------------------------------\n")
+
+# classes to test
+    test_class_list = [metrics_main]
+
+# build suite
+    suite_list = []
+    for test_class in test_class_list:
+        suite_list.append(unittest.TestLoader().loadTestsFromTestCase(test_class))
+    suite = unittest.TestSuite(suite_list)
+
+# run suite
+    unittest.TextTestRunner(verbosity=2).run(suite)
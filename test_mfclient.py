@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
+import io
+import json
 import os
 import sys
 import time
+import zlib
 import shutil
+import tempfile
 import getpass
 import logging
 import urllib.request, urllib.error, urllib.parse
@@ -164,6 +168,432 @@ class mfclient_main(unittest.TestCase):
         reply = self.mf_client.copy_fullpath_get('/folder/parent/child', '/folder/parent/child/file', '/remote')
         self.assertEqual(reply, '/remote/child')
 
+# connection pool (NB: connections are not opened until a request is sent)
+    def test_pool_reuse(self):
+        pool = mfclient.mf_connection_pool("localhost:80", encrypted=False)
+        conn, reused = pool.acquire()
+        self.assertFalse(reused)
+        pool.release(conn)
+        conn2, reused = pool.acquire()
+        self.assertTrue(reused)
+        self.assertIs(conn, conn2)
+
+    def test_pool_idle_timeout(self):
+        pool = mfclient.mf_connection_pool("localhost:80", encrypted=False, idle_timeout=0)
+        conn, reused = pool.acquire()
+        pool.release(conn)
+        conn2, reused = pool.acquire()
+        self.assertFalse(reused)
+
+    def test_pool_size(self):
+        pool = mfclient.mf_connection_pool("localhost:80", encrypted=False, size=1)
+        conn1, reused = pool.acquire()
+        conn2, reused = pool.acquire()
+        pool.release(conn1)
+        pool.release(conn2)
+        self.assertEqual(len(pool.idle), 1)
+
+    def test_pool_shared(self):
+        pool1 = mfclient.mf_connection_pool.shared("localhost:80", False)
+        pool2 = mfclient.mf_connection_pool.shared("localhost:80", False)
+        pool3 = mfclient.mf_connection_pool.shared("localhost:80", True)
+        self.assertIs(pool1, pool2)
+        self.assertIsNot(pool1, pool3)
+
+# structured service calls
+    def test_call_asset_get(self):
+        reply = self.mf_client.call("asset.get", id=123, format="extended", post=False)
+        self.assertEqual(reply, self.mf_client.aterm_run('asset.get :id 123 :format extended', post=False))
+
+    def test_call_attributes(self):
+        xpath = [{'@ename':'id', '#text':'id'}, {'@ename':'size', '#text':'content/size'}]
+        reply = self.mf_client.call("asset.get", id={'@only-if-exists':True, '#text':'path=/a&b/c'}, xpath=xpath, post=False)
+        self.assertEqual(self._peel(reply), '<service name="asset.get"><id only-if-exists="true">path=/a&amp;b/c</id><xpath ename="id">id</xpath><xpath ename="size">content/size</xpath></service>')
+
+    def test_call_nested_keywords(self):
+        reply = self.mf_client.call("asset.query", where="namespace>=/www", as_="iterator", action="pipe", service={'@name':'asset.label.add', 'label':'PUBLISHED'}, post=False)
+        self.assertEqual(self._peel(reply), '<service name="asset.query"><where>namespace&gt;=/www</where><as>iterator</as><action>pipe</action><service name="asset.label.add"><label>PUBLISHED</label></service></service>')
+
+    def test_call_xmlns(self):
+        reply = self.mf_client.call("asset.set", id=123, meta={'pawsey:custom':{'pawsey-key':'pawsey value'}}, post=False)
+        self.assertEqual(self._peel(reply), '<service name="asset.set"><id>123</id><meta><pawsey:custom xmlns:pawsey="pawsey"><pawsey-key>pawsey value</pawsey-key></pawsey:custom></meta></service>')
+
+    def test_call_background(self):
+        reply = self.mf_client.call("asset.namespace.destroy", namespace="/projects/x", background=True, post=False)
+        self.assertEqual(self._peel(reply), '<background>True</background><service name="asset.namespace.destroy"><namespace>/projects/x</namespace></service>')
+
+    def test_call_logon(self):
+        password = '<>"\'1:a[3]b(2)c{4}d*5&A'
+        reply = self.mf_client.call("system.logon", domain="system", user="test", password=password, post=False)
+        elem = mfclient.ET.fromstring(reply).find(".//password")
+        self.assertEqual(elem.text, password)
+        self.assertTrue(reply.startswith(b'<request><service name="system.logon"><args>'))
+
+# batched service calls
+    def test_batch_add(self):
+        batch = self.mf_client.batch()
+        batch.add('asset.get :id 123')
+        batch.add('asset.content.status :id 123')
+        self.assertEqual(len(batch.services), 2)
+        self.assertEqual(batch.services[1].find("args/service").get("name"), "asset.content.status")
+
+    def test_batch_replies(self):
+        xml = '<response><reply type="result"><result><id>1</id></result></reply><reply type="error"><error>x</error><message>call failed: no such asset</message></reply></response>'
+        results = self.mf_client._batch_replies(mfclient.ET.fromstring(xml), 2)
+        self.assertEqual(results[0].find(".//id").text, "1")
+        self.assertIsInstance(results[1], Exception)
+        self.assertIn("no such asset", str(results[1]))
+
+# streamed replies - canned response on an idle pooled connection
+    def _stream(self, xml, tags, parent=None):
+        class response():
+            status = 200
+            will_close = False
+            def __init__(self, data):
+                self.data = data
+            def read(self, size):
+                chunk, self.data = self.data[:7], self.data[7:]
+                return chunk
+        class connection():
+            sock = None
+            def request(self, *args, **kwargs):
+                pass
+            def getresponse(self):
+                return response(xml.encode())
+            def close(self):
+                pass
+        client = mfclient.mf_client("http", "80", None)
+        client.post_pool.idle.append((connection(), time.time()))
+        return list(client._post_iter(b'<request/>', tags, parent=parent))
+
+    def test_stream_reply(self):
+        xml = '<response><reply type="result"><result><namespace path="/a"><namespace>b</namespace><namespace>c</namespace></namespace></result></reply></response>'
+        items = self._stream(xml, ("namespace",), parent="namespace")
+        self.assertEqual([index for index, elem in items], [0, 0])
+        self.assertEqual(len(items[0][1]), 0)
+
+    def test_stream_batch_error(self):
+        xml = '<response><reply type="result"><result><exists>true</exists></result></reply><reply type="error"><error>x</error><message>call failed: no such asset</message></reply></response>'
+        items = self._stream(xml, ("exists",))
+        self.assertEqual(items[0][0], 0)
+        self.assertEqual(items[1][0], 1)
+        self.assertIsInstance(items[1][1], Exception)
+
+# background job handles
+    def test_job_result(self):
+        job = mfclient.mf_job(self.mf_client, "1", "asset.query")
+        self.assertFalse(job.done())
+        job._finish(reply="<result/>")
+        self.assertEqual(self.mf_client.wait([job]), ["<result/>"])
+
+    def test_job_error(self):
+        job = mfclient.mf_job(self.mf_client, "1", "asset.query")
+        with self.assertRaises(Exception):
+            job.result(timeout=0.01)
+        job._finish(error=Exception("task id=1 failed"))
+        with self.assertRaises(Exception):
+            job.result()
+
+# cached connection probes
+    def test_connect_cached(self):
+        client = mfclient.mf_client("https", "443", "localhost.invalid")
+        client.session = "abc"
+        client.probe = {'time': time.time(), 'session': "abc", 'status': "authenticated", 'data_http': True}
+        self.assertTrue(client.connect())
+        self.assertEqual(client.data_put, "localhost.invalid:80")
+        self.assertFalse(client.encrypted_data)
+
+    def test_connect_not_cached(self):
+        client = mfclient.mf_client("http", "80", "localhost.invalid")
+        client._probe_reachable = lambda: True
+        client._probe_session = lambda: "login required"
+        self.assertFalse(client.connect())
+        self.assertEqual(client.probe, {})
+# a later good result is probed again (not the cached failure), and is then cached
+        client._probe_session = lambda: "authenticated"
+        self.assertTrue(client.connect())
+        self.assertEqual(client.probe['status'], "authenticated")
+
+    def test_probe_invalidate(self):
+        client = mfclient.mf_client("http", "80", "localhost.invalid")
+        client.probe = {'time': time.time(), 'session': "", 'status': "authenticated"}
+        client._probe_invalidate("call to service 'asset.get' failed: session is not valid")
+        self.assertEqual(client.probe, {})
+
+    def test_connect_cache_expired(self):
+        client = mfclient.mf_client.from_endpoint({'protocol':'http', 'server':'localhost.invalid', 'port':80, 'probe_ttl':60, 'probe':{'time': time.time() - 120, 'session': "", 'status': "authenticated"}})
+        self.assertFalse(client.connect())
+        self.assertEqual(client.status, "not connected")
+
+# upload send paths
+    def test_progress_rate(self):
+        calls = []
+        progress = mfclient.mf_progress(calls.append, interval=3600)
+        for i in range(100):
+            progress.update(10)
+        progress.flush()
+        self.assertEqual(calls, [1000])
+
+    def test_send_buffered(self):
+        class sock():
+            data = b''
+            def sendall(self, chunk):
+                sock.data += bytes(chunk)
+        class connection():
+            pass
+        conn = connection()
+        conn.sock = sock()
+        client = mfclient.mf_client("http", "80", None)
+        client.put_buffer = 7
+        calls = []
+        client._send_buffered(conn, io.BytesIO(b'0123456789' * 5), mfclient.mf_progress(calls.append, interval=0))
+        self.assertEqual(sock.data, b'0123456789' * 5)
+        self.assertEqual(sum(calls), 50)
+
+    def test_send_buffered_range(self):
+        class sock():
+            data = b''
+            def sendall(self, chunk):
+                sock.data += bytes(chunk)
+        class connection():
+            pass
+        conn = connection()
+        conn.sock = sock()
+        client = mfclient.mf_client("http", "80", None)
+        client.put_buffer = 4
+        infile = io.BytesIO(b'0123456789' * 5)
+        infile.seek(12)
+        crc = client._send_buffered(conn, infile, mfclient.mf_progress(None), length=10, checksum=True)
+        self.assertEqual(sock.data, b'2345678901')
+        self.assertEqual(crc, zlib.crc32(b'2345678901'))
+        with self.assertRaises(Exception):
+            client._send_buffered(conn, infile, mfclient.mf_progress(None), length=100)
+
+    def test_write_range(self):
+        client = mfclient.mf_client("http", "80", None)
+        client.get_buffer = 4
+        fd, filepath = tempfile.mkstemp()
+        try:
+            os.ftruncate(fd, 20)
+            received = client._write_range(io.BytesIO(b'0123456789'), fd, 5, 10, mfclient.mf_progress(None))
+            self.assertEqual(received, 10)
+            with self.assertRaises(IOError):
+                client._write_range(io.BytesIO(b'0123'), fd, 0, 5, mfclient.mf_progress(None))
+        finally:
+            os.close(fd)
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'0123\x00' + b'0123456789' + b'\x00' * 5)
+        os.remove(filepath)
+
+    def test_asset_record(self):
+        asset = mfclient.mf_asset("12", "/projects/data/file.dat", "1024", "a1b2c3d4")
+        self.assertEqual(asset.size, 1024)
+        self.assertEqual(str(asset), "/projects/data/file.dat")
+        self.assertEqual(mfclient.mf_asset("13", "/projects/empty").size, 0)
+
+    def test_recall_poll(self):
+        client = mfclient.mf_client("http", "80", None)
+        def call(service_call, **args):
+            return mfclient.ET.fromstring('<response><asset id="1"><state>online+offline</state></asset><asset id="2"><state>offline</state></asset><asset id="3"><state>unreachable</state></asset></response>')
+        client.call = call
+        assets = {key: mfclient.mf_asset(key, "/projects/%s" % key) for key in ["1", "2", "3"]}
+        ready = client._recall_poll(assets)
+        self.assertEqual([asset.id for asset in ready], ["1"])
+        self.assertEqual(ready[0].state, "online+offline")
+        self.assertEqual(list(assets.keys()), ["2"])
+
+    def test_recall_schedule(self):
+        client = mfclient.mf_client("http", "80", None)
+        def call(service_call, **args):
+            return mfclient.ET.fromstring('<response>%s</response>' % "".join(['<asset id="%s"><state>%s</state></asset>' % (key, "online" if key == "4" else "offline") for key in args['id']]))
+        client.call = call
+        assets = [mfclient.mf_asset("3", "/p/c", store="tape2", url="file:/s/1/3"), mfclient.mf_asset("9", "/p/d", store="tape1", url="file:/s/2/9"),
+                  mfclient.mf_asset("4", "/p/e", store="tape1", url="file:/s/2/4"), mfclient.mf_asset("5", "/p/f", store="tape1", url="file:/s/1/5")]
+# online first, then offline grouped by store and location
+        plan = []
+        result = [asset.id for asset in client._recall_schedule(iter(assets), cb_message=plan.append)]
+        self.assertEqual(result, ["4", "5", "9", "3"])
+# the plan is shown to the user, not just logged
+        self.assertEqual(plan[0], "Recall plan: 3 offline files in 1 batches of up to 100")
+        self.assertEqual(len(plan), 3)
+# pages are scheduled as they arrive, without reading every match first
+        consumed = []
+        def source():
+            for asset in assets:
+                consumed.append(asset.id)
+                yield asset
+        schedule = client._recall_schedule(source(), page_size=2)
+        self.assertEqual([next(schedule).id, next(schedule).id], ["9", "3"])
+        self.assertEqual(consumed, ["3", "9"])
+
+    def test_get_partial(self):
+        client = mfclient.mf_client("http", "80", None)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        client.get_resume_dir = os.path.join(folder.name, "state")
+        part_filepath = os.path.join(folder.name, "big.dat.part")
+        state_filepath, state = client._get_partial(part_filepath, "12", 1000, "abcd", 100)
+        self.assertEqual(state['done'], [])
+# nothing but the download itself in the destination
+        self.assertEqual(os.path.dirname(state_filepath), client.get_resume_dir)
+        with open(part_filepath, 'wb') as f:
+            f.write(b'x' * 1000)
+        state['done'].append(0)
+        client._resume_save(state_filepath, state)
+# same content continues, changed content starts again
+        state_filepath, state = client._get_partial(part_filepath, "12", 1000, "abcd", 100)
+        self.assertEqual(state['done'], [0])
+        state_filepath, state = client._get_partial(part_filepath, "12", 1000, "ef01", 100)
+        self.assertEqual(state['done'], [])
+        self.assertFalse(os.path.exists(part_filepath))
+
+    def test_get_small_interrupted(self):
+        client = mfclient.mf_client("http", "80", None)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        client.get_resume_dir = os.path.join(folder.name, "state")
+        def stream(url, part_filepath, size, cb_progress=None):
+            with open(part_filepath, 'wb') as f:
+                f.write(b'x' * 10)
+            raise Exception("connection reset")
+        client._get_stream = stream
+        filepath = os.path.join(folder.name, "small.dat")
+# a small download starts again next time, so it leaves nothing behind
+        with self.assertRaises(IOError):
+            client.get(mfclient.mf_asset("12", "/projects/small.dat", 100, state="online"), filepath)
+        self.assertEqual(os.listdir(folder.name), [])
+
+    def test_multipart_stale_retry(self):
+        class response():
+            will_close = True
+            def read(self):
+                return b'<response/>'
+        class connection():
+            sock = None
+            def __init__(self, stale):
+                self.stale = stale
+                self.sent = []
+                self.closed = False
+            def putrequest(self, method, url):
+                pass
+            def putheader(self, key, value):
+                pass
+            def endheaders(self):
+                if self.stale is True:
+                    raise BrokenPipeError("stale")
+            def send(self, data):
+                self.sent.append(data)
+            def getresponse(self):
+                return response()
+            def close(self):
+                self.closed = True
+        client = mfclient.mf_client("http", "80", "localhost.invalid")
+        client.data_put = "stale.invalid:80"
+        pool = mfclient.mf_connection_pool.shared(client.data_put, client.encrypted_data)
+        stale = connection(True)
+        new = connection(False)
+        pool.idle = [(stale, time.time())]
+        pool._connection_new = lambda: new
+# the stale connection fails on the headers, before any of the body, and the upload goes on a new one
+        reply = client._post_multipart_stream("<request/>", "file.dat", 3, lambda conn: conn.send(b'abc'), mfclient.mf_progress(None))
+        self.assertEqual(reply, b'<response/>')
+        self.assertTrue(stale.closed)
+        self.assertEqual(stale.sent, [])
+        self.assertIn(b'abc', new.sent)
+
+    def test_resume_state(self):
+        client = mfclient.mf_client("http", "80", None)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        client.resume_dir = folder.name
+        state_filepath = client._resume_filepath("/data/big.dat", "/projects/big.dat")
+        self.assertNotEqual(state_filepath, client._resume_filepath("/data/big.dat", "/projects/other/big.dat"))
+        client._resume_save(state_filepath, {'ticket': 3, 'done': [0, 1024]})
+        with open(state_filepath) as f:
+            self.assertEqual(json.load(f)['done'], [0, 1024])
+
+    def test_put_index_skip(self):
+        client = mfclient.mf_client("http", "80", "localhost.invalid")
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "a.txt")
+        with open(filepath, 'w') as f:
+            f.write("abc")
+# no server calls needed when the destination folder has been indexed
+        client.remote_index['/projects'] = {'a.txt': {'id': '11', 'size': '3', 'crc32': None}}
+        self.assertEqual(client.put("/projects", filepath), -1)
+        client.remote_index['/projects']['a.txt']['size'] = '4'
+        self.assertEqual(client.put("/projects", filepath, overwrite=False), -1)
+
+    def test_put_no_compare(self):
+        client = mfclient.mf_client("http", "80", "localhost.invalid")
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "a.txt")
+        with open(filepath, 'w') as f:
+            f.write("abc")
+        client.remote_index['/projects'] = {'a.txt': {'id': '11', 'size': '3', 'crc32': None}}
+        client._put_content = lambda namespace, filepath, asset_id=None, **kwargs: (asset_id, None)
+# content known to have changed is sent even though the size matches
+        self.assertEqual(client.put("/projects", filepath, compare=False).id, "11")
+
+    def test_put_large_verify(self):
+        client = mfclient.mf_client("http", "80", None)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "big.dat")
+        with open(filepath, 'wb') as f:
+            f.write(b'x' * 100)
+        crc = zlib.crc32(b'x' * 100)
+        sent = []
+        client._put_resumable = lambda namespace, filepath, asset_id=None, **kwargs: sent.append(asset_id) or 12
+        replies = ["00000000", "%08X" % crc]
+        client.call = lambda service, **args: mfclient.ET.fromstring('<result><crc32>%s</crc32></result>' % replies.pop(0))
+# a mismatch is sent again, then checked against the crc32 of the local file
+        self.assertEqual(client._put_large("/projects", filepath, verify=True), (12, crc))
+        self.assertEqual(sent, [None, 12])
+        client.verify_retries = 0
+        replies = ["00000000"]
+        with self.assertRaises(Exception):
+            client._put_large("/projects", filepath, verify=True)
+
+    def test_put_pack_verify(self):
+        client = mfclient.mf_client("http", "80", None)
+        client._post_batch = lambda services: [mfclient.ET.fromstring('<result><id>1</id><crc32>0000000A</crc32></result>'), mfclient.ET.fromstring('<result><id>2</id><crc32>0000000F</crc32></result>')]
+        resent = []
+        client._put_content = lambda namespace, filepath, asset_id=None, **kwargs: resent.append((namespace, filepath, asset_id, kwargs))
+# only the member that doesn't match is sent again (verified)
+        client._put_pack_verify("/projects", [("/data/a.dat", "a.dat"), ("/data/sub/b.dat", "sub/b.dat")], [0xA, 0xB])
+        self.assertEqual(resent, [("/projects/sub", "/data/sub/b.dat", "2", {'verify': True})])
+
+    def test_metadata_args(self):
+        client = mfclient.mf_client("http", "80", None)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "file.dat.meta")
+        with open(filepath, 'w') as f:
+            f.write("[asset]\ntype = text/plain\n[pawsey:custom]\npawsey-key = pawsey value\ngroup/item = 1\n")
+        args = client.metadata_args(filepath)
+        reply = client.call("asset.create", post=False, **dict(args, namespace="/projects", name="file.dat")).decode()
+        self.assertIn('<type>text/plain</type>', reply)
+        self.assertIn('<meta><pawsey:custom xmlns:pawsey="pawsey"><pawsey-key>pawsey value</pawsey-key><group><item>1</item></group></pawsey:custom></meta>', reply)
+        self.assertEqual(client.metadata_args(filepath + ".missing"), {})
+
+    def test_buffer_pinned(self):
+        client = mfclient.mf_client.from_endpoint({'protocol':'http', 'server':'localhost.invalid', 'port':80, 'put_buffer':4194304})
+        self.assertEqual(client.put_buffer, 4194304)
+        endpoint = client.endpoint()
+        self.assertEqual(endpoint['put_buffer'], 4194304)
+        self.assertNotIn('get_buffer', endpoint)
+
+    def test_pool_counters(self):
+        pool = mfclient.mf_connection_pool("localhost:80", encrypted=False)
+        conn, reused = pool.acquire()
+        pool.release(conn)
+        conn, reused = pool.acquire()
+        self.assertEqual(pool.opened, 1)
+        self.assertEqual(pool.reused, 1)
+
 
 
 ########################################
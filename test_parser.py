@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
 
+import io
+import os
 import parser
+import posixpath
+import manifest
+import time
+import tempfile
+import threading
 import unittest
+import contextlib
+import concurrent.futures
 
 # global to avoid setup for every test class
 myparser = None
@@ -14,6 +23,10 @@ class parser_standard(unittest.TestCase):
         self.parser.cwd = "/root"
         self.parser.remotes = {}
         self.parser.remotes['remote'] = "dummy"
+# don't wait the full throttle interval for transfers to complete
+        sleep = parser.time.sleep
+        self.addCleanup(setattr, parser.time, 'sleep', sleep)
+        parser.time.sleep = lambda wait: sleep(0.01)
 
 # --- abspath
     def test_abspath_empty(self):
@@ -36,6 +49,102 @@ class parser_standard(unittest.TestCase):
         result = self.parser.abspath("folder/child1/../child2/")
         self.assertEqual(result, '/root/folder/child2/')
 
+# --- put scan
+    def test_put_iter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "data", "sub"))
+            for name, text in [("data/a", "1"), ("data/sub/b", "22"), ("data/sub/b.meta", "")]:
+                with open(os.path.join(tmp, name), 'w') as f:
+                    f.write(text)
+            os.symlink(os.path.join(tmp, "data", "sub"), os.path.join(tmp, "data", "link"))
+            result = sorted((remote, os.path.relpath(local, tmp), info.st_size) for remote, local, info in self.parser.put_iter(os.path.join(tmp, "data"), metadata=True))
+        self.assertEqual(result, [('/root/data', 'data/a', 1), ('/root/data/sub', 'data/sub/b', 2)])
+
+    def test_put_scan_stopped(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        for i in range(5):
+            with open(os.path.join(folder.name, "%d.dat" % i), 'w') as f:
+                f.write("abc")
+        self.addCleanup(setattr, self.parser, 'put_queue_max', self.parser.put_queue_max)
+        self.parser.put_queue_max = 1
+        scan = self.parser.put_scan(folder.name)
+        next(scan)
+# the consumer gives up early, the producer must not stay blocked on the full queue
+        scan.close()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and any(thread.name == "put scan" for thread in threading.enumerate()):
+            time.sleep(0.1)
+        self.assertFalse(any(thread.name == "put scan" for thread in threading.enumerate()))
+
+# --- put index
+    def test_put_index_only_when_worthwhile(self):
+        class remote():
+            type = 'mflux'
+            def __init__(self):
+                self.remote_index = {}
+                self.indexed = []
+            def put_index(self, namespace):
+                self.indexed.append(namespace)
+                return 0
+            def put(self, namespace, filepath, cb_progress=None, metadata=False):
+                return -1
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        for i in range(self.parser.put_index_min):
+            with open(os.path.join(folder.name, "%d.dat" % i), 'w') as f:
+                f.write("abc")
+        fake = remote()
+        self.parser.remotes['fake'] = fake
+        self.parser.remotes_current = 'fake'
+        if self.parser.thread_executor is None:
+            self.parser.thread_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        with contextlib.redirect_stdout(io.StringIO()):
+# a single file is checked on its own, without pre-scanning what is already in the folder
+            self.parser.do_put(os.path.join(folder.name, "0.dat"))
+            self.assertEqual(fake.indexed, [])
+            self.parser.do_put(os.path.join(folder.name, "*.dat"))
+            self.assertEqual(fake.indexed, ["/root"])
+            self.parser.do_put(folder.name)
+        self.assertEqual(fake.indexed, ["/root", posixpath.join("/root", os.path.basename(folder.name))])
+
+# --- sync
+    def test_sync_changed_same_size(self):
+        class remote():
+            type = 'fake'
+            def __init__(self):
+                self.sent = []
+            def endpoint(self):
+                return {}
+            def put(self, namespace, filepath, cb_progress=None, compare=True):
+# the remote copy has the same size as the edited file
+                if compare is True:
+                    return -1
+                self.sent.append(filepath)
+                return 0
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        filepath = os.path.join(folder.name, "a.dat")
+        with open(filepath, 'w') as f:
+            f.write("abc")
+        filepath_db = os.path.join(folder.name, "sync.db")
+        record = manifest.transfer_manifest(filepath_db)
+        record.record(filepath, "/root/a.dat", 3, os.stat(filepath).st_mtime - 10)
+        open_original = manifest.transfer_manifest.open
+        manifest.transfer_manifest.open = classmethod(lambda cls, remote, destination: record)
+        self.addCleanup(setattr, manifest.transfer_manifest, 'open', open_original)
+        fake = remote()
+        self.parser.remotes['fake'] = fake
+        self.parser.remotes_current = 'fake'
+        if self.parser.thread_executor is None:
+            self.parser.thread_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.parser.do_sync(filepath)
+        self.assertEqual(fake.sent, [filepath])
+        record = manifest.transfer_manifest(filepath_db)
+        self.assertTrue(record.unchanged(filepath, "/root/a.dat", 3, os.stat(filepath).st_mtime))
+        record.close()
+
 # --- remote
 #    def test_remote_complete(self):
 #        self.parser.remote_add('mfclient', {'type':'mflux', 'protocol':'http', 'server':'localhost', 'port':80})